@@ -1,91 +1,292 @@
 # app/api/server.py
-from fastapi import FastAPI, Query
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 
+import asyncio
+import json
+from itertools import chain
 import sys
 import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Project root, so `cd app && uvicorn api.server:app` loads the same app.* modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from ingestion.drive_ingestor import process_drive_pdfs
-from indexing.elasticsearch_indexer import index_documents
-from retrieval.search import hybrid_search, elser_search
+from app.ingestion.drive_ingestor import iter_drive_documents, sync_drive_pdfs, save_manifest, requeue_files
+from app.ingestion.pipeline import CountingIterator, prefetch
+from app.ingestion.dedup import open_dedup
+from app.indexing.elasticsearch_indexer import (index_documents, embedding_cache_stats, reset_embedding_cache_stats,
+                                                delete_chunks, delete_file_chunks, delete_stale_chunks, doc_id)
+from app.retrieval.search import ahybrid_search, aelser_search, embed_query, query_embeddings
+from app.retrieval.result_cache import ResultCache
+from app.retrieval.rerank import RERANK_POOL, arerank, pair_scores
+from app.llm.generate import (SYSTEM, OLLAMA_MODEL, build_user_prompt, ollama_agenerate, ollama_agenerate_stream,
+                              ollama_awarmup, aclose_async_client)
+from app.core.registry import get_async_es, aclose_async_es, get_reranker
+from app.core.metrics import render as render_metrics, span, trace
 
-from llm.generate import build_prompt, ollama_generate
+WARMUP_RETRY_SECONDS = 2.0
+PROFILE_SLOW_MS = float(os.getenv("RAG_PROFILE_SLOW_MS", "0"))  # log the span profile of slower /query calls; 0 = off
 
-app = FastAPI()
+# ---------- Readiness ----------
+readiness = {"embedder": False, "elasticsearch": False, "ollama": False}
+# Warmed too, but not required: rerank() falls back to retrieval order without its model
+optional_readiness = {"reranker": False}
+warmup_errors: dict = {}
+
+def _warm_reranker():
+    # One scored pair, so the first mode="rerank" query does not pay for model setup
+    get_reranker().predict([("warm up", "warm up")])
+
+async def warm_up_reranker():
+    """Load the rerank model once in the background; a failure is only reported."""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _warm_reranker)
+        optional_readiness["reranker"] = True
+    except Exception as e:
+        warmup_errors["reranker"] = str(e)
+
+async def warm_up():
+    """Load the embedding model and touch ES and Ollama until each one answers."""
+    loop = asyncio.get_running_loop()
+    checks = {
+        "embedder": lambda: loop.run_in_executor(None, embed_query, "warm up"),
+        "elasticsearch": lambda: get_async_es().info(),
+        "ollama": lambda: ollama_awarmup(OLLAMA_MODEL),
+    }
+    while not all(readiness.values()):
+        for name, check in checks.items():
+            if readiness[name]:
+                continue
+            try:
+                await check()
+                readiness[name] = True
+                warmup_errors.pop(name, None)
+            except Exception as e:
+                warmup_errors[name] = str(e)
+        if not all(readiness.values()):
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmups = [asyncio.create_task(warm_up()), asyncio.create_task(warm_up_reranker())]
+    yield
+    for task in warmups:
+        task.cancel()
+    # Release pooled connections to Elasticsearch and Ollama
+    await aclose_async_es()
+    await aclose_async_client()
+
+app = FastAPI(lifespan=lifespan)
+result_cache = ResultCache()
 
 # ---------- Models ----------
 class QueryIn(BaseModel):
     question: str
     top_k: int = 5
-    mode: str = "hybrid"  # "hybrid" | "elser"
+    mode: str = "hybrid"  # "hybrid" | "elser" | "rerank"
     min_score: float = 0.0  # grounding threshold (0-1 if you normalize)
+    timings: bool = False  # add per-stage milliseconds to the response
+    profile: bool = False  # add every timed span (start, duration, thread) to the response
 
 class IngestOut(BaseModel):
     downloaded_docs: int
     indexed_docs: int
+    embedding_cache_hits: int = 0
+    embedding_cache_misses: int = 0
+    deleted_chunks: int = 0
+    suppressed_duplicates: int = 0
+    failed_files: int = 0  # files with chunks that could not be indexed; incremental syncs retry them
 
 @app.get("/")
 def root():
-    return {"message": "RAG System API", "docs": "/docs", "health": "/healthz"}
+    return {"message": "RAG System API", "docs": "/docs", "health": "/healthz", "ready": "/readyz"}
 
 # ---------- Health ----------
 @app.get("/healthz")
 def healthz():
     return {"ok": True}
 
+@app.get("/readyz")
+def readyz():
+    """
+    200 once the embedding model, Elasticsearch and Ollama have all been warmed up,
+    503 before. The reranker is listed under optional and does not gate readiness.
+    """
+    ready = all(readiness.values())
+    body = {"ready": ready, "components": readiness, "optional": optional_readiness, "errors": warmup_errors}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+def metrics():
+    """Stage latency histograms and item counters in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/stats")
+def stats():
+    return {
+        "query_embedding_cache": query_embeddings.stats(),
+        "result_cache": result_cache.stats(),
+        "rerank_cache": pair_scores.stats(),
+    }
+
 # ---------- Ingestion ----------
 @app.post("/ingest", response_model=IngestOut)
 def ingest_from_drive(
     folder_id: str = Query(..., description="Drive folder ID"),
-    drive_id: Optional[str] = Query(None, description="Shared Drive ID if applicable")
+    drive_id: Optional[str] = Query(None, description="Shared Drive ID if applicable"),
+    incremental: bool = Query(False, description="Only process files changed since the last sync")
 ):
-    docs = process_drive_pdfs(folder_id=folder_id, drive_id=drive_id)
-    if not docs:
-        return {"downloaded_docs": 0, "indexed_docs": 0}
-    n = index_documents(docs)  # implement inside elasticsearch_indexer.py
-    return {"downloaded_docs": len(docs), "indexed_docs": n}
+    deleted = 0
+    dedup = open_dedup()
+    restored = []
+    if incremental:
+        sync = sync_drive_pdfs(folder_id=folder_id, drive_id=drive_id)
+        deleted = delete_file_chunks(sync["stale_file_paths"])
+        if dedup is not None:
+            restored = dedup.forget_files(sync["stale_file_paths"])
+        docs = CountingIterator(sync["documents"])
+    else:
+        docs = CountingIterator(iter_drive_documents(folder_id=folder_id, drive_id=drive_id))
+
+    stream = chain(restored, docs)
+    if dedup is not None:
+        stream = dedup.filter(stream)
+
+    reset_embedding_cache_stats()
+    failed_files: List[str] = []
+    # Extraction streams into the indexer through a bounded queue
+    n = index_documents(prefetch(stream), failed_files=failed_files)
+    deleted += delete_stale_chunks(docs.chunks_per_file)
+    if dedup is not None:
+        # Chunks kept on an earlier run that are duplicates now
+        deleted += delete_chunks([doc_id(d) for d in dedup.superseded])
+        dedup.commit()
+        # Duplicates of the stale chunks deleted above need indexing themselves
+        tail_restored = dedup.forget_stale(docs.chunks_per_file)
+        if tail_restored:
+            n += index_documents(dedup.filter(tail_restored), failed_files=failed_files)
+            dedup.commit()
+    if incremental:
+        requeue_files(sync, failed_files)
+        save_manifest(sync["manifest_path"], sync["manifest"])
+    cache = embedding_cache_stats()
+    return {
+        "downloaded_docs": docs.count,
+        "indexed_docs": n,
+        "embedding_cache_hits": cache["hits"],
+        "embedding_cache_misses": cache["misses"],
+        "deleted_chunks": deleted,
+        "suppressed_duplicates": dedup.suppressed if dedup is not None else 0,
+        "failed_files": len(failed_files),
+    }
 
 # ---------- Query / RAG ----------
+async def _retrieve(q: str, body: QueryIn) -> List[dict]:
+    """Run retrieval for body.mode and apply the min_score grounding filter."""
+    with span("query.retrieve"):
+        hits = await _search(q, body)
+
+    # Optional grounding filter (keep only sufficiently relevant chunks)
+    return [h for h in hits if h.get("score", 1.0) >= body.min_score]
+
+async def _search(q: str, body: QueryIn) -> List[dict]:
+    if body.mode == "elser":
+        hits = await result_cache.aget_or_compute("elser", q, body.top_k, lambda: aelser_search(q, k=body.top_k))
+    elif body.mode == "rerank":
+        # Wider hybrid pool, then a cross-encoder picks the best top_k of it
+        pool = max(RERANK_POOL, body.top_k)
+        hits = await result_cache.aget_or_compute("hybrid", q, pool, lambda: ahybrid_search(q, k=pool))
+        with span("search.rerank"):
+            hits = await arerank(q, hits, k=body.top_k)
+    else:
+        hits = await result_cache.aget_or_compute("hybrid", q, body.top_k, lambda: ahybrid_search(q, k=body.top_k))
+    return hits
+
+def _citations(scored: List[dict]) -> List[dict]:
+    # Citations with link + file + chunk id
+    return [{
+        "idx": i + 1,
+        "source_file": h.get("source_file"),
+        "chunk_id": h.get("chunk_id"),
+        "link": h.get("drive_url"),
+        "snippet": (h.get("text") or "")[:300]
+    } for i, h in enumerate(scored)]
+
 @app.post("/query")
-def query(body: QueryIn):
+async def query(body: QueryIn):
+    with trace() as t:
+        with span("query.total"):
+            result = await _answer(body)
+    if body.timings:
+        result["timings"] = t.timings()
+    if body.profile:
+        result["profile"] = t.profile()
+    if PROFILE_SLOW_MS and t.elapsed_ms() > PROFILE_SLOW_MS:
+        print(f"[Slow query] {t.elapsed_ms():.0f} ms {body.mode!r} {body.question[:80]!r}: {json.dumps(t.profile())}")
+    return result
+
+async def _answer(body: QueryIn) -> dict:
     # Guardrails: reject empty/off-topic quickly
     q = (body.question or "").strip()
     if not q:
         return {"answer": "I don't know.", "citations": []}
 
     # Retrieval
-    if body.mode == "elser":
-        hits = elser_search(q, k=body.top_k)
-    else:
-        hits = hybrid_search(q, k=body.top_k)
-
-    if not hits:
-        return {"answer": "I don't know.", "citations": []}
-
-    # Optional grounding filter (keep only sufficiently relevant chunks)
-    scored = [h for h in hits if h.get("score", 1.0) >= body.min_score]
+    scored = await _retrieve(q, body)
     if not scored:
         return {"answer": "I don't know.", "citations": []}
 
-    contexts = [h["text"] for h in scored]
-    prompt = build_prompt(q, contexts)
+    # Hits are packed into passages labelled with their citation numbers;
+    # SYSTEM goes separately so Ollama can reuse its cached prefix
+    prompt = build_user_prompt(q, scored)
 
     # LLM generation with safety fallback
     try:
-        answer = ollama_generate("llama3", prompt)
+        answer = await ollama_agenerate(OLLAMA_MODEL, prompt, system=SYSTEM)
     except Exception as e:
         answer = f"Retrieved context, but LLM failed: {e}"
 
-    # Citations with link + file + chunk id
-    citations = [{
-        "idx": i + 1,
-        "source_file": h.get("source_file"),
-        "chunk_id": h.get("chunk_id"),
-        "link": h.get("drive_url"),
-        "snippet": (h.get("text") or "")[:300]
-    } for i, h in enumerate(scored)]
+    return {"answer": answer, "citations": _citations(scored), "used_mode": body.mode}
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query/stream")
+async def query_stream(body: QueryIn, request: Request):
+    """
+    Server-Sent Events version of /query: one `citations` event, then `token`
+    events as the LLM produces them, then `done`. Generation is cancelled as
+    soon as the client disconnects.
+    """
+    q = (body.question or "").strip()
+    scored = await _retrieve(q, body) if q else []
+
+    async def events():
+        yield _sse("citations", {"citations": _citations(scored), "used_mode": body.mode})
+        if not scored:
+            yield _sse("token", {"text": "I don't know."})
+            yield _sse("done", {})
+            return
 
-    return {"answer": answer, "citations": citations, "used_mode": body.mode}
+        prompt = build_user_prompt(q, scored)
+        tokens = ollama_agenerate_stream(OLLAMA_MODEL, prompt, system=SYSTEM)
+        try:
+            async for token in tokens:
+                if await request.is_disconnected():
+                    break
+                yield _sse("token", {"text": token})
+            else:
+                yield _sse("done", {})
+        except Exception as e:
+            yield _sse("error", {"message": f"Retrieved context, but LLM failed: {e}"})
+        finally:
+            # Closing the stream drops the Ollama connection, which cancels generation
+            await tokens.aclose()
 
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
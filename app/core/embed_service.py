@@ -0,0 +1,289 @@
+# app/core/embed_service.py
+"""
+Local embedding service: one process holds the embedding model and encodes for
+every uvicorn worker and the indexer, over a TCP or Unix socket.
+
+    RAG_EMBED_SERVICE=127.0.0.1:8765 python -m app.core.embed_service
+    RAG_EMBED_SERVICE=unix:/tmp/rag-embed.sock python -m app.core.embed_service
+
+Processes started with the same RAG_EMBED_SERVICE get an EmbedClient from
+registry.get_embedder() instead of loading their own SentenceTransformer.
+Concurrent requests are merged into micro-batches. The batcher takes the oldest
+waiting request, keeps collecting for up to RAG_EMBED_MAX_WAIT_MS or until
+RAG_EMBED_MAX_BATCH texts, then encodes them all in one model call.
+"""
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .registry import EMBED_SERVICE, MODEL_NAME
+
+MAX_BATCH = int(os.getenv("RAG_EMBED_MAX_BATCH", "64"))         # texts per model call
+MAX_WAIT_MS = float(os.getenv("RAG_EMBED_MAX_WAIT_MS", "5"))     # how long a batch waits for company
+CONNECT_TIMEOUT = 5.0
+
+# Wire format, both directions: 4-byte big-endian length, a JSON header, then
+# header["bytes"] bytes of payload (float32 vectors in replies, empty in requests).
+_LENGTH = struct.Struct(">I")
+
+
+def _address(spec: str) -> Tuple[int, Union[str, Tuple[str, int]]]:
+    """'unix:/path.sock' or 'host:port' -> (socket family, address)."""
+    if spec.startswith("unix:"):
+        return socket.AF_UNIX, spec[len("unix:"):]
+    host, _, port = spec.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _send(sock: socket.socket, header: Dict, payload: bytes = b"") -> None:
+    data = json.dumps(header | {"bytes": len(payload)}).encode()
+    sock.sendall(_LENGTH.pack(len(data)) + data + payload)
+
+
+def _read(rfile, n: int) -> bytes:
+    data = rfile.read(n)
+    if len(data) < n:
+        raise ConnectionError("embedding service connection closed")
+    return data
+
+
+def _recv(rfile) -> Tuple[Dict, bytes]:
+    (n,) = _LENGTH.unpack(_read(rfile, _LENGTH.size))
+    header = json.loads(_read(rfile, n))
+    size = header.get("bytes", 0)
+    return header, _read(rfile, size) if size else b""
+
+
+# ---------- Server ----------
+class _Request:
+    __slots__ = ("texts", "done", "vectors", "error")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.vectors: Optional[np.ndarray] = None
+        self.error: Optional[Exception] = None
+
+
+class Batcher:
+    """Merges encode calls from many threads into batched model calls on one worker thread."""
+
+    def __init__(self, model, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        threading.Thread(target=self._run, name="embed-batcher", daemon=True).start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Normalized float32 vectors for texts, one row each."""
+        req = _Request(texts)
+        self._queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.vectors
+
+    def _collect(self) -> List[_Request]:
+        batch = [self._queue.get()]
+        n = len(batch[0].texts)
+        deadline = time.perf_counter() + self.max_wait
+        while n < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(req)
+            n += len(req.texts)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            texts = [t for req in batch for t in req.texts]
+            try:
+                vectors = np.asarray(self.model.encode(texts, batch_size=self.max_batch,
+                                                       normalize_embeddings=True), dtype=np.float32)
+                start = 0
+                for req in batch:
+                    req.vectors = vectors[start:start + len(req.texts)]
+                    start += len(req.texts)
+            except Exception as e:
+                for req in batch:
+                    req.error = e
+            self.requests += len(batch)
+            self.batches += 1
+            self.texts += len(texts)
+            for req in batch:
+                req.done.set()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_texts": round(self.texts / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """One connection: a sequence of request/reply frames until the client hangs up."""
+
+    def handle(self) -> None:
+        batcher: Batcher = self.server.batcher
+        while True:
+            try:
+                header, _ = _recv(self.rfile)
+            except (ConnectionError, OSError):
+                return
+            op = header.get("op")
+            try:
+                if op == "encode":
+                    vectors = batcher.encode(header["texts"])
+                    _send(self.request, {"shape": list(vectors.shape)}, vectors.tobytes())
+                elif op == "info":
+                    _send(self.request, {"model": self.server.model_name})
+                elif op == "stats":
+                    _send(self.request, batcher.stats())
+                else:
+                    _send(self.request, {"error": f"unknown op {op!r}"})
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                _send(self.request, {"error": str(e)})
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(address: str, model, model_name: str = MODEL_NAME,
+                max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS) -> socketserver.BaseServer:
+    """A ready-to-serve embedding server around model (anything with SentenceTransformer.encode)."""
+    family, addr = _address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr):
+            os.unlink(addr)  # stale socket from a previous run
+        server = _UnixServer(addr, _Handler)
+    else:
+        server = _TCPServer(addr, _Handler)
+    server.batcher = Batcher(model, max_batch, max_wait_ms)
+    server.model_name = model_name
+    return server
+
+
+def serve(address: str = EMBED_SERVICE) -> None:
+    if not address:
+        raise SystemExit("Set RAG_EMBED_SERVICE to host:port or unix:/path.sock")
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(MODEL_NAME)
+    server = make_server(address, model)
+    print(f"Embedding service for {MODEL_NAME} listening on {address}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+# ---------- Client ----------
+class EmbedClient:
+    """
+    Stands in for SentenceTransformer in code that only calls encode().
+    Each thread keeps its own connection. Requests from concurrent threads and
+    processes reach the service separately and are batched there.
+    """
+
+    def __init__(self, address: str = EMBED_SERVICE, model_name: str = MODEL_NAME):
+        self.address = address
+        self.model_name = model_name
+        self._local = threading.local()
+
+    def _connect(self):
+        family, addr = _address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(addr)
+            sock.settimeout(None)
+            if family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = (sock, sock.makefile("rb"))
+            info, _ = self._call(conn, {"op": "info"})
+        except Exception:
+            sock.close()
+            raise
+        if info["model"] != self.model_name:
+            sock.close()
+            raise RuntimeError(f"embedding service at {self.address} serves {info['model']}, "
+                               f"expected {self.model_name}")
+        return conn
+
+    def _close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+
+    @staticmethod
+    def _call(conn, header: Dict) -> Tuple[Dict, bytes]:
+        sock, rfile = conn
+        _send(sock, header)
+        reply, payload = _recv(rfile)
+        if "error" in reply:
+            raise RuntimeError(f"embedding service: {reply['error']}")
+        return reply, payload
+
+    def request(self, header: Dict) -> Tuple[Dict, bytes]:
+        """Send one frame; a connection broken since the last call (e.g. service restart) is retried once."""
+        for attempt in range(2):
+            reused = getattr(self._local, "conn", None) is not None
+            if not reused:
+                self._local.conn = self._connect()
+            try:
+                return self._call(self._local.conn, header)
+            except OSError:
+                self._close()
+                if attempt or not reused:
+                    raise
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        """Same shapes as SentenceTransformer.encode; vectors are always normalized."""
+        if not normalize_embeddings:
+            raise ValueError("the embedding service only returns normalized embeddings")
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        reply, payload = self.request({"op": "encode", "texts": texts})
+        vectors = np.frombuffer(payload, dtype=np.float32).reshape(reply["shape"])
+        return vectors[0] if single else vectors
+
+    def stats(self) -> Dict[str, float]:
+        reply, _ = self.request({"op": "stats"})
+        reply.pop("bytes", None)
+        return reply
+
+
+if __name__ == "__main__":
+    serve()
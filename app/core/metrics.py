@@ -0,0 +1,168 @@
+# app/core/metrics.py
+"""
+Per-stage timing spans, exported in the Prometheus text format.
+
+    with span("search.bm25"):
+        r = es.search(...)
+
+Every span observes rag_stage_seconds{stage=...}. A span that raises also counts
+rag_stage_errors_total{stage=...}. Spans nest, so an outer stage's time includes
+its inner ones. Inside trace() (one per /query request) spans are also recorded
+for the response's timings and profile blocks. Work handed to executor threads
+must be wrapped in propagate() to reach the request's trace.
+Metrics are per process; with several uvicorn workers each reports its own.
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Tuple, le: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, values: Tuple = (), amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[values] = self._values.get(values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labels, values)} {v:g}" for values, v in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List] = {}  # values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, values: Tuple, amount: float) -> None:
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if amount <= bound:
+                    series[i] += 1
+            series[-2] += amount
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((values, list(series)) for values, series in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in items:
+            for bound, n in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, f'{bound:g}')} {n}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels, values, '+Inf')} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {series[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+STAGE_ERRORS = Counter("rag_stage_errors_total", "Stage executions that raised.", ["stage"])
+ITEMS = Counter("rag_items_total", "Items processed (chunks indexed, PDFs downloaded, LLM tokens, ...).", ["item"])
+_METRICS = [STAGE_SECONDS, STAGE_ERRORS, ITEMS]
+
+
+def count(item: str, amount: float = 1.0) -> None:
+    ITEMS.inc((item,), amount)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    return "\n".join(line for metric in _METRICS for line in metric.render()) + "\n"
+
+
+# ---------- Per-request traces ----------
+class Trace:
+    """The spans of one request, with their offsets from the start of the request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, float, float, str]] = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, start: float, seconds: float) -> None:
+        with self._lock:
+            self.spans.append((stage, start - self.start, seconds, threading.current_thread().name))
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def timings(self) -> Dict[str, float]:
+        """Milliseconds per stage (repeated stages summed), plus total_ms."""
+        out: Dict[str, float] = {}
+        for stage, _, seconds, _ in sorted(self.spans, key=lambda s: s[1]):
+            out[stage] = out.get(stage, 0.0) + seconds * 1000
+        out = {stage: round(ms, 3) for stage, ms in out.items()}
+        out["total_ms"] = round(self.elapsed_ms(), 3)
+        return out
+
+    def profile(self) -> List[Dict]:
+        """Every span in start order: where it began, how long it took, and on which thread."""
+        return [{"stage": stage, "start_ms": round(offset * 1000, 3), "ms": round(seconds * 1000, 3), "thread": thread}
+                for stage, offset, seconds, thread in sorted(self.spans, key=lambda s: s[1])]
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("rag_trace", default=None)
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """Collect the spans run in this context (and in tasks and propagate()d calls started from it)."""
+    t = Trace()
+    token = _trace.set(t)
+    try:
+        yield t
+    finally:
+        _trace.reset(token)
+
+
+def observe(stage: str, start: float) -> None:
+    """Record a stage that began at perf_counter() value start and ends now."""
+    seconds = time.perf_counter() - start
+    STAGE_SECONDS.observe((stage,), seconds)
+    t = _trace.get()
+    if t is not None:
+        t.add(stage, start, seconds)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc((stage,))
+        raise
+    finally:
+        observe(stage, start)
+
+
+def propagate(fn: Callable, *args) -> Callable[[], object]:
+    """fn(*args) bound to a copy of the current context, for submitting to an executor thread."""
+    return functools.partial(contextvars.copy_context().run, fn, *args)
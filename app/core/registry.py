@@ -0,0 +1,74 @@
+# app/core/registry.py
+"""
+Process-wide, lazily created heavy objects: the embedding and rerank models and the ES clients.
+Importing a module that needs them no longer costs a model load. The first
+caller pays, and everyone after shares the same instance.
+"""
+import os
+import threading
+from typing import Optional
+
+ES_URL = os.getenv("ES_URL", "http://localhost:9200")
+MODEL_NAME = os.getenv("RAG_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBED_SERVICE = os.getenv("RAG_EMBED_SERVICE", "")  # host:port or unix:/path of a shared embed_service
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+ES_CONNECTIONS = int(os.getenv("RAG_ES_CONNECTIONS", "16"))  # pooled connections per ES node
+
+_lock = threading.Lock()
+_embedder = None
+_reranker = None
+_es = None
+_async_es = None
+
+
+def get_embedder():
+    """The embedding model, or a client of the shared embedding service when RAG_EMBED_SERVICE is set."""
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                if EMBED_SERVICE:
+                    from .embed_service import EmbedClient
+                    _embedder = EmbedClient(EMBED_SERVICE, MODEL_NAME)
+                else:
+                    from sentence_transformers import SentenceTransformer
+                    _embedder = SentenceTransformer(MODEL_NAME)
+    return _embedder
+
+
+def get_reranker():
+    global _reranker
+    if _reranker is None:
+        with _lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+                _reranker = CrossEncoder(RERANK_MODEL, device="cpu")
+    return _reranker
+
+
+def get_es():
+    global _es
+    if _es is None:
+        with _lock:
+            if _es is None:
+                from elasticsearch import Elasticsearch
+                _es = Elasticsearch(ES_URL, connections_per_node=ES_CONNECTIONS)
+    return _es
+
+
+def get_async_es():
+    global _async_es
+    if _async_es is None:
+        with _lock:
+            if _async_es is None:
+                from elasticsearch import AsyncElasticsearch
+                _async_es = AsyncElasticsearch(ES_URL, connections_per_node=ES_CONNECTIONS)
+    return _async_es
+
+
+async def aclose_async_es() -> None:
+    global _async_es
+    client: Optional[object] = _async_es
+    _async_es = None
+    if client is not None:
+        await client.close()
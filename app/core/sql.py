@@ -0,0 +1,15 @@
+# app/core/sql.py
+from typing import Iterator, List, Sequence
+
+SQL_BATCH = 500  # keep IN (...) lists under SQLite's variable limit
+
+
+def batches(items: Sequence, size: int = SQL_BATCH) -> Iterator[List]:
+    """Consecutive slices of items, each small enough to bind as one IN (...) list."""
+    for start in range(0, len(items), size):
+        yield list(items[start:start + size])
+
+
+def placeholders(batch: Sequence) -> str:
+    """The "?,?,..." list for binding batch in an IN (...) clause."""
+    return ",".join("?" * len(batch))
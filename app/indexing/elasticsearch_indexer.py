@@ -1,63 +1,418 @@
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+from elasticsearch import TransportError, helpers
+from typing import List, Dict, Callable, Iterable, Iterator, Optional
 import hashlib
-import re
+import os
+import threading
+import time
 
-ES_URL = "http://localhost:9200"
-INDEX = "rag_documents"
+from .embedding_cache import EmbeddingCache, open_cache
+from .generation import bump_generation
+from .sparse import get_sparse_embedding, get_sparse_embeddings
+from .vector_index import get_vector_index
+from ..core.registry import MODEL_NAME, get_embedder, get_es
+from ..core.metrics import count, span
 
-es = Elasticsearch(ES_URL)
-embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+INDEX = os.getenv("RAG_INDEX", "rag_documents")
 
-def create_index():
-    if es.indices.exists(index=INDEX):
-        return
-    es.indices.create(index=INDEX, body={
+# ---- Bulk indexing config ----
+BULK_CHUNK_SIZE = int(os.getenv("RAG_BULK_CHUNK_SIZE", "500"))           # actions per bulk request
+BULK_MAX_BYTES = int(os.getenv("RAG_BULK_MAX_BYTES", str(50 * 1024 * 1024)))  # bytes per bulk request
+BULK_THREADS = int(os.getenv("RAG_BULK_THREADS", "1"))                   # >1 switches to parallel_bulk
+BULK_MAX_RETRIES = int(os.getenv("RAG_BULK_MAX_RETRIES", "3"))           # retry rounds for failed items
+
+# ---- Embedding config ----
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "32"))   # texts per encode() call
+EMBED_GROUP_SIZE = int(os.getenv("RAG_EMBED_GROUP_SIZE", "256"))  # chunks sorted by length together
+
+# ---- Vector quantization ----
+# ES keeps the float vectors (and _source) for rescoring, but the HNSW graph is
+# built over int8 or 1-bit copies, which is what has to fit in the heap.
+VECTOR_QUANTIZATION = os.getenv("RAG_VECTOR_QUANTIZATION", "none")  # none | int8 | binary
+_INDEX_OPTIONS = {
+    "none": None,
+    "int8": {"type": "int8_hnsw"},
+    "binary": {"type": "bbq_hnsw"},  # needs Elasticsearch 8.16+
+}
+
+_cache_lock = threading.Lock()
+_embed_cache: Optional[EmbeddingCache] = None
+_embed_cache_opened = False
+
+def get_embed_cache() -> Optional[EmbeddingCache]:
+    """The embedding cache, opened on first use (None when disabled)."""
+    global _embed_cache, _embed_cache_opened
+    if not _embed_cache_opened:
+        with _cache_lock:
+            if not _embed_cache_opened:
+                _embed_cache = open_cache(MODEL_NAME)
+                _embed_cache_opened = True
+    return _embed_cache
+
+def _index_body(quantization: str = VECTOR_QUANTIZATION) -> Dict:
+    if quantization not in _INDEX_OPTIONS:
+        raise ValueError(f"Unknown RAG_VECTOR_QUANTIZATION {quantization!r}; expected one of {list(_INDEX_OPTIONS)}")
+    embedding = {"type": "dense_vector", "dims": 384, "index": True, "similarity": "cosine"}
+    if _INDEX_OPTIONS[quantization]:
+        embedding["index_options"] = _INDEX_OPTIONS[quantization]
+    return {
         "mappings": {
             "properties": {
                 "text": {"type": "text"},
-                "sparse_embedding": {"type": "object", "enabled": False},
-                "embedding": {"type": "dense_vector", "dims": 384, "index": True, "similarity": "cosine"},
+                "sparse_embedding": {"type": "rank_features"},
+                "embedding": embedding,
                 "chunk_id": {"type": "integer"},
+                "start_offset": {"type": "integer"},
+                "end_offset": {"type": "integer"},
                 "source_file": {"type": "keyword"},
                 "file_path": {"type": "keyword"},
                 "drive_url": {"type": "keyword"}
             }
         }
-    })
+    }
+
+def create_index():
+    es = get_es()
+    if es.indices.exists(index=INDEX):
+        return
+    es.indices.create(index=INDEX, body=_index_body())
+
+def migrate_index(quantization: str = VECTOR_QUANTIZATION) -> str:
+    """
+    Copy INDEX into a new index whose vectors use `quantization` and make
+    INDEX an alias of it. Returns the new index name.
+    The alias swap and the removal of the old index happen in one atomic
+    update_aliases call, so searches never see a missing index. Chunks
+    written while the reindex runs may not be copied; run an
+    incremental ingest afterwards.
+    """
+    es = get_es()
+    target = f"{INDEX}-{quantization}-{int(time.time())}"
+    es.indices.create(index=target, body=_index_body(quantization))
+    es.options(request_timeout=3600).reindex(
+        body={"source": {"index": INDEX}, "dest": {"index": target}},
+        wait_for_completion=True, refresh=True)
+
+    if es.indices.exists_alias(name=INDEX):
+        old = list(es.indices.get_alias(name=INDEX).body)
+        actions = [{"add": {"index": target, "alias": INDEX}}] + [{"remove_index": {"index": o}} for o in old]
+    else:
+        actions = [{"remove_index": {"index": INDEX}}, {"add": {"index": target, "alias": INDEX}}]
+    es.indices.update_aliases(body={"actions": actions})
+    bump_generation()
+    return target
 
 def get_embedding(text: str):
-    return embedder.encode(text, normalize_embeddings=True).tolist()
-
-def get_sparse_embedding(text: str) -> Dict[str, float]:
-    # Simple ELSER simulation using keyword extraction
-    words = re.findall(r'\b\w+\b', text.lower())
-    word_counts = {}
-    for word in words:
-        if len(word) > 2:
-            word_counts[word] = word_counts.get(word, 0) + 1
-    
-    if not word_counts:
-        return {}
-    
-    max_count = max(word_counts.values())
-    return {word: count/max_count for word, count in word_counts.items()}
-
-def index_documents(docs: List[Dict]) -> int:
+    embed_cache = get_embed_cache()
+    if embed_cache is not None:
+        cached = embed_cache.get_many([text])[0]
+        if cached is not None:
+            return cached
+    vec = get_embedder().encode(text, normalize_embeddings=True).tolist()
+    if embed_cache is not None:
+        embed_cache.put_many([text], [vec])
+    return vec
+
+def get_embeddings(texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> List[List[float]]:
+    """
+    Embed many texts at once. Texts are encoded in length-sorted batches so each
+    batch pads to a similar length, then put back in input order. Vectors are
+    the same normalized 384-dim vectors get_embedding returns.
+    Texts already in the embedding cache are not sent to the model.
+    """
+    embed_cache = get_embed_cache()
+    if embed_cache is not None:
+        vectors = embed_cache.get_many(texts)
+    else:
+        vectors = [None] * len(texts)
+
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    order = sorted(missing, key=lambda i: len(texts[i]))
+    for start in range(0, len(order), batch_size):
+        idx = order[start:start + batch_size]
+        batch = get_embedder().encode([texts[i] for i in idx], batch_size=batch_size,
+                                normalize_embeddings=True)
+        for i, vec in zip(idx, batch):
+            vectors[i] = vec.tolist()
+
+    if embed_cache is not None and missing:
+        embed_cache.put_many([texts[i] for i in missing], [vectors[i] for i in missing])
+    return vectors
+
+def reset_embedding_cache_stats() -> None:
+    """Start counting cache hits and misses afresh; call once at the start of an ingest."""
+    embed_cache = get_embed_cache()
+    if embed_cache is not None:
+        embed_cache.reset_stats()
+
+def embedding_cache_stats() -> Dict[str, int]:
+    """Cache hit/miss counts since the last reset_embedding_cache_stats()."""
+    embed_cache = get_embed_cache()
+    if embed_cache is None:
+        return {"hits": 0, "misses": 0, "entries": 0}
+    return embed_cache.stats()
+
+def doc_id(d: Dict) -> str:
+    """Stable ES _id for a chunk; must not change or existing indices go stale."""
+    return hashlib.md5(f"{d['source_file']}|{d['chunk_id']}".encode()).hexdigest()
+
+def _doc_body(d: Dict, embedding: List[float], sparse: Optional[Dict[str, float]] = None) -> Dict:
+    return {
+        "text": d["text"],
+        "sparse_embedding": get_sparse_embedding(d["text"]) if sparse is None else sparse,
+        "embedding": embedding,
+        "chunk_id": d["chunk_id"],
+        "start_offset": d.get("start_offset"),
+        "end_offset": d.get("end_offset"),
+        "source_file": d["source_file"],
+        "file_path": d.get("file_path", ""),
+        "drive_url": d.get("drive_url", "")
+    }
+
+def _embed_group(group: List[Dict]) -> List[tuple]:
+    texts = [g["text"] for g in group]
+    with span("index.embed"):
+        embeddings = get_embeddings(texts)
+    vector_index = get_vector_index()
+    if vector_index is not None:
+        with span("index.vector_index"):
+            vector_index.add([doc_id(g) for g in group], [g.get("file_path", "") for g in group], embeddings)
+    with span("index.sparse"):
+        sparse = get_sparse_embeddings(texts)
+    return list(zip(group, embeddings, sparse))
+
+def _embedded(docs: Iterable[Dict], group_size: int = EMBED_GROUP_SIZE) -> Iterator[tuple]:
+    """
+    Yield (doc, embedding, sparse weights), embedding group_size docs per get_embeddings call.
+    Each group is also written to the local vector index when one is configured.
+    """
+    group: List[Dict] = []
+    for d in docs:
+        group.append(d)
+        if len(group) >= group_size:
+            yield from _embed_group(group)
+            group = []
+    if group:
+        yield from _embed_group(group)
+
+def _bulk_actions(docs: Iterable[Dict], inflight: Dict[str, Dict]) -> Iterator[Dict]:
+    # Remember every action until its result comes back so failures can be retried
+    # without keeping the whole corpus in memory.
+    for d, emb, sparse in _embedded(docs):
+        action = {"_index": INDEX, "_id": doc_id(d), "_source": _doc_body(d, emb, sparse)}
+        inflight[action["_id"]] = action
+        yield action
+
+def _bulk_results(actions: Iterator[Dict], chunk_size: int, max_chunk_bytes: int,
+                  thread_count: int) -> Iterator[tuple]:
+    if thread_count > 1:
+        return helpers.parallel_bulk(
+            get_es(), actions, thread_count=thread_count, chunk_size=chunk_size,
+            max_chunk_bytes=max_chunk_bytes, raise_on_error=False, raise_on_exception=False)
+    # streaming_bulk already backs off and retries items rejected with 429
+    return helpers.streaming_bulk(
+        get_es(), actions, chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes,
+        raise_on_error=False, raise_on_exception=False, max_retries=2)
+
+def _run_bulk(actions: Iterable[Dict], inflight: Dict[str, Dict], failed: Dict[str, Dict],
+              chunk_size: int, max_chunk_bytes: int, thread_count: int,
+              on_progress: Optional[Callable[[int], None]] = None) -> int:
+    actions = iter(actions)
+    n = 0
+    while True:
+        try:
+            for ok, item in _bulk_results(actions, chunk_size, max_chunk_bytes, thread_count):
+                info = next(iter(item.values()))
+                action = inflight.pop(info.get("_id"), None)
+                if ok:
+                    n += 1
+                    failed.pop(info.get("_id"), None)
+                    if on_progress is not None and n % chunk_size == 0:
+                        on_progress(n)
+                elif action is not None:
+                    failed[info["_id"]] = action | {"_error": info.get("error")}
+            return n
+        except TransportError as e:
+            # raise_on_exception only covers ApiError: a connection error or timeout
+            # ends the helper. Everything pulled but not acknowledged goes to the
+            # retry rounds, and a new helper continues with the remaining actions.
+            for _id, action in list(inflight.items()):
+                failed[_id] = action | {"_error": f"{type(e).__name__}: {e}"}
+            inflight.clear()
+
+def _bulk_index(docs: Iterable[Dict], chunk_size: int, max_chunk_bytes: int,
+                thread_count: int, max_retries: int,
+                on_progress: Optional[Callable[[int], None]] = None,
+                failed_files: Optional[List[str]] = None) -> int:
+    inflight: Dict[str, Dict] = {}
+    failed: Dict[str, Dict] = {}
+    n = _run_bulk(_bulk_actions(docs, inflight), inflight, failed,
+                  chunk_size, max_chunk_bytes, thread_count, on_progress)
+
+    for attempt in range(max_retries):
+        if not failed:
+            break
+        time.sleep(min(2 ** attempt, 30))
+        retry = [{k: v for k, v in a.items() if k != "_error"} for a in failed.values()]
+        for a in retry:
+            inflight[a["_id"]] = a
+        n += _run_bulk(retry, inflight, failed, chunk_size, max_chunk_bytes, 1)
+
+    count("index_failures", len(failed))
+    for a in failed.values():
+        src = a["_source"]
+        print(f"[Index error] {src['source_file']} chunk {src['chunk_id']}: {a['_error']}")
+    if failed_files is not None:
+        failed_files.extend(sorted({a["_source"]["file_path"] for a in failed.values()} - set(failed_files)))
+    return n
+
+def delete_file_chunks(file_paths: List[str], batch_size: int = 1000) -> int:
+    """Delete every chunk whose file_path is in file_paths; returns the number deleted."""
+    es = get_es()
+    if not file_paths or not es.indices.exists(index=INDEX):
+        return 0
+    deleted = 0
+    with span("index.delete"):
+        for start in range(0, len(file_paths), batch_size):
+            r = es.delete_by_query(
+                index=INDEX,
+                body={"query": {"terms": {"file_path": file_paths[start:start + batch_size]}}},
+                conflicts="proceed",
+                refresh=True,
+            )
+            deleted += r.get("deleted", 0)
+    vector_index = get_vector_index()
+    if vector_index is not None:
+        vector_index.delete_files(file_paths)
+    if deleted:
+        bump_generation()
+    return deleted
+
+def delete_chunks(doc_ids: List[str], batch_size: int = 1000) -> int:
+    """Delete chunks by ES _id (also from the local vector index); returns the number deleted."""
+    es = get_es()
+    if not doc_ids or not es.indices.exists(index=INDEX):
+        return 0
+    deleted = 0
+    with span("index.delete"):
+        for start in range(0, len(doc_ids), batch_size):
+            r = es.delete_by_query(
+                index=INDEX,
+                body={"query": {"ids": {"values": doc_ids[start:start + batch_size]}}},
+                conflicts="proceed",
+                refresh=True,
+            )
+            deleted += r.get("deleted", 0)
+    vector_index = get_vector_index()
+    if vector_index is not None:
+        vector_index.delete(doc_ids)
+    if deleted:
+        bump_generation()
+    return deleted
+
+def delete_stale_chunks(chunk_counts: Dict[str, int], batch_size: int = 500, page_size: int = 1000) -> int:
+    """
+    Delete the chunks a re-ingested file no longer has: those of file_path with
+    chunk_id >= chunk_counts[file_path]. A full ingest overwrites a file's first
+    chunks by _id, so without this a file that now chunks into fewer pieces
+    would keep its old tail searchable. Returns the number deleted.
+    """
+    es = get_es()
+    if not chunk_counts or not es.indices.exists(index=INDEX):
+        return 0
+    items = sorted(chunk_counts.items())
+    deleted = 0
+    for start in range(0, len(items), batch_size):
+        query = {"bool": {"should": [
+            {"bool": {"filter": [{"term": {"file_path": file_path}}, {"range": {"chunk_id": {"gte": n}}}]}}
+            for file_path, n in items[start:start + batch_size]
+        ], "minimum_should_match": 1}}
+        while True:
+            r = es.search(index=INDEX, body={"size": page_size, "_source": False, "query": query})
+            removed = delete_chunks([hit["_id"] for hit in r["hits"]["hits"]])
+            deleted += removed
+            if not removed:
+                break
+    return deleted
+
+def index_documents(
+    docs: Iterable[Dict],
+    bulk: bool = True,
+    chunk_size: int = BULK_CHUNK_SIZE,
+    max_chunk_bytes: int = BULK_MAX_BYTES,
+    thread_count: int = BULK_THREADS,
+    max_retries: int = BULK_MAX_RETRIES,
+    on_progress: Optional[Callable[[int], None]] = None,
+    failed_files: Optional[List[str]] = None,
+) -> int:
+    """
+    Index chunk dicts into INDEX and return how many were written.
+    docs may be any iterable, including a lazy generator. It is consumed in
+    bounded batches and each batch is written before the next is pulled.
+    With bulk=True (default) documents go through the bulk API; items that fail
+    are retried up to max_retries rounds and reported per document instead of
+    aborting the run; so are the items of a bulk request lost to a connection
+    error or timeout. If failed_files is given, the file paths of those items
+    are appended to it, so the caller can ingest them again (see
+    drive_ingestor.requeue_files). bulk=False keeps the old one-request-per-chunk
+    path, which raises on the first failure.
+    on_progress, if given, is called with the running indexed count after
+    every chunk_size documents. Embeddings also go to the local vector index
+    (RAG_VECTOR_INDEX), which readers pick up with the generation bump.
+    Timed as index.documents, with index.embed, index.sparse and index.refresh
+    inside it; what remains is document intake and the bulk requests.
+    """
+    with span("index.documents"):
+        n = _index_documents(docs, bulk, chunk_size, max_chunk_bytes, thread_count, max_retries, on_progress,
+                             failed_files)
+    count("chunks_indexed", n)
+    return n
+
+def _index_documents(docs: Iterable[Dict], bulk: bool, chunk_size: int, max_chunk_bytes: int,
+                     thread_count: int, max_retries: int,
+                     on_progress: Optional[Callable[[int], None]], failed_files: Optional[List[str]]) -> int:
     create_index()
+    es = get_es()
+    if bulk:
+        n = _bulk_index(docs, chunk_size, max_chunk_bytes, thread_count, max_retries, on_progress, failed_files)
+    else:
+        n = 0
+        for d, emb, sparse in _embedded(docs):
+            es.index(index=INDEX, id=doc_id(d), body=_doc_body(d, emb, sparse))
+            n += 1
+            if on_progress is not None and n % chunk_size == 0:
+                on_progress(n)
+    with span("index.refresh"):
+        es.indices.refresh(index=INDEX)
+    # Bump after the refresh so a new generation always sees the new documents
+    bump_generation()
+    return n
+
+def rebuild_vector_index(batch_size: int = 1000) -> int:
+    """
+    Rebuild the local vector index from the embeddings already stored in ES.
+    Use it once after turning RAG_VECTOR_INDEX on for an existing index.
+    Returns the number of vectors written.
+    """
+    vector_index = get_vector_index()
+    if vector_index is None or not get_es().indices.exists(index=INDEX):
+        return 0
+    vector_index.clear()
     n = 0
-    for d in docs:
-        doc_id = hashlib.md5(f"{d['source_file']}|{d['chunk_id']}".encode()).hexdigest()
-        es.index(index=INDEX, id=doc_id, body={
-            "text": d["text"],
-            "sparse_embedding": get_sparse_embedding(d["text"]),
-            "embedding": get_embedding(d["text"]),
-            "chunk_id": d["chunk_id"],
-            "source_file": d["source_file"],
-            "file_path": d.get("file_path", ""),
-            "drive_url": d.get("drive_url", "")
-        })
-        n += 1
-    es.indices.refresh(index=INDEX)
+    batch: List[Dict] = []
+    hits = helpers.scan(get_es(), index=INDEX, size=batch_size,
+                        query={"query": {"match_all": {}}, "_source": ["embedding", "file_path"]})
+    for hit in hits:
+        batch.append(hit)
+        if len(batch) >= batch_size:
+            n += _add_hits(vector_index, batch)
+            batch = []
+    if batch:
+        n += _add_hits(vector_index, batch)
+    bump_generation()
     return n
+
+def _add_hits(vector_index, hits: List[Dict]) -> int:
+    hits = [h for h in hits if h["_source"].get("embedding")]
+    vector_index.add([h["_id"] for h in hits], [h["_source"].get("file_path", "") for h in hits],
+                     [h["_source"]["embedding"] for h in hits])
+    return len(hits)
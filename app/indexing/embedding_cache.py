@@ -0,0 +1,105 @@
+# app/indexing/embedding_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ..core.sql import batches, placeholders
+
+EMBED_CACHE_PATH = os.getenv("RAG_EMBED_CACHE", ".cache/embeddings.sqlite3")  # "" disables the cache
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("RAG_EMBED_CACHE_MAX_ENTRIES", "500000"))
+
+
+class EmbeddingCache:
+    """
+    Disk-backed, content-addressed store of embedding vectors.
+    Keys are sha256(model name + chunk text), so a vector is reused whenever the
+    same text is embedded by the same model, regardless of file or chunk id.
+    The table is bounded to max_entries rows; least recently used rows go first.
+    """
+
+    def __init__(self, path: str, model_name: str, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # bulk indexing may pull embeddings from a feeder thread
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vec BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._clock = self._db.execute("SELECT COALESCE(MAX(last_used), 0) FROM embeddings").fetchone()[0]
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return cached vectors in input order, None where the text is not cached."""
+        keys = [self.key(t) for t in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for batch in batches(keys):
+                rows = self._db.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({placeholders(batch)})",
+                    batch,
+                ).fetchall()
+                for k, blob in rows:
+                    found[k] = array("f", blob).tolist()
+            if found:
+                self._clock += 1
+                self._db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(self._clock, k) for k in found],
+                )
+                self._db.commit()
+
+            out = [found.get(k) for k in keys]
+            n_hits = sum(v is not None for v in out)
+            self.hits += n_hits
+            self.misses += len(out) - n_hits
+        return out
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]) -> None:
+        with self._lock:
+            self._clock += 1
+            cur = self._db.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vec, last_used) VALUES (?, ?, ?)",
+                [(self.key(t), array("f", v).tobytes(), self._clock) for t, v in zip(texts, vectors)],
+            )
+            self._count += max(cur.rowcount, 0)
+            if self._count > self.max_entries:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        # Drop an extra 10% so we are not evicting on every single insert
+        excess = self._count - int(self.max_entries * 0.9)
+        self._db.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": self._count}
+
+
+def open_cache(model_name: str, path: str = EMBED_CACHE_PATH) -> Optional[EmbeddingCache]:
+    """Open the configured cache, or return None when RAG_EMBED_CACHE is empty."""
+    if not path:
+        return None
+    return EmbeddingCache(path, model_name)
@@ -0,0 +1,34 @@
+# app/indexing/generation.py
+import fcntl
+import os
+import threading
+from pathlib import Path
+
+# Shared by every process on the host (CLI ingest, uvicorn workers) through a small file
+GENERATION_FILE = os.getenv("RAG_INDEX_GENERATION_FILE", ".cache/index_generation")
+
+
+def current_generation(path: str = GENERATION_FILE) -> int:
+    """Generation of INDEX; changes whenever index_documents writes to it."""
+    try:
+        with open(path) as fh:
+            return int(fh.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_generation(path: str = GENERATION_FILE) -> int:
+    """
+    Advance the generation so results cached against older data stop matching.
+    The read and the write happen under an exclusive lock on a sibling .lock file,
+    so concurrent bumps (main.py next to /ingest) never both write the same value.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # released when the file is closed
+        gen = current_generation(path) + 1
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as fh:
+            fh.write(str(gen))
+        os.replace(tmp, path)
+    return gen
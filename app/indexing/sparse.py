@@ -0,0 +1,42 @@
+# app/indexing/sparse.py
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List
+
+SPARSE_MAX_QUERY_TERMS = int(os.getenv("RAG_SPARSE_MAX_QUERY_TERMS", "32"))  # rank_feature clauses per query
+
+# Lowercased word tokens of 3+ characters. \w has no ".", so every term is a
+# valid rank_features key.
+_TERM = re.compile(r"\b\w{3,}\b")
+
+
+def get_sparse_embedding(text: str) -> Dict[str, float]:
+    """
+    Simple ELSER simulation using keyword extraction: term -> count / max count.
+    Weights are in (0, 1], as rank_features requires.
+    """
+    counts = Counter(_TERM.findall(text.lower()))
+    if not counts:
+        return {}
+    max_count = max(counts.values())
+    return {term: count / max_count for term, count in counts.items()}
+
+
+def get_sparse_embeddings(texts: Iterable[str]) -> List[Dict[str, float]]:
+    """get_sparse_embedding for a batch of chunks (one embedding group at ingest)."""
+    return [get_sparse_embedding(t) for t in texts]
+
+
+def sparse_query(query: str, max_terms: int = SPARSE_MAX_QUERY_TERMS) -> List[Dict]:
+    """
+    rank_feature clauses for the query's own sparse expansion. Each clause
+    is boosted by the query term's weight and uses the linear function, so
+    a document's score is the dot product of the two term-weight maps.
+    """
+    weights = get_sparse_embedding(query)
+    top = sorted(weights.items(), key=lambda kv: kv[1], reverse=True)[:max_terms]
+    return [
+        {"rank_feature": {"field": f"sparse_embedding.{term}", "linear": {}, "boost": weight}}
+        for term, weight in top
+    ]
@@ -0,0 +1,241 @@
+# app/indexing/vector_index.py
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .generation import current_generation
+from ..core.registry import MODEL_NAME
+from ..core.sql import batches, placeholders
+
+VECTOR_INDEX_PATH = os.getenv("RAG_VECTOR_INDEX", "")                 # directory, "" disables the local index
+VECTOR_INDEX_DTYPE = os.getenv("RAG_VECTOR_INDEX_DTYPE", "float32")   # float32 | float16
+SEARCH_BLOCK_ROWS = 16384  # rows scored per matrix-vector product
+
+
+class VectorIndex:
+    """
+    Flat, memory-mapped copy of every chunk embedding, for dense search without ES kNN.
+    Vectors live in one row-major float32/float16 file, and a SQLite table maps
+    ES document ids to rows. Rows of deleted chunks go to a free_rows table and
+    are reused by later inserts. Every write runs in one SQLite write transaction,
+    so writers in other processes or other instances (main.py next to the API)
+    never get the same row.
+    Searches score the whole matrix with blocked NumPy matrix-vector products.
+    Vectors are normalized, so the dot product is the cosine similarity.
+    Readers reload the id table whenever the index generation changes, so an
+    index written by another process (main.py) shows up after its next ingest.
+    """
+
+    def __init__(self, path: str, model_name: str, dtype: str = VECTOR_INDEX_DTYPE):
+        self.dir = Path(path)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.matrix_path = self.dir / f"vectors.{self.dtype.name}"
+        self.meta_path = self.dir / "meta.json"
+        self._lock = threading.Lock()
+        # Autocommit mode; writes use explicit BEGIN IMMEDIATE transactions
+        self._db = sqlite3.connect(str(self.dir / "ids.sqlite3"), timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._transaction():
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                "doc_id TEXT PRIMARY KEY, row INTEGER UNIQUE NOT NULL, file_path TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_file_path ON rows(file_path)")
+            seeded = self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'free_rows'").fetchone()
+            self._db.execute("CREATE TABLE IF NOT EXISTS free_rows (row INTEGER PRIMARY KEY)")
+        self.dim = self._load_meta()
+        if not seeded:
+            # Index written before free_rows existed: its unused rows are free
+            with self._transaction():
+                used = {r for (r,) in self._db.execute("SELECT row FROM rows")}
+                self._db.executemany("INSERT OR IGNORE INTO free_rows (row) VALUES (?)",
+                                     [(r,) for r in range(self._n_rows()) if r not in used])
+        self._view: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self._view_generation = -1
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Hold SQLite's write lock: other writers, in any process, wait until this one commits."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    # ---------- Layout ----------
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            return json.loads(self.meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _matches(self, meta: Dict) -> bool:
+        return meta.get("model") == self.model_name and meta.get("dtype") == self.dtype.name
+
+    def _load_meta(self) -> Optional[int]:
+        meta = self._read_meta()
+        if meta is None:
+            return None
+        if not self._matches(meta):
+            # Vectors from another model or precision are useless here: start over
+            with self._transaction():
+                self._reset(None)
+            return None
+        return meta.get("dim")
+
+    def _reset(self, dim: Optional[int]) -> None:
+        # Callers hold a transaction
+        self._db.execute("DELETE FROM rows")
+        self._db.execute("DELETE FROM free_rows")
+        self.matrix_path.unlink(missing_ok=True)
+        self._view = None
+        self.dim = dim
+        if dim is not None:
+            tmp = self.meta_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"model": self.model_name, "dtype": self.dtype.name, "dim": dim}))
+            os.replace(tmp, self.meta_path)
+
+    def _n_rows(self) -> int:
+        if not self.dim or not self.matrix_path.exists():
+            return 0
+        return self.matrix_path.stat().st_size // (self.dim * self.dtype.itemsize)
+
+    def _take_free_rows(self, n: int) -> List[int]:
+        rows = [r for (r,) in self._db.execute("SELECT row FROM free_rows ORDER BY row LIMIT ?", (n,))]
+        for batch in batches(rows):
+            self._db.execute(f"DELETE FROM free_rows WHERE row IN ({placeholders(batch)})", batch)
+        return rows
+
+    # ---------- Writes ----------
+    def add(self, doc_ids: Sequence[str], file_paths: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """Insert or overwrite the vectors of doc_ids (ES _id values)."""
+        vecs = np.asarray(vectors, dtype=np.float32)
+        if not len(vecs):
+            return
+        with self._lock, self._transaction():
+            # Another process may have written the index since this one opened it
+            meta = self._read_meta()
+            self.dim = meta.get("dim") if meta is not None and self._matches(meta) else None
+            if self.dim != vecs.shape[1]:
+                self._reset(vecs.shape[1])
+            n_rows = self._n_rows()
+
+            rows: Dict[str, int] = {}
+            for batch in batches(doc_ids):
+                rows.update(self._db.execute(
+                    f"SELECT doc_id, row FROM rows WHERE doc_id IN ({placeholders(batch)})", batch))
+            new = [d for d in dict.fromkeys(doc_ids) if d not in rows]
+            free = self._take_free_rows(len(new))
+            for doc_id in new:
+                if free:
+                    rows[doc_id] = free.pop(0)
+                else:
+                    rows[doc_id] = n_rows
+                    n_rows += 1
+
+            with open(self.matrix_path, "ab") as fh:
+                fh.truncate(n_rows * self.dim * self.dtype.itemsize)
+            matrix = np.memmap(self.matrix_path, dtype=self.dtype, mode="r+", shape=(n_rows, self.dim))
+            matrix[[rows[d] for d in doc_ids]] = vecs.astype(self.dtype)
+            matrix.flush()
+            del matrix
+
+            self._db.executemany(
+                "INSERT OR REPLACE INTO rows (doc_id, row, file_path) VALUES (?, ?, ?)",
+                [(d, rows[d], fp) for d, fp in zip(doc_ids, file_paths)],
+            )
+
+    def delete_files(self, file_paths: Iterable[str]) -> int:
+        """Drop every vector whose chunk came from one of file_paths; returns how many."""
+        return self._delete_where("file_path", list(file_paths))
+
+    def delete(self, doc_ids: Iterable[str]) -> int:
+        """Drop the vectors of doc_ids; returns how many were present."""
+        return self._delete_where("doc_id", list(doc_ids))
+
+    def _delete_where(self, column: str, values: List[str]) -> int:
+        deleted = 0
+        with self._lock, self._transaction():
+            for batch in batches(values):
+                marks = placeholders(batch)
+                freed = [(r,) for (r,) in self._db.execute(f"SELECT row FROM rows WHERE {column} IN ({marks})", batch)]
+                self._db.execute(f"DELETE FROM rows WHERE {column} IN ({marks})", batch)
+                self._db.executemany("INSERT OR IGNORE INTO free_rows (row) VALUES (?)", freed)
+                deleted += len(freed)
+        return deleted
+
+    def clear(self) -> None:
+        with self._lock, self._transaction():
+            self._reset(self.dim)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    # ---------- Reads ----------
+    def _snapshot(self) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """(matrix, ids, live) as of the current index generation."""
+        generation = current_generation()
+        with self._lock:
+            if self._view is None or generation != self._view_generation:
+                if self.dim is None:
+                    self.dim = self._load_meta()
+                n_rows = self._n_rows()
+                ids = np.empty(n_rows, dtype=object)
+                live = np.zeros(n_rows, dtype=bool)
+                for doc_id, row in self._db.execute("SELECT doc_id, row FROM rows WHERE row < ?", (n_rows,)):
+                    ids[row] = doc_id
+                    live[row] = True
+                matrix = (np.memmap(self.matrix_path, dtype=self.dtype, mode="r", shape=(n_rows, self.dim))
+                          if n_rows else np.empty((0, self.dim or 0), dtype=self.dtype))
+                self._view = (matrix, ids, live)
+                self._view_generation = generation
+            return self._view
+
+    def search(self, query_vector: Sequence[float], k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Top-k (doc_id, score) pairs by cosine similarity. Scores are mapped to
+        (1 + cosine) / 2, the same scale ES kNN reports for cosine fields.
+        """
+        matrix, ids, live = self._snapshot()
+        n_live = int(live.sum())
+        if not n_live or k <= 0:
+            return []
+        q = np.asarray(query_vector, dtype=np.float32)
+        scores = np.empty(len(ids), dtype=np.float32)
+        for start in range(0, len(ids), SEARCH_BLOCK_ROWS):
+            # float16 blocks are upcast one block at a time, never the whole matrix
+            scores[start:start + SEARCH_BLOCK_ROWS] = matrix[start:start + SEARCH_BLOCK_ROWS] @ q
+        scores[~live] = -np.inf
+
+        k = min(k, n_live)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float((1.0 + scores[i]) / 2.0)) for i in top]
+
+
+_vector_index_lock = threading.Lock()
+_vector_index: Optional[VectorIndex] = None
+_vector_index_opened = False
+
+
+def get_vector_index() -> Optional[VectorIndex]:
+    """The local vector index, opened on first use (None when RAG_VECTOR_INDEX is unset)."""
+    global _vector_index, _vector_index_opened
+    if not _vector_index_opened:
+        with _vector_index_lock:
+            if not _vector_index_opened:
+                _vector_index = VectorIndex(VECTOR_INDEX_PATH, MODEL_NAME) if VECTOR_INDEX_PATH else None
+                _vector_index_opened = True
+    return _vector_index
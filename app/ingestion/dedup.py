@@ -0,0 +1,209 @@
+# app/ingestion/dedup.py
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ..core.sql import batches, placeholders
+
+DEDUP_INDEX_PATH = os.getenv("RAG_DEDUP_INDEX", ".cache/simhash.sqlite3")  # "" disables dedup
+DEDUP_MAX_DISTANCE = int(os.getenv("RAG_DEDUP_MAX_DISTANCE", "3"))  # differing SimHash bits (of 64)
+SHINGLE_WORDS = 3
+
+_BITS = np.uint64(1) << np.arange(64, dtype=np.uint64)
+_SIGN = 1 << 63
+
+
+def _mix(h: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer; uint64 arithmetic wraps, which is what we want here
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def simhash(text: str, shingle: int = SHINGLE_WORDS) -> int:
+    """
+    64-bit SimHash of the text's word shingles (case-insensitive).
+    Word hashes are stable crc32s, so fingerprints can be persisted across runs.
+    """
+    words = text.lower().split()
+    if not words:
+        return 0
+    h = np.fromiter((zlib.crc32(w.encode()) for w in words), dtype=np.uint64, count=len(words))
+    n = min(shingle, len(words))
+    shingles = np.zeros(len(words) - n + 1, dtype=np.uint64)
+    for i in range(n):
+        shingles = _mix(shingles ^ h[i:len(h) - n + 1 + i])
+    votes = ((shingles[:, None] & _BITS) != 0).sum(axis=0)
+    return int(_BITS[votes * 2 > len(shingles)].sum())
+
+
+def _to_db(fp: int) -> int:
+    return fp - (1 << 64) if fp & _SIGN else fp  # SQLite integers are signed
+
+
+def _from_db(v: int) -> int:
+    return v + (1 << 64) if v < 0 else v
+
+
+class NearDuplicateFilter:
+    """
+    Drops chunks whose SimHash is within max_distance bits of a chunk already kept.
+    Near-identical chunks from several versions of the same PDF are caught this
+    way; consecutive overlapping chunks of one file are not.
+    Kept ("canonical") chunks and suppressed ones are recorded in a SQLite file.
+    A suppressed chunk is stored with a link to its canonical. If that canonical's
+    file is later removed, forget_files hands the chunk back for indexing.
+    A chunk kept on an earlier run that is now suppressed still has a copy in the
+    index; filter collects it in superseded so the caller can delete that copy.
+    Lookups use the pigeonhole trick: the 64 bits are cut into max_distance + 1
+    bands, and any fingerprint within max_distance bits matches one band exactly.
+    """
+
+    def __init__(self, path: str = DEDUP_INDEX_PATH, max_distance: int = DEDUP_MAX_DISTANCE):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_distance = max_distance
+        self.suppressed = 0
+        self.superseded: List[Dict] = []  # docs kept on an earlier run, suppressed now
+        n_bands = max_distance + 1
+        edges = [round(i * 64 / n_bands) for i in range(n_bands + 1)]
+        self._bands = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+        self._buckets: List[Dict[int, Set[str]]] = [{} for _ in self._bands]
+        self._fingerprints: Dict[str, int] = {}
+        self._pending: Dict[str, Tuple] = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "key TEXT PRIMARY KEY, file_path TEXT NOT NULL, fingerprint INTEGER NOT NULL, "
+            "duplicate_of TEXT, doc TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks(file_path)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_chunks_dup ON chunks(duplicate_of)")
+        for key, fp in self._db.execute("SELECT key, fingerprint FROM chunks WHERE duplicate_of IS NULL"):
+            self._add(key, _from_db(fp))
+
+    @staticmethod
+    def key(d: Dict) -> str:
+        return f"{d.get('file_path', '')}|{d['chunk_id']}"
+
+    # ---------- Band index ----------
+    def _band_values(self, fp: int):
+        return [(fp >> lo) & mask for lo, mask in self._bands]
+
+    def _add(self, key: str, fp: int) -> None:
+        self._remove(key)
+        self._fingerprints[key] = fp
+        for bucket, value in zip(self._buckets, self._band_values(fp)):
+            bucket.setdefault(value, set()).add(key)
+
+    def _remove(self, key: str) -> None:
+        fp = self._fingerprints.pop(key, None)
+        if fp is None:
+            return
+        for bucket, value in zip(self._buckets, self._band_values(fp)):
+            keys = bucket.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del bucket[value]
+
+    def _remove_all(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self._remove(key)
+
+    def find(self, fp: int, key: str) -> Optional[str]:
+        """Key of a kept chunk within max_distance bits of fp, other than key itself."""
+        for bucket, value in zip(self._buckets, self._band_values(fp)):
+            for other in bucket.get(value, ()):
+                if other != key and bin(fp ^ self._fingerprints[other]).count("1") <= self.max_distance:
+                    return other
+        return None
+
+    # ---------- Pipeline stage ----------
+    def filter(self, docs: Iterable[Dict]) -> Iterator[Dict]:
+        """Yield the docs that are not near-duplicates; count the rest in self.suppressed."""
+        for d in docs:
+            key = self.key(d)
+            fp = simhash(d["text"])
+            with self._lock:
+                canonical = self.find(fp, key)
+                if canonical is not None:
+                    if key in self._fingerprints:
+                        # Kept on an earlier run: its indexed copy has to go
+                        self._remove(key)
+                        self.superseded.append(d)
+                    self._pending[key] = (key, d.get("file_path", ""), _to_db(fp), canonical, json.dumps(d))
+                    self.suppressed += 1
+                    continue
+                self._add(key, fp)
+                self._pending[key] = (key, d.get("file_path", ""), _to_db(fp), None, None)
+            yield d
+
+    def commit(self) -> None:
+        """Persist the signatures seen by filter(); call once the chunks are indexed."""
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks (key, file_path, fingerprint, duplicate_of, doc) "
+                "VALUES (?, ?, ?, ?, ?)",
+                list(self._pending.values()),
+            )
+            self._db.commit()
+            self._pending.clear()
+
+    def forget_files(self, file_paths: Iterable[str]) -> List[Dict]:
+        """
+        Drop every signature of file_paths, e.g. files being deleted or re-ingested.
+        Returns the suppressed chunks of other files that were linked to them;
+        they have nothing left in the index and should be indexed again.
+        """
+        file_paths = list(file_paths)
+        with self._lock:
+            keys: List[str] = []
+            for batch in batches(file_paths):
+                marks = placeholders(batch)
+                keys += [k for (k,) in self._db.execute(f"SELECT key FROM chunks WHERE file_path IN ({marks})", batch)]
+            return self._forget(keys)
+
+    def forget_stale(self, chunk_counts: Dict[str, int]) -> List[Dict]:
+        """
+        Drop the signatures of chunks with chunk_id >= chunk_counts[file_path],
+        the ones delete_stale_chunks removes from the index. Call after commit().
+        Returns linked duplicates to index again, as forget_files does.
+        """
+        with self._lock:
+            keys: List[str] = []
+            for batch in batches(list(chunk_counts)):
+                marks = placeholders(batch)
+                keys += [k for k, file_path in self._db.execute(
+                    f"SELECT key, file_path FROM chunks WHERE file_path IN ({marks})", batch)
+                    if int(k.rsplit("|", 1)[1]) >= chunk_counts[file_path]]
+            return self._forget(keys)
+
+    def _forget(self, keys: List[str]) -> List[Dict]:
+        restored: List[Dict] = []
+        for batch in batches(keys):
+            self._remove_all(batch)
+            marks = placeholders(batch)
+            self._db.execute(f"DELETE FROM chunks WHERE key IN ({marks})", batch)
+            restored += [json.loads(doc) for (doc,) in self._db.execute(
+                f"SELECT doc FROM chunks WHERE duplicate_of IN ({marks}) AND doc IS NOT NULL", batch)]
+            self._db.execute(f"DELETE FROM chunks WHERE duplicate_of IN ({marks})", batch)
+        self._db.commit()
+        return restored
+
+    def stats(self) -> Dict[str, int]:
+        return {"suppressed": self.suppressed, "kept_signatures": len(self._fingerprints)}
+
+
+def open_dedup(path: str = DEDUP_INDEX_PATH) -> Optional[NearDuplicateFilter]:
+    """Open the configured signature index, or return None when RAG_DEDUP_INDEX is empty."""
+    if not path:
+        return None
+    return NearDuplicateFilter(path)
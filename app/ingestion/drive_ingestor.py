@@ -1,8 +1,14 @@
 # app/ingestion/drive_ingestor.py
 import io
+import json
 import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 from uuid import uuid4
 
 from google.oauth2 import service_account
@@ -12,13 +18,21 @@ from googleapiclient.errors import HttpError
 
 import PyPDF2
 
-from .pdf_ingestor import chunk_text, clean_text
+from .pdf_ingestor import chunk_spans, clean_text
+from ..core.metrics import count, span
 
 # ---- Config ----
 SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]
 CHUNK_SIZE = 300
 CHUNK_OVERLAP = 50
 SA_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "service_account.json")
+MANIFEST_DIR = os.getenv("RAG_DRIVE_MANIFEST_DIR", ".cache/drive")
+FILE_FIELDS = "id,name,webViewLink,mimeType,parents,trashed,modifiedTime,md5Checksum"
+PDF_MIME = "application/pdf"
+DRIVE_WORKERS = int(os.getenv("RAG_DRIVE_WORKERS", "8"))              # parallel downloads
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("RAG_DRIVE_CHUNK_SIZE", str(100 * 1024 * 1024)))
+DRIVE_MAX_RETRIES = int(os.getenv("RAG_DRIVE_MAX_RETRIES", "5"))
+RATE_LIMIT_REASONS = ("ratelimitexceeded", "userratelimitexceeded")
 
 
 # -------- Google Drive helpers --------
@@ -45,7 +59,7 @@ def list_pdfs_in_folder(
     query = f"'{folder_id}' in parents and mimeType='application/pdf' and trashed=false"
     params = {
         "q": query,
-        "fields": "nextPageToken, files(id,name,webViewLink)",
+        "fields": f"nextPageToken, files({FILE_FIELDS})",
         "pageSize": page_size,
     }
     if drive_id:
@@ -70,26 +84,237 @@ def list_pdfs_in_folder(
     return files
 
 
+def _drive_params(drive_id: Optional[str]) -> Dict:
+    if not drive_id:
+        return {}
+    return {"supportsAllDrives": True, "includeItemsFromAllDrives": True, "driveId": drive_id}
+
+
+def get_start_page_token(service, drive_id: Optional[str] = None) -> str:
+    """Token marking 'now' in the Drive changes feed."""
+    params = {"supportsAllDrives": True, "driveId": drive_id} if drive_id else {}
+    return service.changes().getStartPageToken(**params).execute()["startPageToken"]
+
+
+def list_changes(
+    service,
+    page_token: str,
+    drive_id: Optional[str] = None,
+    page_size: int = 1000,
+) -> Tuple[List[Dict], str]:
+    """
+    Fetch every change since page_token.
+    Returns (changes, new_start_page_token) where each change has fileId, removed
+    and (unless removed) file metadata.
+    """
+    params = {
+        "pageSize": page_size,
+        "includeRemoved": True,
+        "fields": f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))",
+    }
+    params.update(_drive_params(drive_id))
+
+    changes = []
+    while True:
+        resp = service.changes().list(pageToken=page_token, **params).execute()
+        changes.extend(resp.get("changes", []))
+        if "newStartPageToken" in resp:
+            return changes, resp["newStartPageToken"]
+        page_token = resp["nextPageToken"]
+
+
+def _is_retryable(e: HttpError) -> bool:
+    status = e.resp.status
+    if status == 429 or status >= 500:
+        return True
+    if status == 403:
+        content = (e.content or b"").decode("utf-8", errors="ignore").lower()
+        return any(reason in content for reason in RATE_LIMIT_REASONS)
+    return False
+
+
+def with_backoff(fn, max_retries: int = DRIVE_MAX_RETRIES, base_delay: float = 1.0):
+    """Call fn(), retrying Drive rate-limit (403/429) and 5xx errors with exponential backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except HttpError as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+        except (ConnectionError, TimeoutError):
+            if attempt == max_retries:
+                raise
+        time.sleep(min(base_delay * 2 ** attempt, 64) + random.uniform(0, 1))
+
+
+def download_pdf_bytes(service, file_id: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> io.BytesIO:
+    """Download a file by fileId into memory, restarting the download on retryable errors."""
+    def attempt() -> io.BytesIO:
+        request = service.files().get_media(fileId=file_id)
+        buf = io.BytesIO()
+        downloader = MediaIoBaseDownload(buf, request, chunksize=chunk_size)
+
+        done = False
+        while not done:
+            _, done = downloader.next_chunk()
+        buf.seek(0)
+        return buf
+
+    return with_backoff(attempt)
+
+
 def download_pdf_text(service, file_id: str) -> str:
     """Download a PDF by fileId and extract text (PyPDF2)."""
-    request = service.files().get_media(fileId=file_id)
-    buf = io.BytesIO()
-    downloader = MediaIoBaseDownload(buf, request)
+    with span("ingest.download"):
+        buf = download_pdf_bytes(service, file_id)
+    count("pdfs_downloaded")
+    with span("ingest.extract"):
+        reader = PyPDF2.PdfReader(buf)
+        text = []
+        for page in reader.pages:
+            # PyPDF2 returns None sometimes; coalesce to ""
+            text.append(page.extract_text() or "")
+        return clean_text("".join(text))
+
+
+def _file_documents(service, f: Dict) -> List[Dict]:
+    """Download, extract and chunk one Drive file into index-ready dicts."""
+    name = f.get("name", "unknown.pdf")
+    file_id = f["id"]
+    link = f.get("webViewLink")
+
+    raw_text = download_pdf_text(service, file_id)
+    if not raw_text.strip():
+        # Skip empty docs (often image-only PDFs)
+        return []
+
+    with span("ingest.chunk"):
+        spans = list(chunk_spans(raw_text, CHUNK_SIZE, CHUNK_OVERLAP))
+    count("chunks_extracted", len(spans))
+    return [
+        {
+            "id": str(uuid4()),
+            "text": raw_text[start:end],
+            "chunk_id": i,
+            "start_offset": start,
+            "end_offset": end,
+            "source_file": name,
+            "drive_url": link,
+            "file_path": f"drive://{file_id}",
+        }
+        for i, (start, end) in enumerate(spans)
+    ]
+
+
+def download_documents(
+    files: Iterable[Dict],
+    sa_json: str = SA_PATH,
+    workers: int = DRIVE_WORKERS,
+) -> Iterator[Tuple[Dict, List[Dict], Optional[Exception]]]:
+    """
+    Download and chunk files on a pool of worker threads.
+    Each worker gets its own authorized Drive client because the underlying
+    httplib2 transport is not thread-safe. Yields (file, documents, error) in
+    input order. error is set instead of raising, so one bad file does not stop
+    the rest. At most 2 * workers files are downloaded ahead of the consumer.
+    """
+    local = threading.local()
+
+    def work(f: Dict):
+        try:
+            if not hasattr(local, "service"):
+                local.service = drive_service(sa_json)
+            return f, _file_documents(local.service, f), None
+        except Exception as e:
+            return f, [], e
+
+    workers = max(1, workers)
+    files = iter(files)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        window: deque = deque()
+        for f in files:
+            window.append(pool.submit(work, f))
+            if len(window) >= workers * 2:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+
+def _report_error(f: Dict, e: Exception) -> None:
+    count("pdf_errors")
+    name = f.get("name", "unknown.pdf")
+    if isinstance(e, HttpError):
+        print(f"[Drive error] {name}: {e}")
+    else:
+        print(f"[Parse error] {name}: {e}")
+
 
-    done = False
-    while not done:
-        _, done = downloader.next_chunk()
+# -------- Manifest --------
+def manifest_path(folder_id: str) -> str:
+    return os.path.join(MANIFEST_DIR, f"{folder_id}.json")
 
-    buf.seek(0)
-    reader = PyPDF2.PdfReader(buf)
-    text = []
-    for page in reader.pages:
-        # PyPDF2 returns None sometimes; coalesce to ""
-        text.append(page.extract_text() or "")
-    return clean_text("".join(text))
+
+def load_manifest(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def save_manifest(path: str, manifest: Dict) -> None:
+    """Write the manifest atomically so a crash never leaves a half-written file."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(manifest, fh, indent=1)
+    os.replace(tmp, path)
+
+
+def _manifest_entry(f: Dict) -> Dict:
+    return {
+        "name": f.get("name"),
+        "modifiedTime": f.get("modifiedTime"),
+        "md5Checksum": f.get("md5Checksum"),
+    }
+
+
+def _unchanged(old: Optional[Dict], f: Dict) -> bool:
+    return bool(old) and old.get("md5Checksum") == f.get("md5Checksum") \
+        and old.get("modifiedTime") == f.get("modifiedTime")
+
+
+def _in_folder(f: Dict, folder_id: str) -> bool:
+    return (
+        not f.get("trashed", False)
+        and f.get("mimeType") == PDF_MIME
+        and folder_id in f.get("parents", [])
+    )
+
+
+# -------- Pipeline entrypoints --------
+def iter_drive_documents(
+    folder_id: str,
+    drive_id: Optional[str] = None,
+    sa_json: str = SA_PATH,
+) -> Iterator[Dict]:
+    """
+    Streaming form of process_drive_pdfs: lists the folder eagerly, then yields
+    chunk dicts file by file as downloads complete.
+    """
+    svc = drive_service(sa_json)
+    try:
+        with span("ingest.list"):
+            pdf_files = with_backoff(lambda: list_pdfs_in_folder(svc, folder_id, drive_id))
+    except HttpError as e:
+        raise RuntimeError(f"Drive list error: {e}") from e
+
+    with span("ingest.drive"):
+        for f, docs, err in download_documents(pdf_files, sa_json):
+            if err is not None:
+                _report_error(f, err)
+            yield from docs
 
 
-# -------- Pipeline entrypoint --------
 def process_drive_pdfs(
     folder_id: str,
     drive_id: Optional[str] = None,
@@ -102,39 +327,122 @@ def process_drive_pdfs(
     - chunk and attach metadata for indexing
     Returns a list of dicts: {id, text, chunk_id, source_file, drive_url, file_path}
     """
+    return list(iter_drive_documents(folder_id, drive_id, sa_json))
+
+
+def sync_drive_pdfs(
+    folder_id: str,
+    drive_id: Optional[str] = None,
+    sa_json: str = SA_PATH,
+    manifest_file: Optional[str] = None,
+) -> Dict:
+    """
+    Incremental variant of process_drive_pdfs.
+    The manifest stores fileId -> {name, modifiedTime, md5Checksum} plus a Drive
+    changes start page token. The first run lists the whole folder. Later runs
+    read only the changes feed and process files that were added or modified.
+    Files that changed, were trashed or left the folder are returned in
+    stale_file_paths so the caller can drop their old chunks.
+
+    Returns {documents, stale_file_paths, files, manifest, manifest_path}.
+    documents is a lazy iterator. The manifest's files and pending entries are
+    filled in as it is consumed. files maps each fileId being processed to its
+    Drive metadata. Pass the file paths that failed to index to requeue_files,
+    then call save_manifest(result["manifest_path"], result["manifest"]), only
+    after the documents are indexed. Otherwise a crash would lose those changes.
+    """
+    path = manifest_file or manifest_path(folder_id)
+    manifest = load_manifest(path)
+    known: Dict[str, Dict] = dict(manifest.get("files", {}))
+    # Files that failed last time are retried even if the feed does not mention them
+    pending: Dict[str, Dict] = dict(manifest.get("pending", {}))
+
     svc = drive_service(sa_json)
+    to_process: Dict[str, Dict] = {}
+    stale: set = set()
+
     try:
-        pdf_files = list_pdfs_in_folder(svc, folder_id, drive_id)
+        token = manifest.get("start_page_token")
+        if not token or manifest.get("folder_id") != folder_id:
+            # Take the token before listing so nothing changed mid-listing is missed
+            new_token = with_backoff(lambda: get_start_page_token(svc, drive_id))
+            with span("ingest.list"):
+                listed = {f["id"]: f for f in with_backoff(lambda: list_pdfs_in_folder(svc, folder_id, drive_id))}
+            stale.update(fid for fid in known if fid not in listed)
+            for fid, f in listed.items():
+                old = known.get(fid)
+                if _unchanged(old, f):
+                    continue
+                if old:
+                    stale.add(fid)
+                to_process[fid] = f
+        else:
+            with span("ingest.list"):
+                changes, new_token = with_backoff(lambda: list_changes(svc, token, drive_id))
+            for change in changes:
+                fid = change["fileId"]
+                f = change.get("file") or {}
+                if change.get("removed") or not _in_folder(f, folder_id):
+                    to_process.pop(fid, None)
+                    pending.pop(fid, None)
+                    if fid in known:
+                        stale.add(fid)
+                    continue
+                old = known.get(fid)
+                if _unchanged(old, f):
+                    continue
+                if old:
+                    stale.add(fid)
+                to_process[fid] = f
     except HttpError as e:
         raise RuntimeError(f"Drive list error: {e}") from e
 
-    documents: List[Dict] = []
-    for f in pdf_files:
-        name = f.get("name", "unknown.pdf")
-        file_id = f["id"]
-        link = f.get("webViewLink")
+    for fid, f in pending.items():
+        to_process.setdefault(fid, f)
+    for fid in stale:
+        known.pop(fid, None)
 
-        try:
-            raw_text = download_pdf_text(svc, file_id)
-            if not raw_text.strip():
-                # Skip empty docs (often image-only PDFs)
-                continue
-
-            chunks = chunk_text(raw_text, CHUNK_SIZE, CHUNK_OVERLAP)
-            for i, chunk in enumerate(chunks):
-                documents.append(
-                    {
-                        "id": str(uuid4()),
-                        "text": chunk,
-                        "chunk_id": i,
-                        "source_file": name,
-                        "drive_url": link,
-                        "file_path": f"drive://{file_id}",
-                    }
-                )
-        except HttpError as e:
-            print(f"[Drive error] {name}: {e}")
-        except Exception as e:
-            print(f"[Parse error] {name}: {e}")
+    failed: Dict[str, Dict] = {}
+
+    def documents() -> Iterator[Dict]:
+        with span("ingest.drive"):
+            for f, docs, err in download_documents(list(to_process.values()), sa_json):
+                if err is not None:
+                    _report_error(f, err)
+                    failed[f["id"]] = f
+                    continue
+                yield from docs
+                known[f["id"]] = _manifest_entry(f)
 
-    return documents
+    return {
+        "documents": documents(),
+        "stale_file_paths": [f"drive://{fid}" for fid in sorted(stale)],
+        "files": to_process,
+        "manifest": {
+            "folder_id": folder_id,
+            "drive_id": drive_id,
+            "start_page_token": new_token,
+            "files": known,
+            "pending": failed,
+        },
+        "manifest_path": path,
+    }
+
+
+def requeue_files(sync: Dict, file_paths: Iterable[str]) -> int:
+    """
+    Move files of a sync_drive_pdfs result back to the manifest's pending set,
+    e.g. the files index_documents could not fully index, so the next
+    incremental sync processes them again. Returns how many were requeued.
+    """
+    manifest = sync["manifest"]
+    n = 0
+    for path in file_paths:
+        fid = path[len("drive://"):] if path.startswith("drive://") else None
+        f = sync["files"].get(fid)
+        if f is None:
+            continue
+        manifest["files"].pop(fid, None)
+        manifest["pending"][fid] = f
+        n += 1
+    return n
@@ -0,0 +1,108 @@
+# app/ingestion/normalize.py
+import json
+import os
+import re
+from typing import Dict, Optional
+
+# Common OCR spacing/character mistakes (pattern -> replacement, case-insensitive)
+DEFAULT_OCR_FIXES = {
+    r'Binar y Se ar c h': 'Binary Search',
+    r'Se ar c hin g': 'Searching',
+    r'Algor ithms': 'Algorithms',
+    r'Line ar Se ar c h': 'Linear Search',
+    r'C omple xit y': 'Complexity',
+    r'element s': 'elements',
+    r'arra y': 'array',
+    r'v al u e': 'value',
+    r'adjac ent': 'adjacent',
+    r'uns or t ed': 'unsorted',
+    r's or t ed': 'sorted',
+    r'rn': 'm',  # Common OCR mistake
+    r'cl': 'd',  # Another common mistake
+}
+
+OCR_FIXES_PATH = os.getenv("RAG_OCR_FIXES", "")  # JSON file of {pattern: replacement}
+
+
+_REGEX_META = set(".^$*+?{}[]\\|()")
+
+
+def _is_literal(pattern: str) -> bool:
+    return not (set(pattern) & _REGEX_META)
+
+
+def _trie_pattern(words) -> str:
+    """Factor literal words into a prefix-trie regex, e.g. ab, ac, b -> (?:a(?:b|c)|b)."""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:  # a word ends here; prefer the longer continuation
+            return ("(?:" + body + ")?") if len(branches) == 1 else body + "?"
+        return body
+
+    return build(trie)
+
+
+class TextNormalizer:
+    """
+    Compiled replacement for the chain of re.sub calls in clean_text.
+    All OCR fixes are compiled once into a single pattern and applied in one
+    scan; whitespace (and NUL bytes) is then collapsed with C-level str ops.
+    Plain-literal fix tables (the default) are factored into a prefix trie, so
+    the regex engine tests one branch per leading character instead of every
+    fix at every position. Tables containing regex syntax fall back to a
+    named-group alternation.
+    The output matches the old sequential version except where fixes overlap:
+    the leftmost match wins (the longest one, for literals sharing a start).
+    """
+
+    def __init__(self, fixes: Optional[Dict[str, str]] = None):
+        fixes = DEFAULT_OCR_FIXES if fixes is None else fixes
+        self.fixes = dict(fixes)
+        self._replacements: Dict[str, str] = {}
+        self._pattern = None
+        if not self.fixes:
+            return
+        if all(_is_literal(p) for p in self.fixes):
+            # Matches are looked up by their lowercased text
+            for pattern, replacement in self.fixes.items():
+                self._replacements.setdefault(pattern.lower(), replacement)
+            self._pattern = re.compile(_trie_pattern(self._replacements), re.IGNORECASE)
+            self._replace = self._replace_literal
+        else:
+            parts = []
+            for i, (pattern, replacement) in enumerate(self.fixes.items()):
+                name = f"f{i}"
+                parts.append(f"(?P<{name}>{pattern})")
+                self._replacements[name] = replacement
+            self._pattern = re.compile("|".join(parts), re.IGNORECASE)
+
+    @classmethod
+    def from_file(cls, path: str) -> "TextNormalizer":
+        with open(path) as fh:
+            return cls(json.load(fh))
+
+    def _replace(self, m: re.Match) -> str:
+        return self._replacements[m.lastgroup]
+
+    def _replace_literal(self, m: re.Match) -> str:
+        return self._replacements[m.group(0).lower()]
+
+    def __call__(self, text: str) -> str:
+        if self._pattern is not None:
+            text = self._pattern.sub(self._replace, text)
+        return " ".join(text.replace("\x00", " ").split())
+
+
+def load_normalizer(path: str = OCR_FIXES_PATH) -> TextNormalizer:
+    """Normalizer built from RAG_OCR_FIXES if set, otherwise the built-in fixes."""
+    return TextNormalizer.from_file(path) if path else TextNormalizer()
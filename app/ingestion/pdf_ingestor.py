@@ -1,84 +1,176 @@
+import os
 import re
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from functools import lru_cache
 import PyPDF2
 import fitz  # PyMuPDF
 from PIL import Image
 import pytesseract
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 from uuid import uuid4
 
+from .normalize import load_normalizer
+
 CHUNK_SIZE = 300
 CHUNK_OVERLAP = 50
+PDF_WORKERS = int(os.getenv("RAG_PDF_WORKERS", str(os.cpu_count() or 1)))
+OCR_MIN_CHARS = 50  # pages with less extracted text than this are OCR'd
+
+_normalizer = load_normalizer()
 
 def clean_text(t: str) -> str:
-    # Fix OCR spacing issues first
-    ocr_fixes = {
-        r'Binar y Se ar c h': 'Binary Search',
-        r'Se ar c hin g': 'Searching', 
-        r'Algor ithms': 'Algorithms',
-        r'Line ar Se ar c h': 'Linear Search',
-        r'C omple xit y': 'Complexity',
-        r'element s': 'elements',
-        r'arra y': 'array',
-        r'v al u e': 'value',
-        r'adjac ent': 'adjacent',
-        r'uns or t ed': 'unsorted',
-        r's or t ed': 'sorted',
-        r'rn': 'm',  # Common OCR mistake
-        r'cl': 'd',  # Another common mistake
-        r'\s+': ' '  # Multiple spaces
-    }
-    
-    for pattern, replacement in ocr_fixes.items():
-        t = re.sub(pattern, replacement, t, flags=re.IGNORECASE)
-    
-    # Standard cleaning
-    t = t.replace("\x00", " ")
-    t = re.sub(r"[ \t]+", " ", t)
-    t = re.sub(r"\n{2,}", "\n", t)
-    return t.strip()
+    """Apply OCR fixes and collapse whitespace (see normalize.TextNormalizer)."""
+    return _normalizer(t)
+
+_WORD = re.compile(r"\S+")
+_NON_SPACE = re.compile(r"\S")
+SENTENCE_ENDS = ".!?"
+SENTENCE_MIN_FILL = 0.5  # never cut a chunk at a sentence end before it is this full
+
+@lru_cache(maxsize=None)
+def _words(n: int) -> "re.Pattern":
+    """Pattern matching up to n whitespace-separated words, starting at a word."""
+    return re.compile(r"\S+(?:\s+\S+){0,%d}" % (n - 1))
+
+def _sentence_end(text: str, lo: int, hi: int) -> int:
+    """Offset just past the last word in text[lo:hi] that ends a sentence, or -1."""
+    best = -1
+    for ch in SENTENCE_ENDS:
+        i = text.rfind(ch, lo, hi)
+        while i >= 0 and i + 1 < hi and not text[i + 1].isspace():  # e.g. "3.14"
+            i = text.rfind(ch, lo, i)
+        best = max(best, i)
+    return best + 1 if best >= 0 else -1
+
+def chunk_spans(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[int, int]]:
+    """
+    Yield (start, end) character offsets of chunks of up to chunk_size words.
+    Consecutive chunks share overlap words, as in the old word-list version.
+    A chunk that would end mid-sentence is cut back to the last sentence end
+    in its second half, if there is one. Word runs are skipped with compiled
+    patterns, so no word list is built and no text is copied.
+    """
+    m = _NON_SPACE.search(text)
+    if m is None:
+        return
+    pos = m.start()
+    min_words = max(1, int(chunk_size * SENTENCE_MIN_FILL))
+    while True:
+        end = _words(chunk_size).match(text, pos).end()
+        m = _NON_SPACE.search(text, end)
+        if m is None:  # last chunk takes the rest of the text
+            yield pos, end
+            return
+        n_words = chunk_size
+        cut = _sentence_end(text, _words(min_words).match(text, pos).end() - 1, end)
+        if cut > 0:
+            end = cut
+            n_words = sum(1 for _ in _WORD.finditer(text, pos, end))
+        yield pos, end
+        skipped = _words(max(1, n_words - overlap)).match(text, pos).end()
+        pos = _NON_SPACE.search(text, skipped).start()
 
 def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
-    words = text.split()
-    chunks = []
-    i = 0
-    while i < len(words):
-        chunk = words[i:i+chunk_size]
-        if not chunk: break
-        chunks.append(" ".join(chunk))
-        i += max(1, chunk_size - overlap)
-    return chunks
+    return [text[start:end] for start, end in chunk_spans(text, chunk_size, overlap)]
+
+def _extract_pages(file_path: str) -> List[str]:
+    """Text of every page via PyMuPDF; raises if the file cannot be parsed."""
+    doc = fitz.open(file_path)
+    try:
+        return [page.get_text() for page in doc]
+    finally:
+        doc.close()
+
+def _needs_ocr(text: str) -> bool:
+    return len(text.strip()) < OCR_MIN_CHARS
+
+def _ocr_page(file_path: str, page_no: int) -> Optional[str]:
+    """Render one page and OCR it. Returns None if OCR fails."""
+    try:
+        doc = fitz.open(file_path)
+        try:
+            pix = doc[page_no].get_pixmap()
+            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        finally:
+            doc.close()
+        return pytesseract.image_to_string(img)
+    except:
+        return None  # OCR failed, use what we have
+
+def _join_pages(pages: List[str], ocr: Dict[int, Optional[str]]) -> str:
+    full_text = ""
+    for i, text in enumerate(pages):
+        if ocr.get(i) is not None:
+            text += " " + ocr[i]
+        full_text += text + "\n"
+    return full_text
 
 def read_pdf_with_ocr(file_path: str) -> str:
     """Extract text with OCR fallback for scanned/handwritten content"""
     try:
         # Try PyMuPDF first (better than PyPDF2)
-        doc = fitz.open(file_path)
-        full_text = ""
-        
-        for page in doc:
-            # Extract text normally
-            text = page.get_text()
-            
-            # If little text found, try OCR
-            if len(text.strip()) < 50:
-                try:
-                    pix = page.get_pixmap()
-                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    ocr_text = pytesseract.image_to_string(img)
-                    text += " " + ocr_text
-                except:
-                    pass  # OCR failed, use what we have
-            
-            full_text += text + "\n"
-        
-        doc.close()
-        return clean_text(full_text)
-        
+        pages = _extract_pages(file_path)
+        # If little text found on a page, try OCR
+        ocr = {i: _ocr_page(file_path, i) for i, text in enumerate(pages) if _needs_ocr(text)}
+        return clean_text(_join_pages(pages, ocr))
     except:
         # Fallback to PyPDF2 if PyMuPDF fails
         return read_pdf_fallback(file_path)
 
+def read_pdfs(paths: Iterable[str], workers: int = PDF_WORKERS) -> Iterator[Tuple[str, str]]:
+    """
+    Parallel read_pdf over many files, yielding (path, text) as each file completes.
+    Files are parsed in a process pool. The pages that need OCR are then
+    submitted to the same pool as separate jobs, so one scanned book can use
+    every core. Per-file results match read_pdf: page order is kept, and a
+    file PyMuPDF cannot open falls back to PyPDF2. At most 2 * workers files
+    are in flight at once.
+    """
+    if workers <= 1:
+        for path in paths:
+            yield path, read_pdf(path)
+        return
+
+    paths = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        extracting: Dict[Future, str] = {}
+        ocr_jobs: Dict[str, Tuple[List[str], Dict[int, Future]]] = {}
+
+        def fill():
+            while len(extracting) + len(ocr_jobs) < workers * 2:
+                path = next(paths, None)
+                if path is None:
+                    return
+                extracting[pool.submit(_extract_pages, path)] = path
+
+        fill()
+        while extracting or ocr_jobs:
+            running = set(extracting)
+            for _, jobs in ocr_jobs.values():
+                running.update(jobs.values())
+            wait(running, return_when=FIRST_COMPLETED)
+
+            for fut in [f for f in extracting if f.done()]:
+                path = extracting.pop(fut)
+                try:
+                    pages = fut.result()
+                except Exception:
+                    yield path, read_pdf_fallback(path)
+                    continue
+                jobs = {i: pool.submit(_ocr_page, path, i) for i, text in enumerate(pages) if _needs_ocr(text)}
+                ocr_jobs[path] = (pages, jobs)
+
+            for path in [p for p, (_, jobs) in ocr_jobs.items() if all(f.done() for f in jobs.values())]:
+                pages, jobs = ocr_jobs.pop(path)
+                try:
+                    text = clean_text(_join_pages(pages, {i: f.result() for i, f in jobs.items()}))
+                except Exception:
+                    text = read_pdf_fallback(path)
+                yield path, text
+
+            fill()
+
 def read_pdf_fallback(file_path: str) -> str:
     """Fallback PDF reader using PyPDF2"""
     with open(file_path, "rb") as f:
@@ -90,17 +182,21 @@ def read_pdf(file_path: str) -> str:
     """Main PDF reading function with OCR support"""
     return read_pdf_with_ocr(file_path)
 
-def process_pdfs(pdf_dir: str) -> List[Dict]:
-    documents = []
-    for pdf_file in Path(pdf_dir).glob("*.pdf"):
-        text = read_pdf(str(pdf_file))
-        for i, chunk in enumerate(chunk_text(text)):
-            documents.append({
+def iter_pdf_documents(pdf_dir: str, workers: int = PDF_WORKERS) -> Iterator[Dict]:
+    """Lazily yield index-ready chunk dicts for every PDF in pdf_dir."""
+    for path, text in read_pdfs((str(p) for p in Path(pdf_dir).glob("*.pdf")), workers):
+        pdf_file = Path(path)
+        for i, (start, end) in enumerate(chunk_spans(text)):
+            yield {
                 "id": str(uuid4()),
-                "text": chunk,
+                "text": text[start:end],
                 "chunk_id": i,
+                "start_offset": start,
+                "end_offset": end,
                 "source_file": pdf_file.name,
                 "file_path": str(pdf_file.resolve()),
                 "drive_url": "",
-            })
-    return documents
+            }
+
+def process_pdfs(pdf_dir: str, workers: int = PDF_WORKERS) -> List[Dict]:
+    return list(iter_pdf_documents(pdf_dir, workers))
@@ -0,0 +1,79 @@
+# app/ingestion/pipeline.py
+import os
+import queue
+import threading
+from typing import Dict, Iterable, Iterator, Optional
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("RAG_PIPELINE_QUEUE_SIZE", "1000"))  # chunks buffered between stages
+
+_DONE = object()
+
+
+class CountingIterator:
+    """
+    Pass chunks through while counting them (and keeping the first one for summaries).
+    chunks_per_file maps each file_path seen to its number of chunks, for
+    elasticsearch_indexer.delete_stale_chunks.
+    """
+
+    def __init__(self, items: Iterable[Dict]):
+        self._items = iter(items)
+        self.count = 0
+        self.first: Optional[Dict] = None
+        self.chunks_per_file: Dict[str, int] = {}
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Dict:
+        item = next(self._items)
+        if self.first is None:
+            self.first = item
+        self.count += 1
+        file_path = item.get("file_path", "")
+        self.chunks_per_file[file_path] = max(self.chunks_per_file.get(file_path, 0), item["chunk_id"] + 1)
+        return item
+
+
+def prefetch(items: Iterable, maxsize: int = PIPELINE_QUEUE_SIZE) -> Iterator:
+    """
+    Run the producer side of items on a background thread, feeding a bounded queue.
+    Extraction and indexing overlap this way. The queue bound stops the
+    producer when the indexer falls behind, so memory depends on maxsize,
+    not on corpus size. Producer exceptions are re-raised in the consumer.
+    """
+    q: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    worker = threading.Thread(target=produce, name="ingest-producer", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # Consumer finished or failed: unblock and stop the producer
+        stop.set()
+        worker.join(timeout=1)
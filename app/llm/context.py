@@ -0,0 +1,132 @@
+# app/llm/context.py
+import os
+import re
+from typing import Dict, List, Optional
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "3000"))  # prompt tokens for retrieved context
+CHARS_PER_TOKEN = 4.0         # rough average for English text with the llama3 tokenizer
+MIN_PARTIAL_TOKENS = 50       # don't bother adding a truncated block smaller than this
+MAX_OVERLAP_WORDS = 200       # longest word overlap looked for when chunks have no offsets
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def _join_overlapping(left: str, right: str) -> str:
+    """Concatenate two consecutive chunks, dropping the words right repeats from left's end."""
+    lw = left.split()
+    rw = right.split(maxsplit=MAX_OVERLAP_WORDS)[:MAX_OVERLAP_WORDS]
+    for n in range(min(len(lw), len(rw)), 0, -1):
+        if lw[-n:] == rw[:n]:
+            rest = right.split(maxsplit=n)
+            return left if len(rest) <= n else f"{left} {rest[n]}"
+    return f"{left} {right}"
+
+
+class _Block:
+    """A run of adjacent chunks of one file, merged into a single context passage."""
+
+    def __init__(self, rank: int, hit: Dict):
+        self.rank = rank
+        self.citations = [rank + 1]
+        self.source_file = hit.get("source_file")
+        self.last_chunk = hit.get("chunk_id")
+        self.start: Optional[int] = hit.get("start_offset")
+        self.end: Optional[int] = hit.get("end_offset")
+        self.text = hit.get("text") or ""
+
+    def follows(self, hit: Dict) -> bool:
+        """True if hit continues this block (next chunk id, or overlapping offsets)."""
+        if hit.get("chunk_id") is None or self.last_chunk is None:
+            return False
+        if self.end is not None and hit.get("start_offset") is not None:
+            return hit["start_offset"] <= self.end
+        return hit["chunk_id"] == self.last_chunk + 1
+
+    def extend(self, rank: int, hit: Dict) -> None:
+        text = hit.get("text") or ""
+        if self.end is not None and hit.get("start_offset") is not None:
+            # Offsets point into the same cleaned document: cut the shared span exactly
+            overlap = self.end - hit["start_offset"]
+            if hit.get("end_offset", 0) > self.end:
+                self.text = self.text + text[overlap:] if overlap > 0 else f"{self.text} {text}"
+            self.end = max(self.end, hit.get("end_offset", self.end))
+        else:
+            self.text = _join_overlapping(self.text, text)
+            self.end = None
+        self.rank = min(self.rank, rank)
+        self.citations.append(rank + 1)
+        self.last_chunk = hit["chunk_id"]
+
+
+def _merge(hits: List[Dict]) -> List[_Block]:
+    by_file: Dict[object, List] = {}
+    for rank, h in enumerate(hits):
+        by_file.setdefault(h.get("source_file"), []).append((rank, h))
+
+    blocks: List[_Block] = []
+    for members in by_file.values():
+        members.sort(key=lambda m: (m[1].get("chunk_id") is None, m[1].get("chunk_id") or 0))
+        block: Optional[_Block] = None
+        for rank, h in members:
+            if block is not None and block.follows(h):
+                block.extend(rank, h)
+            else:
+                block = _Block(rank, h)
+                blocks.append(block)
+    blocks.sort(key=lambda b: b.rank)
+    return blocks
+
+
+def _dedupe_sentences(text: str, seen: set) -> str:
+    kept = []
+    for sentence in _SENTENCE_SPLIT.split(text):
+        key = " ".join(sentence.lower().split())
+        if key and key in seen:
+            continue
+        seen.add(key)
+        kept.append(sentence)
+    return " ".join(kept)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Longest prefix of whole sentences that fits max_tokens (hard cut if none does)."""
+    limit = int(max_tokens * CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    cut = max((m.start() for m in _SENTENCE_SPLIT.finditer(text, 0, limit)), default=0)
+    return text[:cut] if cut else text[:limit].rsplit(" ", 1)[0]
+
+
+def pack_contexts(hits: List[Dict], token_budget: int = CONTEXT_TOKEN_BUDGET) -> List[str]:
+    """
+    Turn ranked retrieval hits into as few context passages as possible.
+    1. Adjacent or overlapping chunks of the same source_file are merged. Text
+       they share is kept once, using start/end offsets when the chunks have them.
+    2. Sentences already used by a better-ranked passage are dropped.
+    3. Passages are added in rank order until token_budget is spent. The
+       first one that does not fit is cut at a sentence boundary.
+    Each passage is labelled with the citation numbers (1-based positions in
+    hits, as /query returns them) of the chunks it came from.
+    """
+    passages: List[str] = []
+    seen: set = set()
+    remaining = token_budget
+    for block in _merge(hits):
+        text = _dedupe_sentences(block.text, seen)
+        if not text:
+            continue
+        label = "".join(f"[{c}]" for c in sorted(block.citations))
+        header = f"{label} {block.source_file}\n" if block.source_file else f"{label}\n"
+        cost = estimate_tokens(header) + estimate_tokens(text)
+        if cost > remaining:
+            room = remaining - estimate_tokens(header)
+            if room >= MIN_PARTIAL_TOKENS:
+                passages.append(header + _truncate(text, room))
+            break
+        passages.append(header + text)
+        remaining -= cost
+    return passages
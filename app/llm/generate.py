@@ -1,22 +1,142 @@
 # app/llm/generate.py
-import requests, json
+import requests, json, os, time
+import httpx
+from typing import AsyncIterator, Dict, Optional, Union
 
-OLLAMA_URL = "http://127.0.0.1:11434/api/generate"
+from .context import pack_contexts
+from ..core.metrics import count, observe, span
+
+OLLAMA_URL = os.getenv("RAG_OLLAMA_URL", "http://127.0.0.1:11434/api/generate")
+OLLAMA_MODEL = os.getenv("RAG_OLLAMA_MODEL", "llama3")
+OLLAMA_KEEP_ALIVE = os.getenv("RAG_OLLAMA_KEEP_ALIVE", "30m")        # "-1" keeps the model loaded forever
+OLLAMA_OPTIONS = json.loads(os.getenv("RAG_OLLAMA_OPTIONS", "{}"))   # e.g. {"temperature": 0.1, "num_ctx": 4096}
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("RAG_OLLAMA_MAX_CONNECTIONS", "32"))
+OLLAMA_MAX_KEEPALIVE = int(os.getenv("RAG_OLLAMA_MAX_KEEPALIVE", "16"))
+OLLAMA_TIMEOUT = float(os.getenv("RAG_OLLAMA_TIMEOUT", "300"))
 SYSTEM = "You are a helpful assistant. Answer questions using ONLY the provided context. If the context contains information that directly answers the question, provide a complete answer. If the context does not contain relevant information to answer the question, respond with 'I don't know.' Do not use any knowledge outside the provided context."
 
-def build_prompt(question: str, contexts: list[str]) -> str:
-    context_block = "\n\n---\n\n".join(contexts)
-    return f"{SYSTEM}\n\nContext:\n{context_block}\n\nQuestion:\n{question}\n\nAnswer concisely."
+def build_user_prompt(question: str, contexts: Union[list[str], list[Dict]]) -> str:
+    """
+    The per-request part of the prompt; send SYSTEM separately as system=SYSTEM.
+    contexts may be plain strings (joined verbatim) or ranked retrieval hits.
+    Hits are first packed by context.pack_contexts: overlapping chunks merged,
+    repeated sentences dropped, trimmed to RAG_CONTEXT_TOKEN_BUDGET.
+    """
+    with span("prompt.build"):
+        if contexts and isinstance(contexts[0], dict):
+            contexts = pack_contexts(contexts)
+        context_block = "\n\n---\n\n".join(contexts)
+    return f"Context:\n{context_block}\n\nQuestion:\n{question}\n\nAnswer concisely."
+
+def build_prompt(question: str, contexts: Union[list[str], list[Dict]]) -> str:
+    """SYSTEM and the user prompt as one raw prompt (for callers that don't pass system=)."""
+    return f"{SYSTEM}\n\n{build_user_prompt(question, contexts)}"
 
-def ollama_generate(model: str, prompt: str) -> str:
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": False
-    }
+def _keep_alive():
+    # Ollama takes a duration string ("30m") or a number of seconds (-1 = forever)
     try:
-        r = requests.post(OLLAMA_URL, json=payload, timeout=300)
-        r.raise_for_status()
-        return r.json().get("response", "").strip()
+        return int(OLLAMA_KEEP_ALIVE)
+    except ValueError:
+        return OLLAMA_KEEP_ALIVE
+
+def _payload(model: str, prompt: str, stream: bool, system: Optional[str] = None, **options) -> Dict:
+    """
+    Request body for /api/generate. A constant system string is rendered by the
+    model template ahead of the prompt. Every request then starts with the same
+    tokens, and Ollama reuses their KV cache from the previous request instead of
+    prefilling them again. keep_alive keeps the model (and that cache) resident
+    between queries.
+    """
+    payload = {"model": model, "prompt": prompt, "stream": stream, "keep_alive": _keep_alive()}
+    if system is not None:
+        payload["system"] = system
+    if OLLAMA_OPTIONS or options:
+        payload["options"] = OLLAMA_OPTIONS | options
+    return payload
+
+def _count_tokens(result: Dict) -> None:
+    # prompt_eval_count drops when Ollama reuses a cached prompt prefix
+    count("llm_prompt_tokens", result.get("prompt_eval_count") or 0)
+    count("llm_tokens", result.get("eval_count") or 0)
+
+_session = requests.Session()  # reuse the HTTP connection across sync calls
+
+def ollama_generate(model: str, prompt: str, system: Optional[str] = None) -> str:
+    payload = _payload(model, prompt, False, system)
+    try:
+        with span("llm.generate"):
+            r = _session.post(OLLAMA_URL, json=payload, timeout=OLLAMA_TIMEOUT)
+            r.raise_for_status()
+        result = r.json()
+        _count_tokens(result)
+        return result.get("response", "").strip()
+    except Exception as e:
+        return f"Error: {e}"
+
+# ---------- Async client ----------
+_async_client: Optional[httpx.AsyncClient] = None
+
+def get_async_client() -> httpx.AsyncClient:
+    """Shared keep-alive client, so requests reuse pooled connections to Ollama."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=10.0),
+        )
+    return _async_client
+
+async def aclose_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+async def ollama_agenerate(model: str, prompt: str, system: Optional[str] = None) -> str:
+    payload = _payload(model, prompt, False, system)
+    try:
+        with span("llm.generate"):
+            r = await get_async_client().post(OLLAMA_URL, json=payload)
+            r.raise_for_status()
+        result = r.json()
+        _count_tokens(result)
+        return result.get("response", "").strip()
     except Exception as e:
         return f"Error: {e}"
+
+async def ollama_awarmup(model: str, system: Optional[str] = SYSTEM) -> None:
+    """
+    Load model into Ollama's memory and prefill the system prefix, so the first
+    real query finds both cached. Raises on failure.
+    """
+    payload = _payload(model, "Ready?", False, system, num_predict=1)
+    r = await get_async_client().post(OLLAMA_URL, json=payload)
+    r.raise_for_status()
+
+async def ollama_agenerate_stream(model: str, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Yield response tokens as Ollama produces them. Closing the generator (e.g. when
+    the HTTP client disconnects) closes the stream and Ollama stops generating.
+    """
+    payload = _payload(model, prompt, True, system)
+    start, first = time.perf_counter(), True
+    async with get_async_client().stream("POST", OLLAMA_URL, json=payload) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            if chunk.get("response"):
+                if first:
+                    observe("llm.first_token", start)
+                    first = False
+                yield chunk["response"]
+            if chunk.get("done"):
+                observe("llm.stream", start)
+                _count_tokens(chunk)
+                return
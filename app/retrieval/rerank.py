@@ -0,0 +1,62 @@
+# app/retrieval/rerank.py
+import asyncio
+import hashlib
+import os
+import time
+from typing import Dict, List, Optional
+
+from .cache import LRUCache
+from .search import normalize_query
+from ..core.registry import RERANK_MODEL, get_reranker
+
+RERANK_POOL = int(os.getenv("RAG_RERANK_POOL", "30"))               # candidates retrieved before reranking
+RERANK_BATCH_SIZE = int(os.getenv("RAG_RERANK_BATCH_SIZE", "16"))   # (query, chunk) pairs per model call
+RERANK_BUDGET_MS = float(os.getenv("RAG_RERANK_BUDGET_MS", "300"))  # per-request time budget
+RERANK_CACHE_SIZE = int(os.getenv("RAG_RERANK_CACHE_SIZE", "20000"))
+
+pair_scores = LRUCache(maxsize=RERANK_CACHE_SIZE)
+
+
+def _pair_key(query: str, text: str) -> tuple:
+    return (RERANK_MODEL, normalize_query(query, RERANK_MODEL), hashlib.sha1(text.encode()).hexdigest())
+
+
+def rerank(query: str, hits: List[Dict], k: int = 5, budget_ms: float = RERANK_BUDGET_MS) -> List[Dict]:
+    """
+    Re-order retrieval hits by cross-encoder relevance and return the best k.
+    Cached pair scores are used first. The rest are scored in batches, in
+    retrieval order, until budget_ms runs out. Hits left unscored keep their
+    retrieval order after the scored ones. Each scored hit gets a
+    rerank_score; "score" keeps the retrieval score the min_score filter uses.
+    If the model cannot be loaded, the retrieval order is returned unchanged.
+    """
+    if not hits:
+        return []
+    try:
+        model = get_reranker()
+    except Exception:
+        return hits[:k]
+
+    keys = [_pair_key(query, h.get("text") or "") for h in hits]
+    scores: List[Optional[float]] = [pair_scores.get(key) for key in keys]
+    todo = [i for i, s in enumerate(scores) if s is None]
+
+    start = time.perf_counter()
+    for b in range(0, len(todo), RERANK_BATCH_SIZE):
+        if b and (time.perf_counter() - start) * 1000 > budget_ms:
+            break
+        idx = todo[b:b + RERANK_BATCH_SIZE]
+        batch = model.predict([(query, hits[i].get("text") or "") for i in idx], batch_size=RERANK_BATCH_SIZE)
+        for i, score in zip(idx, batch):
+            scores[i] = float(score)
+            pair_scores.put(keys[i], scores[i])
+
+    scored = sorted((i for i, s in enumerate(scores) if s is not None), key=lambda i: scores[i], reverse=True)
+    unscored = [i for i, s in enumerate(scores) if s is None]
+    return [hits[i] | {"rerank_score": scores[i]} for i in scored + unscored][:k]
+
+
+async def arerank(query: str, hits: List[Dict], k: int = 5, budget_ms: float = RERANK_BUDGET_MS) -> List[Dict]:
+    """rerank on a worker thread, so the CPU-bound model call never blocks the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, rerank, query, hits, k, budget_ms)
@@ -0,0 +1,112 @@
+# app/retrieval/result_cache.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .cache import LRUCache
+from ..indexing.generation import current_generation
+
+RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024"))   # in-process entries, 0 disables
+RESULT_CACHE_TTL = float(os.getenv("RAG_RESULT_CACHE_TTL", "0"))      # seconds, 0 = until next ingest
+RESULT_CACHE_PATH = os.getenv("RAG_RESULT_CACHE_PATH", "")            # SQLite file shared by workers
+RESULT_CACHE_SHARED_MAX = int(os.getenv("RAG_RESULT_CACHE_SHARED_MAX", "20000"))
+
+
+class SharedResultStore:
+    """
+    SQLite-backed store so several uvicorn workers on one host share cached results.
+    Rows from older index generations are dropped as soon as a newer one is written.
+    """
+
+    def __init__(self, path: str, max_entries: int = RESULT_CACHE_SHARED_MAX):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, generation INTEGER NOT NULL, expires REAL NOT NULL, value TEXT NOT NULL)"
+        )
+        self._last_generation = -1
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        with self._lock:
+            row = self._db.execute("SELECT expires, value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[0] and row[0] < time.time()):
+            return None
+        return json.loads(row[1])
+
+    def put(self, key: str, generation: int, value: List[Dict], ttl: float) -> None:
+        expires = time.time() + ttl if ttl > 0 else 0.0
+        with self._lock:
+            if generation != self._last_generation:
+                self._db.execute("DELETE FROM results WHERE generation < ?", (generation,))
+                self._last_generation = generation
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, generation, expires, value) VALUES (?, ?, ?, ?)",
+                (key, generation, expires, json.dumps(value)),
+            )
+            # Oldest rows (lowest rowid) go first once the table is over budget
+            self._db.execute(
+                "DELETE FROM results WHERE rowid <= (SELECT MAX(rowid) FROM results) - ?",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+
+class ResultCache:
+    """
+    Cache of retrieval results keyed by (kind, query, k, index generation).
+    index_documents bumps the generation on every write. Entries cached
+    before an ingest can never be returned after it.
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL,
+                 shared_path: str = RESULT_CACHE_PATH):
+        self.ttl = ttl
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.shared = SharedResultStore(shared_path) if shared_path and maxsize > 0 else None
+
+    def _lookup(self, kind: str, query: str, k: int) -> Tuple[str, int, Optional[List[Dict]]]:
+        generation = current_generation()
+        key = json.dumps([kind, " ".join(query.split()), k, generation])
+
+        hits = self.local.get(key)
+        if hits is None and self.shared is not None:
+            hits = self.shared.get(key)
+            if hits is not None:
+                self.local.put(key, hits)
+        return key, generation, None if hits is None else [dict(h) for h in hits]
+
+    def _store(self, key: str, generation: int, hits: List[Dict]) -> None:
+        if hits:  # don't pin empty results from a transient ES failure
+            self.local.put(key, [dict(h) for h in hits])
+            if self.shared is not None:
+                self.shared.put(key, generation, hits, self.ttl)
+
+    def get_or_compute(self, kind: str, query: str, k: int, compute: Callable[[], List[Dict]]) -> List[Dict]:
+        if self.local.maxsize <= 0:
+            return compute()
+        key, generation, hits = self._lookup(kind, query, k)
+        if hits is None:
+            hits = compute()
+            self._store(key, generation, hits)
+        return hits
+
+    async def aget_or_compute(self, kind: str, query: str, k: int,
+                              compute: Callable[[], Awaitable[List[Dict]]]) -> List[Dict]:
+        if self.local.maxsize <= 0:
+            return await compute()
+        key, generation, hits = self._lookup(kind, query, k)
+        if hits is None:
+            hits = await compute()
+            self._store(key, generation, hits)
+        return hits
+
+    def stats(self) -> Dict:
+        return self.local.stats() | {"generation": current_generation(), "shared": self.shared is not None}
@@ -1,15 +1,67 @@
-from elasticsearch import Elasticsearch
-from typing import List, Dict
-from sentence_transformers import SentenceTransformer
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import os
 
-ES_URL = "http://localhost:9200"
-INDEX = "rag_documents"
-es = Elasticsearch(ES_URL)
-embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+import numpy as np
 
-def bm25_search(query: str, k: int = 5) -> List[Dict]:
-    body = {
+from .cache import LRUCache
+from ..core.registry import MODEL_NAME, get_embedder, get_es, get_async_es
+from ..core.metrics import propagate, span
+from ..indexing.generation import current_generation
+from ..indexing.sparse import sparse_query
+from ..indexing.vector_index import get_vector_index
+
+INDEX = os.getenv("RAG_INDEX", "rag_documents")
+SEARCH_WORKERS = int(os.getenv("RAG_SEARCH_WORKERS", "16"))  # threads shared by hybrid_search legs
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "4096"))     # 0 disables the query embedding cache
+QUERY_CACHE_TTL = float(os.getenv("RAG_QUERY_CACHE_TTL", "3600"))    # seconds, 0 = no expiry
+DENSE_BACKEND = os.getenv("RAG_DENSE_BACKEND", "es")  # "es" (kNN first) | "local" (vector index first)
+VECTOR_QUANTIZATION = os.getenv("RAG_VECTOR_QUANTIZATION", "none")  # must match the index mapping
+RESCORE_OVERSAMPLE = int(os.getenv("RAG_RESCORE_OVERSAMPLE", "4"))  # kNN candidates per hit when quantized
+
+_legs = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search-leg")
+query_embeddings = LRUCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+# Models whose tokenizer lowercases its input (embedders and the rerank cross-encoders);
+# any other RAG_EMBED_MODEL / RAG_RERANK_MODEL is treated as cased
+UNCASED_MODELS = {
+    "sentence-transformers/all-MiniLM-L6-v2",
+    "sentence-transformers/all-MiniLM-L12-v2",
+    "sentence-transformers/multi-qa-MiniLM-L6-cos-v1",
+    "sentence-transformers/paraphrase-MiniLM-L6-v2",
+    "cross-encoder/ms-marco-MiniLM-L-6-v2",
+    "cross-encoder/ms-marco-MiniLM-L-12-v2",
+    "cross-encoder/ms-marco-TinyBERT-L-2-v2",
+}
+
+def normalize_query(query: str, model_name: str = MODEL_NAME) -> str:
+    # The tokenizer ignores runs of whitespace, and an uncased one also ignores
+    # case, so these variants embed identically and can share a cache entry.
+    if model_name in UNCASED_MODELS or f"sentence-transformers/{model_name}" in UNCASED_MODELS:
+        query = query.lower()
+    return " ".join(query.split())
+
+def embed_query(query: str) -> List[float]:
+    """Normalized query vector, served from the LRU cache when possible."""
+    key = (MODEL_NAME, normalize_query(query, MODEL_NAME))
+    vec = query_embeddings.get(key)
+    if vec is None:
+        with span("embed.query"):
+            vec = tuple(get_embedder().encode(query, normalize_embeddings=True).tolist())
+        query_embeddings.put(key, vec)
+    return list(vec)
+
+# ---------- Query bodies (shared by the sync and async paths) ----------
+# Hits never need the stored vectors, so they are left out of responses (and so
+# out of cached results). Only the quantized kNN leg fetches "embedding", for _rescore.
+VECTOR_FIELDS = ["embedding", "sparse_embedding"]
+_NO_VECTORS = {"excludes": VECTOR_FIELDS}
+
+def _bm25_body(query: str, k: int) -> Dict:
+    return {
         "size": k,
+        "_source": _NO_VECTORS,
         "query": {
             "multi_match": {
                 "query": query,
@@ -18,46 +70,49 @@ def bm25_search(query: str, k: int = 5) -> List[Dict]:
             }
         }
     }
-    try:
-        r = es.search(index=INDEX, body=body)
-        return [hit["_source"] | {"score": hit["_score"]} for hit in r["hits"]["hits"]]
-    except Exception:
-        return []
 
-def dense_search(query: str, k: int = 5) -> List[Dict]:
-    query_vector = embedder.encode(query, normalize_embeddings=True).tolist()
-    
-    try:
-        body = {
-            "size": k,
-            "knn": {
-                "field": "embedding",
-                "query_vector": query_vector,
-                "k": k,
-                "num_candidates": k * 2
-            }
+def _knn_body(query_vector: List[float], k: int) -> Dict:
+    # Quantized vectors rank approximately: pull a bigger pool for _rescore
+    quantized = VECTOR_QUANTIZATION != "none"
+    candidates = k * RESCORE_OVERSAMPLE if quantized else k
+    return {
+        "size": candidates,
+        "_source": {"excludes": ["sparse_embedding"]} if quantized else _NO_VECTORS,
+        "knn": {
+            "field": "embedding",
+            "query_vector": query_vector,
+            "k": candidates,
+            "num_candidates": candidates * 2
         }
-        r = es.search(index=INDEX, body=body)
-    except Exception:
-        body = {
-            "size": k,
-            "query": {
-                "script_score": {
-                    "query": {"match_all": {}},
-                    "script": {
-                        "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                        "params": {"query_vector": query_vector}
-                    }
+    }
+
+def _script_score_body(query_vector: List[float], k: int) -> Dict:
+    return {
+        "size": k,
+        "_source": _NO_VECTORS,
+        "query": {
+            "script_score": {
+                "query": {"match_all": {}},
+                "script": {
+                    "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
+                    "params": {"query_vector": query_vector}
                 }
             }
         }
-        r = es.search(index=INDEX, body=body)
-    
-    return [hit["_source"] | {"score": hit["_score"]} for hit in r["hits"]["hits"]]
+    }
 
-def elser_search(query: str, k: int = 5) -> List[Dict]:
-    body = {
+def _sparse_body(query: str, k: int) -> Optional[Dict]:
+    """Weighted rank_feature lookup of the query's sparse terms (None if it has none)."""
+    clauses = sparse_query(query)
+    if not clauses:
+        return None
+    return {"size": k, "_source": _NO_VECTORS, "query": {"bool": {"should": clauses}}}
+
+def _mlt_body(query: str, k: int) -> Dict:
+    # Indices created before sparse_embedding was mapped as rank_features
+    return {
         "size": k,
+        "_source": _NO_VECTORS,
         "query": {
             "bool": {
                 "should": [
@@ -74,9 +129,106 @@ def elser_search(query: str, k: int = 5) -> List[Dict]:
             }
         }
     }
+
+# sparse_embedding only became searchable with the rank_features mapping, so
+# older indices keep the more_like_this query until they are migrated.
+# (generation, mapped), replaced in one assignment so readers never see it half-updated.
+_rank_features: Tuple[int, bool] = (-1, False)
+
+def _has_rank_features(mapping) -> bool:
+    return all(mapping[name]["mappings"]["properties"].get("sparse_embedding", {}).get("type") == "rank_features"
+               for name in mapping)
+
+def _elser_body(query: str, k: int, rank_features: bool) -> Dict:
+    body = _sparse_body(query, k) if rank_features else None
+    return body if body is not None else _mlt_body(query, k)
+
+def _hits(r) -> List[Dict]:
+    return [hit["_source"] | {"score": hit["_score"]} for hit in r["hits"]["hits"]]
+
+def _rescore(hits: List[Dict], query_vector: List[float], k: int) -> List[Dict]:
+    """
+    Re-rank kNN candidates from a quantized index by exact cosine similarity
+    against the float vectors in _source. Scores keep the kNN (1 + cos) / 2 scale.
+    The vectors are dropped from the returned hits.
+    """
+    if VECTOR_QUANTIZATION == "none":
+        return hits
+    scored = [h for h in hits if h.get("embedding")]
+    if not scored:
+        return [_without_vectors(h) for h in hits[:k]]
+    sims = np.asarray([h["embedding"] for h in scored], dtype=np.float32) @ np.asarray(query_vector, dtype=np.float32)
+    order = np.argsort(-sims)[:k]
+    return [_without_vectors(scored[i]) | {"score": float((1.0 + sims[i]) / 2.0)} for i in order]
+
+def _without_vectors(hit: Dict) -> Dict:
+    return {key: value for key, value in hit.items() if key not in VECTOR_FIELDS}
+
+# ---------- Local vector index ----------
+def _local_top(query_vector: List[float], k: int) -> Optional[List[tuple]]:
+    """Top-k (doc_id, score) from the local vector index, or None when it is off or empty."""
+    vector_index = get_vector_index()
+    if vector_index is None:
+        return None
+    return vector_index.search(query_vector, k) or None
+
+def _mget_body(top: List[tuple]) -> Dict:
+    return {"ids": [doc_id for doc_id, _ in top]}
+
+def _local_hits(r, top: List[tuple]) -> List[Dict]:
+    # Chunks deleted from ES but not yet from the local index are skipped
+    found = {d["_id"]: d["_source"] for d in r["docs"] if d.get("found")}
+    return [found[doc_id] | {"score": score} for doc_id, score in top if doc_id in found]
+
+def _local_dense(query_vector: List[float], k: int) -> Optional[List[Dict]]:
+    top = _local_top(query_vector, k)
+    if top is None:
+        return None
+    return _local_hits(get_es().mget(index=INDEX, body=_mget_body(top), source_excludes=VECTOR_FIELDS), top)
+
+# ---------- Sync search ----------
+def bm25_search(query: str, k: int = 5) -> List[Dict]:
     try:
-        r = es.search(index=INDEX, body=body)
-        return [hit["_source"] | {"score": hit["_score"]} for hit in r["hits"]["hits"]]
+        with span("search.bm25"):
+            return _hits(get_es().search(index=INDEX, body=_bm25_body(query, k)))
+    except Exception:
+        return []
+
+def dense_search(query: str, k: int = 5) -> List[Dict]:
+    query_vector = embed_query(query)
+    with span("search.dense"):
+        return _dense_hits(query_vector, k)
+
+def _dense_hits(query_vector: List[float], k: int) -> List[Dict]:
+    if DENSE_BACKEND == "local":
+        hits = _local_dense(query_vector, k)
+        if hits is not None:
+            return hits
+
+    try:
+        r = get_es().search(index=INDEX, body=_knn_body(query_vector, k))
+    except Exception:
+        # Prefer the local index over a script_score scan of every document in ES
+        hits = _local_dense(query_vector, k)
+        if hits is not None:
+            return hits
+        r = get_es().search(index=INDEX, body=_script_score_body(query_vector, k))
+        return _hits(r)
+
+    return _rescore(_hits(r), query_vector, k)
+
+def _sparse_mapped() -> bool:
+    global _rank_features
+    generation = current_generation()  # migrate_index bumps it
+    cached = _rank_features
+    if cached[0] != generation:
+        cached = _rank_features = (generation, _has_rank_features(get_es().indices.get_mapping(index=INDEX)))
+    return cached[1]
+
+def elser_search(query: str, k: int = 5) -> List[Dict]:
+    try:
+        with span("search.elser"):
+            return _hits(get_es().search(index=INDEX, body=_elser_body(query, k, _sparse_mapped())))
     except Exception:
         return []
 
@@ -96,8 +248,76 @@ def _rrf(ranked_lists: List[List[Dict]], weights: List[float] = [3.0, 1.5, 1.0],
     return [m["doc"] | {"score": m["score"]} for m in merged[:top_k]]
 
 def hybrid_search(query: str, k: int = 5) -> List[Dict]:
-    bm25_results = bm25_search(query, k)
-    dense_results = dense_search(query, k)
-    sparse_results = elser_search(query, k)
-    
-    return _rrf([bm25_results, dense_results, sparse_results], top_k=k)
\ No newline at end of file
+    # Run the three legs concurrently; the query embedding inside dense_search
+    # overlaps with the BM25 and ELSER round trips, so latency ~ slowest leg.
+    with span("search.hybrid"):
+        bm25 = _legs.submit(propagate(bm25_search, query, k))
+        dense = _legs.submit(propagate(dense_search, query, k))
+        sparse = _legs.submit(propagate(elser_search, query, k))
+        lists = [bm25.result(), dense.result(), sparse.result()]
+        with span("search.rrf"):
+            return _rrf(lists, top_k=k)
+
+# ---------- Async search ----------
+# Same results as the sync functions, but ES calls go through AsyncElasticsearch and
+# the CPU-bound query embedding runs on the _legs executor, so the event loop never blocks.
+async def abm25_search(query: str, k: int = 5) -> List[Dict]:
+    try:
+        with span("search.bm25"):
+            return _hits(await get_async_es().search(index=INDEX, body=_bm25_body(query, k)))
+    except Exception:
+        return []
+
+async def _alocal_dense(query_vector: List[float], k: int) -> Optional[List[Dict]]:
+    loop = asyncio.get_running_loop()
+    top = await loop.run_in_executor(_legs, propagate(_local_top, query_vector, k))
+    if top is None:
+        return None
+    return _local_hits(await get_async_es().mget(index=INDEX, body=_mget_body(top), source_excludes=VECTOR_FIELDS),
+                       top)
+
+async def adense_search(query: str, k: int = 5) -> List[Dict]:
+    loop = asyncio.get_running_loop()
+    query_vector = await loop.run_in_executor(_legs, propagate(embed_query, query))
+    with span("search.dense"):
+        return await _adense_hits(query_vector, k)
+
+async def _adense_hits(query_vector: List[float], k: int) -> List[Dict]:
+    if DENSE_BACKEND == "local":
+        hits = await _alocal_dense(query_vector, k)
+        if hits is not None:
+            return hits
+
+    try:
+        r = await get_async_es().search(index=INDEX, body=_knn_body(query_vector, k))
+    except Exception:
+        hits = await _alocal_dense(query_vector, k)
+        if hits is not None:
+            return hits
+        r = await get_async_es().search(index=INDEX, body=_script_score_body(query_vector, k))
+        return _hits(r)
+
+    return _rescore(_hits(r), query_vector, k)
+
+async def _asparse_mapped() -> bool:
+    global _rank_features
+    generation = current_generation()
+    cached = _rank_features
+    if cached[0] != generation:
+        mapping = await get_async_es().indices.get_mapping(index=INDEX)
+        cached = _rank_features = (generation, _has_rank_features(mapping))
+    return cached[1]
+
+async def aelser_search(query: str, k: int = 5) -> List[Dict]:
+    try:
+        with span("search.elser"):
+            return _hits(await get_async_es().search(index=INDEX, body=_elser_body(query, k, await _asparse_mapped())))
+    except Exception:
+        return []
+
+async def ahybrid_search(query: str, k: int = 5) -> List[Dict]:
+    with span("search.hybrid"):
+        bm25, dense, sparse = await asyncio.gather(
+            abm25_search(query, k), adense_search(query, k), aelser_search(query, k))
+        with span("search.rrf"):
+            return _rrf([bm25, dense, sparse], top_k=k)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: compiled TextNormalizer vs the original sequential clean_text.
+
+    python benchmarks/bench_clean_text.py --mb 8 --repeat 3
+
+Reports throughput (MB/s) for both implementations and whether their outputs match.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.ingestion.normalize import TextNormalizer
+
+
+def legacy_clean_text(t: str) -> str:
+    """clean_text as it was before the compiled normalizer (kept for comparison)."""
+    ocr_fixes = {
+        r'Binar y Se ar c h': 'Binary Search',
+        r'Se ar c hin g': 'Searching',
+        r'Algor ithms': 'Algorithms',
+        r'Line ar Se ar c h': 'Linear Search',
+        r'C omple xit y': 'Complexity',
+        r'element s': 'elements',
+        r'arra y': 'array',
+        r'v al u e': 'value',
+        r'adjac ent': 'adjacent',
+        r'uns or t ed': 'unsorted',
+        r's or t ed': 'sorted',
+        r'rn': 'm',
+        r'cl': 'd',
+        r'\s+': ' '
+    }
+    for pattern, replacement in ocr_fixes.items():
+        t = re.sub(pattern, replacement, t, flags=re.IGNORECASE)
+    t = t.replace("\x00", " ")
+    t = re.sub(r"[ \t]+", " ", t)
+    t = re.sub(r"\n{2,}", "\n", t)
+    return t.strip()
+
+
+WORDS = (
+    "the algorithm compares each element with the target value and returns its index "
+    "balance sheet assets liabilities equity revenue turn clear modern include learn "
+    "Binar y Se ar c h Algor ithms C omple xit y element s arra y v al u e adjac ent "
+    "uns or t ed s or t ed recursion pointer heap queue stack graph"
+).split()
+SEPARATORS = [" "] * 20 + ["  ", "\n", "\n\n", "\t", " \x00 "]
+
+
+def synthetic_text(n_bytes: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts, size = [], 0
+    while size < n_bytes:
+        w = rng.choice(WORDS) + rng.choice(SEPARATORS)
+        parts.append(w)
+        size += len(w)
+    return "".join(parts)
+
+
+def bench(fn, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=8.0, help="size of the synthetic document in MB")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per implementation (best is kept)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    text = synthetic_text(int(args.mb * 1024 * 1024))
+    normalizer = TextNormalizer()
+    legacy_s = bench(legacy_clean_text, text, args.repeat)
+    compiled_s = bench(normalizer, text, args.repeat)
+    same = legacy_clean_text(text) == normalizer(text)
+
+    mb = len(text) / (1024 * 1024)
+    results = {
+        "input_mb": round(mb, 2),
+        "legacy_mb_per_s": round(mb / legacy_s, 2),
+        "compiled_mb_per_s": round(mb / compiled_s, 2),
+        "speedup": round(legacy_s / compiled_s, 2),
+        "outputs_match": same,
+    }
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"input:     {results['input_mb']} MB")
+        print(f"legacy:    {results['legacy_mb_per_s']} MB/s")
+        print(f"compiled:  {results['compiled_mb_per_s']} MB/s  ({results['speedup']}x)")
+        print(f"identical: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Recall-vs-latency report for quantized vector storage with full-precision rescoring.
+
+    python benchmarks/bench_quantization.py                      # offline, NumPy simulation
+    python benchmarks/bench_quantization.py --es http://localhost:9200 --n 20000
+
+For every mode (float32, int8, binary) and oversample factor, candidates are taken
+from the quantized vectors (k * oversample of them), rescored against the float
+vectors, and compared with the exact top-k. Offline, candidates come from a brute-force
+scan of the simulated codes. With --es, throwaway indices with the real int8_hnsw /
+bbq_hnsw mappings are created, queried with kNN, and deleted again.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+MODES = ["float32", "int8", "binary"]
+BYTES_PER_VECTOR = {"float32": lambda d: 4 * d, "int8": lambda d: d + 4, "binary": lambda d: d // 8 + 4}
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Clustered, normalized vectors (random Gaussians are all nearly orthogonal)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vecs = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def exact_top(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    sims = queries @ vectors.T
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(top, np.argsort(-np.take_along_axis(sims, top, 1), axis=1), 1)
+
+
+class Simulated:
+    """Brute-force candidate scoring over int8 / 1-bit codes, the way ES quantizes them."""
+
+    def __init__(self, mode: str, vectors: np.ndarray):
+        self.mode = mode
+        if mode == "int8":
+            lo, hi = np.quantile(vectors, [0.005, 0.995])  # ES keeps a 99% confidence interval
+            self.scale = max(abs(lo), abs(hi)) / 127.0
+            self.codes = np.clip(np.round(vectors / self.scale), -127, 127).astype(np.int8)
+        elif mode == "binary":
+            self.codes = np.packbits(vectors > 0, axis=1)
+            self.popcount = np.array([bin(i).count("1") for i in range(256)], dtype=np.int32)
+        else:
+            self.codes = vectors
+
+    def candidates(self, q: np.ndarray, n: int) -> np.ndarray:
+        if self.mode == "int8":
+            scores = self.codes.astype(np.float32) @ q
+        elif self.mode == "binary":
+            hamming = self.popcount[np.bitwise_xor(self.codes, np.packbits(q > 0))].sum(axis=1)
+            scores = -hamming.astype(np.float32)
+        else:
+            scores = self.codes @ q
+        n = min(n, len(scores))
+        return np.argpartition(-scores, n - 1)[:n]
+
+
+def rescore(vectors: np.ndarray, q: np.ndarray, candidates: np.ndarray, k: int) -> np.ndarray:
+    sims = vectors[candidates] @ q
+    return candidates[np.argsort(-sims)[:k]]
+
+
+def run_offline(vectors, queries, truth, k, oversamples):
+    rows = []
+    for mode in MODES:
+        index = Simulated(mode, vectors)
+        for oversample in oversamples:
+            found, start = [], time.perf_counter()
+            for q in queries:
+                found.append(rescore(vectors, q, index.candidates(q, k * oversample), k))
+            elapsed = time.perf_counter() - start
+            rows.append(_row(mode, oversample, found, truth, k, elapsed / len(queries), vectors.shape[1]))
+    return rows
+
+
+def run_es(url, vectors, queries, truth, k, oversamples, keep):
+    from elasticsearch import Elasticsearch, helpers
+    from app.indexing.elasticsearch_indexer import _INDEX_OPTIONS
+
+    es = Elasticsearch(url, request_timeout=600)
+    rows = []
+    for mode in MODES:
+        name = f"rag_bench_{mode}"
+        embedding = {"type": "dense_vector", "dims": vectors.shape[1], "index": True, "similarity": "cosine"}
+        if _INDEX_OPTIONS.get(mode):
+            embedding["index_options"] = _INDEX_OPTIONS[mode]
+        es.options(ignore_status=404).indices.delete(index=name)
+        es.indices.create(index=name, body={"mappings": {"properties": {"embedding": embedding}}})
+        helpers.bulk(es, ({"_index": name, "_id": str(i), "_source": {"embedding": v.tolist()}}
+                          for i, v in enumerate(vectors)), chunk_size=500)
+        es.indices.refresh(index=name)
+        es.indices.forcemerge(index=name, max_num_segments=1)
+
+        for oversample in oversamples:
+            n = k * oversample
+            found, start = [], time.perf_counter()
+            for q in queries:
+                r = es.search(index=name, body={
+                    "size": n, "_source": False,
+                    "knn": {"field": "embedding", "query_vector": q.tolist(), "k": n, "num_candidates": n * 2},
+                })
+                ids = np.array([int(h["_id"]) for h in r["hits"]["hits"]], dtype=np.int64)
+                found.append(rescore(vectors, q, ids, k) if len(ids) else ids)
+            elapsed = time.perf_counter() - start
+            rows.append(_row(mode, oversample, found, truth, k, elapsed / len(queries), vectors.shape[1]))
+        if not keep:
+            es.indices.delete(index=name)
+    return rows
+
+
+def _row(mode, oversample, found, truth, k, latency, dim):
+    recall = float(np.mean([len(set(f.tolist()) & set(t.tolist())) / k for f, t in zip(found, truth)]))
+    return {
+        "mode": mode,
+        "oversample": oversample,
+        "recall_at_k": round(recall, 4),
+        "latency_ms": round(latency * 1000, 3),
+        "bytes_per_vector": BYTES_PER_VECTOR[mode](dim),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=20000, help="vectors in the corpus")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--oversample", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--es", default="", help="Elasticsearch URL; measure real kNN instead of simulating")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark indices (--es only)")
+    parser.add_argument("--json", default="", help="also write the results to this file")
+    args = parser.parse_args()
+
+    data = synthetic_vectors(args.n + args.queries, args.dim, args.clusters)
+    vectors, queries = data[:args.n], data[args.n:]
+    truth = exact_top(vectors, queries, args.k)
+
+    if args.es:
+        rows = run_es(args.es, vectors, queries, truth, args.k, args.oversample, args.keep)
+    else:
+        rows = run_offline(vectors, queries, truth, args.k, args.oversample)
+
+    print(f"{'mode':8} {'oversample':>10} {'recall@' + str(args.k):>10} {'latency ms':>11} {'bytes/vec':>10}")
+    for r in rows:
+        print(f"{r['mode']:8} {r['oversample']:>10} {r['recall_at_k']:>10.3f} {r['latency_ms']:>11.3f} {r['bytes_per_vector']:>10}")
+    if args.json:
+        Path(args.json).write_text(json.dumps({"backend": args.es or "simulated", "k": args.k,
+                                               "n": args.n, "results": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
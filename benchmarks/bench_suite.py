@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Offline performance suite: ingest throughput, hybrid_search latency and end-to-end
+/query latency under concurrency, against the local stand-ins in benchmarks/stubs.py.
+
+    python benchmarks/bench_suite.py                                  # writes .cache/bench/<time>.json
+    python benchmarks/bench_suite.py --json new.json --compare base.json
+    python benchmarks/bench_suite.py --es http://localhost:9200       # real ES container
+
+1. ingest: writes --pdfs synthetic PDFs (seeded, PyMuPDF). Then runs iter_pdf_documents
+   and index_documents into a fresh --index and reports chunks/s for each stage.
+2. search: runs --queries distinct queries through hybrid_search, first one at a time,
+   then from --search-concurrency threads. Reports p50/p95/p99.
+3. query: starts the API under uvicorn, pointed at the same index and at a fake Ollama
+   with a fixed token rate. For every --concurrency level it sends --requests /query
+   calls and reports latency percentiles and requests/s.
+
+The embedding model is the real one (RAG_EMBED_MODEL), so its cost is included.
+The embedding, query and result caches are turned off, so every run does the same
+work. The ES stub scores by brute force in Python; compare stub runs with stub runs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from stubs import ESStub, FakeOllama
+
+TOPICS = ["binary search", "hash tables", "dynamic programming", "graph traversal", "heaps",
+          "linked lists", "sorting", "recursion", "tries", "union find", "bit manipulation",
+          "sliding window", "two pointers", "backtracking", "greedy algorithms", "segment trees"]
+
+
+# ---------- Synthetic corpus ----------
+def _vocabulary(rng: random.Random, n: int = 3000) -> List[str]:
+    consonants, vowels = "bcdfghklmnprstvz", "aeiou"
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def _sentence(rng: random.Random, vocab: List[str], topic: str) -> str:
+    words = [rng.choice(vocab) for _ in range(rng.randint(8, 20))]
+    words.insert(rng.randrange(len(words)), topic)
+    return " ".join(words).capitalize() + "."
+
+
+def write_pdfs(out_dir: Path, n_pdfs: int, pages: int, seed: int = 0) -> List[str]:
+    """Seeded text PDFs of ~400 words per page, each about a few TOPICS."""
+    import fitz  # PyMuPDF
+
+    rng = random.Random(seed)
+    vocab = _vocabulary(rng)
+    paths = []
+    for i in range(n_pdfs):
+        topics = rng.sample(TOPICS, 3)
+        doc = fitz.open()
+        for _ in range(pages):
+            text = " ".join(_sentence(rng, vocab, rng.choice(topics)) for _ in range(28))
+            lines, line = [], ""
+            for word in text.split():
+                if len(line) + len(word) > 100:
+                    lines.append(line)
+                    line = ""
+                line = f"{line} {word}" if line else word
+            lines.append(line)
+            doc.new_page().insert_text((36, 40), "\n".join(lines), fontsize=7)
+        path = out_dir / f"synthetic_{i:04d}.pdf"
+        doc.save(str(path))
+        doc.close()
+        paths.append(str(path))
+    return paths
+
+
+def make_queries(chunks: List[Dict], n: int, seed: int = 1) -> List[str]:
+    """n distinct queries: a topic plus a few consecutive words taken from a random chunk."""
+    rng = random.Random(seed)
+    queries = set()
+    while len(queries) < n:
+        words = rng.choice(chunks)["text"].split()
+        start = rng.randrange(max(1, len(words) - 4))
+        queries.add(f"{rng.choice(TOPICS)} {' '.join(words[start:start + rng.randint(2, 4)])}".lower())
+    return sorted(queries)
+
+
+# ---------- Measurement helpers ----------
+def latency_stats(samples: List[float], wall: float = 0.0) -> Dict[str, float]:
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    stats = {
+        "n": len(samples),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+    if wall:
+        stats["throughput_per_s"] = round(len(samples) / wall, 2)
+    return stats
+
+
+def _timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ---------- Stages ----------
+def bench_ingest(pdf_dir: Path, index: str) -> Tuple[Dict, List[Dict]]:
+    from app.core.registry import get_es
+    from app.ingestion.pdf_ingestor import iter_pdf_documents
+    from app.indexing.elasticsearch_indexer import index_documents
+
+    get_es().options(ignore_status=404).indices.delete(index=index)
+    start = time.perf_counter()
+    chunks = list(iter_pdf_documents(str(pdf_dir)))
+    extract_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    n = index_documents(iter(chunks))
+    index_s = time.perf_counter() - start
+    return {
+        "chunks": n,
+        "extract_s": round(extract_s, 3),
+        "extract_chunks_per_s": round(len(chunks) / extract_s, 2),
+        "index_s": round(index_s, 3),
+        "index_chunks_per_s": round(n / index_s, 2),
+        "chunks_per_s": round(n / (extract_s + index_s), 2),
+    }, chunks
+
+
+def bench_search(queries: List[str], k: int, concurrency: int) -> Dict:
+    from app.retrieval.search import hybrid_search
+
+    hybrid_search("warm up", k)  # model load and first connections are not measured
+    half = len(queries) // 2
+    sequential = [_timed(hybrid_search, q, k) for q in queries[:half]]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        concurrent = list(pool.map(lambda q: _timed(hybrid_search, q, k), queries[half:]))
+    wall = time.perf_counter() - start
+    return {
+        "sequential": latency_stats(sequential),
+        "concurrent": latency_stats(concurrent, wall) | {"concurrency": concurrency},
+    }
+
+
+def start_api(env: Dict[str, str], timeout: float = 300.0):
+    import requests
+
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.api.server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=str(ROOT), env=os.environ | env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"API exited with code {proc.returncode}")
+        try:
+            if requests.get(f"{url}/readyz", timeout=1).status_code == 200:
+                return proc, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("API did not become ready")
+
+
+async def _query_load(url: str, questions: List[str], concurrency: int, top_k: int) -> Dict:
+    import httpx
+
+    latencies: List[float] = []
+    errors = 0
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(client, question):
+        nonlocal errors
+        async with limit:
+            start = time.perf_counter()
+            r = await client.post(f"{url}/query", json={"question": question, "mode": "hybrid", "top_k": top_k})
+            if r.status_code != 200 or r.json().get("answer", "").startswith(("Error", "Retrieved context")):
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        await asyncio.gather(*(one(client, q) for q in questions[:concurrency]))  # warm-up, not measured
+        latencies.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, q) for q in questions[concurrency:]))
+        wall = time.perf_counter() - start
+    return latency_stats(latencies, wall) | {"errors": errors}
+
+
+def bench_query(url: str, queries: List[str], levels: List[int], requests_per_level: int, top_k: int) -> Dict:
+    results = {}
+    rng = random.Random(2)
+    for c in levels:
+        # Distinct questions per level, so neither the server nor ES sees repeats
+        questions = [f"{q} {rng.randrange(10 ** 6)}" for q in rng.choices(queries, k=requests_per_level + c)]
+        results[str(c)] = asyncio.run(_query_load(url, questions, c, top_k)) | {"concurrency": c}
+        print(f"   /query c={c}: p50 {results[str(c)]['p50_ms']} ms, {results[str(c)]['throughput_per_s']} req/s")
+    return results
+
+
+# ---------- Reporting ----------
+def _flatten(obj, prefix: str = "") -> Dict[str, float]:
+    out = {}
+    for k, v in obj.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out |= _flatten(v, f"{key}.")
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = v
+    return out
+
+
+def compare(new: Dict, old: Dict) -> None:
+    """Print every metric present in both runs with its relative change."""
+    a = _flatten({k: old.get(k, {}) for k in ("ingest", "hybrid_search", "query")})
+    b = _flatten({k: new.get(k, {}) for k in ("ingest", "hybrid_search", "query")})
+    print(f"\n{'metric':48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for key in sorted(a.keys() & b.keys()):
+        if key.endswith((".n", ".concurrency")):
+            continue
+        change = f"{(b[key] - a[key]) / a[key] * 100:+.1f}%" if a[key] else "n/a"
+        print(f"{key:48} {a[key]:>12.6g} {b[key]:>12.6g} {change:>8}")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdfs", type=int, default=40, help="synthetic PDFs to ingest")
+    parser.add_argument("--pages", type=int, default=5, help="pages per PDF")
+    parser.add_argument("--queries", type=int, default=200, help="hybrid_search queries (half sequential)")
+    parser.add_argument("--search-concurrency", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="/query concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="/query requests per concurrency level")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--tokens-per-s", type=float, default=50.0, help="fake Ollama generation rate")
+    parser.add_argument("--prefill-ms", type=float, default=20.0, help="fake Ollama delay before the first token")
+    parser.add_argument("--prompt-tokens-per-s", type=float, default=2000.0, help="fake Ollama prompt processing rate")
+    parser.add_argument("--answer-tokens", type=int, default=48)
+    parser.add_argument("--es", default="", help="Elasticsearch URL to use instead of the in-process stub")
+    parser.add_argument("--index", default="rag_bench", help="index written by the benchmark (deleted first)")
+    parser.add_argument("--stages", nargs="+", choices=["ingest", "search", "query"],
+                        default=["ingest", "search", "query"])
+    parser.add_argument("--json", default="", help="results file (default .cache/bench/<time>.json)")
+    parser.add_argument("--compare", default="", help="earlier results file to compare against")
+    args = parser.parse_args()
+    if not args.es and "ingest" not in args.stages:
+        parser.error("the ES stub starts empty; keep the ingest stage or pass --es")
+
+    es_stub = None if args.es else ESStub().start()
+    ollama = FakeOllama(tokens_per_s=args.tokens_per_s, prefill_ms=args.prefill_ms,
+                        prompt_tokens_per_s=args.prompt_tokens_per_s, answer_tokens=args.answer_tokens).start()
+    workdir = Path(tempfile.mkdtemp(prefix="rag-bench-"))
+    env = {
+        "ES_URL": args.es or es_stub.url,
+        "RAG_INDEX": args.index,
+        "RAG_OLLAMA_URL": ollama.generate_url,
+        "RAG_EMBED_CACHE": "",
+        "RAG_QUERY_CACHE_SIZE": "0",
+        "RAG_RESULT_CACHE_SIZE": "0",
+        "RAG_RESULT_CACHE_PATH": "",
+        "RAG_VECTOR_INDEX": os.getenv("RAG_VECTOR_INDEX", ""),
+        "RAG_INDEX_GENERATION_FILE": str(workdir / "index_generation"),
+    }
+    os.environ.update(env)  # before any app module reads its configuration
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "backend": args.es or "stub",
+            "args": vars(args),
+        }
+    }
+    chunks: List[Dict] = []
+    try:
+        if "ingest" in args.stages:
+            pdf_dir = workdir / "pdfs"
+            pdf_dir.mkdir()
+            write_pdfs(pdf_dir, args.pdfs, args.pages)
+            print(f"📄 Ingesting {args.pdfs} synthetic PDFs ({args.pages} pages each)")
+            results["ingest"], chunks = bench_ingest(pdf_dir, args.index)
+            print(f"   {results['ingest']['chunks']} chunks, {results['ingest']['chunks_per_s']} chunks/s")
+        if not chunks:
+            from elasticsearch import helpers
+            from app.core.registry import get_es
+            chunks = [h["_source"] for h in helpers.scan(get_es(), index=args.index, size=1000,
+                                                         query={"_source": ["text"]})]
+        queries = make_queries(chunks, args.queries)
+
+        if "search" in args.stages:
+            print(f"🔎 hybrid_search x {len(queries)}")
+            results["hybrid_search"] = bench_search(queries, args.top_k, args.search_concurrency)
+            print(f"   p50 {results['hybrid_search']['sequential']['p50_ms']} ms, "
+                  f"p99 {results['hybrid_search']['sequential']['p99_ms']} ms")
+
+        if "query" in args.stages:
+            print("🌐 /query end to end")
+            proc, url = start_api(env)
+            try:
+                results["query"] = bench_query(url, queries, args.concurrency, args.requests, args.top_k)
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        ollama.stop()
+        if es_stub is not None:
+            es_stub.stop()
+
+    out = Path(args.json or ROOT / ".cache" / "bench" / f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2))
+    print(f"✅ Results written to {out}")
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
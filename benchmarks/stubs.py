@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the services the RAG system talks to, used by bench_suite.py.
+
+    python benchmarks/stubs.py ollama --port 11435 --tokens-per-s 40
+    python benchmarks/stubs.py es --port 9201
+
+FakeOllama serves /api/generate (streaming and not) at a fixed prefill and token rate,
+so LLM time is known and constant between runs. ESStub speaks enough of the
+Elasticsearch REST API for the indexer and the search functions: index create and
+exists, mappings, _bulk, _refresh, _search (multi_match, match, bool, term, terms,
+range, ids, rank_feature, more_like_this, knn, script_score), _mget and
+_delete_by_query. Scoring is brute force in-process, so its latencies are not
+Elasticsearch's. They are stable between runs, which is what regression
+comparisons need; use a real container (bench_suite.py --es URL) for absolute
+numbers.
+"""
+import argparse
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Stub:
+    """Runs a handler class on a background ThreadingHTTPServer."""
+
+    def __init__(self, handler, port: int = 0):
+        self.server = _Server(("127.0.0.1", port), handler)
+        self.server.stub = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> "_Stub":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    extra_headers: Dict[str, str] = {}
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _body(self) -> bytes:
+        n = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(n) if n else b""
+
+    def _json(self, status: int, obj=None) -> None:
+        data = json.dumps(obj).encode() if obj is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for k, v in self.extra_headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+
+# ---------- Ollama ----------
+class _OllamaHandler(_JSONHandler):
+    def do_POST(self) -> None:
+        if urlsplit(self.path).path != "/api/generate":
+            return self._json(404, {"error": "not found"})
+        stub: FakeOllama = self.server.stub
+        body = json.loads(self._body() or b"{}")
+        stub.requests += 1
+        n_tokens = int((body.get("options") or {}).get("num_predict") or stub.answer_tokens)
+        prompt_tokens = (len(body.get("prompt", "")) + len(body.get("system", ""))) // 4
+        time.sleep(stub.prefill_ms / 1000 + prompt_tokens / stub.prompt_tokens_per_s)
+        counts = {"prompt_eval_count": prompt_tokens, "eval_count": n_tokens}
+
+        if not body.get("stream", True):
+            time.sleep(n_tokens / stub.tokens_per_s)
+            return self._json(200, {"model": body.get("model"), "response": stub.answer(n_tokens), "done": True} | counts)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i in range(n_tokens):
+                time.sleep(1 / stub.tokens_per_s)
+                self._chunk({"response": f"tok{i} ", "done": False})
+            self._chunk({"response": "", "done": True} | counts)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            stub.cancelled += 1
+
+    def _chunk(self, obj: Dict) -> None:
+        line = (json.dumps(obj) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+
+class FakeOllama(_Stub):
+    """/api/generate with a fixed prefill delay, prompt processing rate and token rate."""
+
+    def __init__(self, port: int = 0, tokens_per_s: float = 50.0, prefill_ms: float = 20.0,
+                 prompt_tokens_per_s: float = 2000.0, answer_tokens: int = 48):
+        super().__init__(_OllamaHandler, port)
+        self.tokens_per_s = tokens_per_s
+        self.prefill_ms = prefill_ms
+        self.prompt_tokens_per_s = prompt_tokens_per_s
+        self.answer_tokens = answer_tokens
+        self.requests = 0
+        self.cancelled = 0
+
+    @property
+    def generate_url(self) -> str:
+        return f"{self.url}/api/generate"
+
+    @staticmethod
+    def answer(n_tokens: int) -> str:
+        return " ".join(f"tok{i}" for i in range(n_tokens))
+
+
+# ---------- Elasticsearch ----------
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class _Index:
+    """One index: sources, an inverted index over "text" for BM25, and a float32 matrix of embeddings."""
+
+    K1, B = 1.2, 0.75
+
+    def __init__(self, mappings: Dict):
+        self.mappings = mappings or {"properties": {}}
+        self.slots: Dict[str, int] = {}
+        self.ids: List[Optional[str]] = []
+        self.sources: List[Optional[Dict]] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.features: Dict[str, Dict[int, float]] = {}
+        self.vectors: List[Optional[List[float]]] = []
+        self._matrix: Optional[np.ndarray] = None
+        self.live = 0
+
+    # ----- writes -----
+    def put(self, doc_id: str, source: Dict) -> str:
+        result = "updated" if doc_id in self.slots else "created"
+        self.delete(doc_id)
+        slot = len(self.ids)
+        self.slots[doc_id] = slot
+        self.ids.append(doc_id)
+        self.sources.append(source)
+        terms = _tokens(f"{source.get('text', '')} {source.get('source_file', '')}")
+        self.lengths.append(len(terms))
+        for term, tf in Counter(terms).items():
+            self.postings.setdefault(term, {})[slot] = tf
+        for term, weight in (source.get("sparse_embedding") or {}).items():
+            self.features.setdefault(term, {})[slot] = weight
+        self.vectors.append(source.get("embedding"))
+        self._matrix = None
+        self.live += 1
+        return result
+
+    def delete(self, doc_id: str) -> bool:
+        slot = self.slots.pop(doc_id, None)
+        if slot is None:
+            return False
+        source = self.sources[slot]
+        for term in set(_tokens(f"{source.get('text', '')} {source.get('source_file', '')}")):
+            self.postings.get(term, {}).pop(slot, None)
+        for term in source.get("sparse_embedding") or {}:
+            self.features.get(term, {}).pop(slot, None)
+        self.ids[slot] = self.sources[slot] = self.vectors[slot] = None
+        self._matrix = None
+        self.live -= 1
+        return True
+
+    # ----- scoring -----
+    def _matrix_view(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._matrix is None:
+            slots = [i for i, v in enumerate(self.vectors) if v is not None]
+            dims = len(self.vectors[slots[0]]) if slots else 0
+            matrix = np.asarray([self.vectors[i] for i in slots], dtype=np.float32).reshape(len(slots), dims)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrix = (np.asarray(slots, dtype=np.int64), matrix / np.maximum(norms, 1e-12))
+        return self._matrix
+
+    def cosine(self, vector: List[float]) -> Dict[int, float]:
+        slots, matrix = self._matrix_view()
+        if not len(slots):
+            return {}
+        q = np.asarray(vector, dtype=np.float32)
+        sims = matrix @ (q / max(float(np.linalg.norm(q)), 1e-12))
+        return dict(zip(slots.tolist(), sims.tolist()))
+
+    def bm25(self, text: str) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        avg = (sum(self.lengths) / len(self.lengths)) if self.lengths else 1.0
+        for term in set(_tokens(text)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (self.live - len(postings) + 0.5) / (len(postings) + 0.5))
+            for slot, tf in postings.items():
+                norm = tf + self.K1 * (1 - self.B + self.B * self.lengths[slot] / avg)
+                scores[slot] = scores.get(slot, 0.0) + idf * tf * (self.K1 + 1) / norm
+        return scores
+
+    def query(self, q: Optional[Dict]) -> Dict[int, float]:
+        """slot -> score for every matching live document."""
+        if not q or "match_all" in q:
+            return {slot: 1.0 for slot in self.slots.values()}
+        kind, spec = next(iter(q.items()))
+        boost = spec.get("boost", 1.0) if isinstance(spec, dict) else 1.0
+        if kind == "multi_match":
+            scores = self.bm25(spec["query"])
+        elif kind == "match":
+            field, value = next(iter(spec.items()))
+            scores = self.bm25(value["query"] if isinstance(value, dict) else value)
+            boost = value.get("boost", 1.0) if isinstance(value, dict) else 1.0
+        elif kind == "more_like_this":
+            scores = self.bm25(spec["like"] if isinstance(spec["like"], str) else " ".join(spec["like"]))
+        elif kind == "rank_feature":
+            term = spec["field"].split(".", 1)[1]
+            scores = dict(self.features.get(term, {}))
+        elif kind == "term":
+            field, value = next((k, v) for k, v in spec.items() if k != "boost")
+            value = value["value"] if isinstance(value, dict) else value
+            scores = {slot: 1.0 for slot in self.slots.values() if self.sources[slot].get(field) == value}
+        elif kind == "range":
+            field, bounds = next(iter(spec.items()))
+            scores = {slot: 1.0 for slot in self.slots.values() if _in_range(self.sources[slot].get(field), bounds)}
+        elif kind == "ids":
+            scores = {self.slots[i]: 1.0 for i in spec["values"] if i in self.slots}
+        elif kind == "terms":
+            field, values = next((k, v) for k, v in spec.items() if k != "boost")
+            values = set(values)
+            scores = {slot: 1.0 for slot in self.slots.values() if self.sources[slot].get(field) in values}
+        elif kind == "bool":
+            scores = self._bool(spec)
+        elif kind == "script_score":
+            base = self.query(spec.get("query"))
+            sims = self.cosine(spec["script"]["params"]["query_vector"])
+            scores = {slot: sims.get(slot, 0.0) + 1.0 for slot in base}
+        else:
+            raise ValueError(f"query type {kind!r} is not supported by the stub")
+        return {slot: s * boost for slot, s in scores.items()} if boost != 1.0 else scores
+
+    def _bool(self, spec: Dict) -> Dict[int, float]:
+        scores: Optional[Dict[int, float]] = None
+        for clause in _as_list(spec.get("must")) + _as_list(spec.get("filter")):
+            matched = self.query(clause)
+            scores = matched if scores is None else {s: scores[s] + matched[s] for s in scores if s in matched}
+        should: Dict[int, float] = {}
+        for clause in _as_list(spec.get("should")):
+            for slot, s in self.query(clause).items():
+                should[slot] = should.get(slot, 0.0) + s
+        if scores is None:
+            return should
+        return {slot: s + should.get(slot, 0.0) for slot, s in scores.items()}
+
+    def search(self, body: Dict) -> List[Tuple[int, float]]:
+        size = body.get("size", 10)
+        if "knn" in body:
+            knn = body["knn"]
+            sims = self.cosine(knn["query_vector"])
+            top = sorted(sims.items(), key=lambda kv: kv[1], reverse=True)[:knn.get("k", size)]
+            return [(slot, (1.0 + s) / 2.0) for slot, s in top][:size]
+        scores = self.query(body.get("query"))
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:size]
+
+
+def _in_range(value, bounds: Dict) -> bool:
+    if value is None:
+        return False
+    checks = {"gt": value.__gt__, "gte": value.__ge__, "lt": value.__lt__, "lte": value.__le__}
+    return all(checks[op](bound) for op, bound in bounds.items() if op in checks)
+
+
+def _as_list(v) -> List:
+    if v is None:
+        return []
+    return v if isinstance(v, list) else [v]
+
+
+def _ndjson(data: bytes) -> Iterator[Dict]:
+    for line in data.splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+
+def _filter_source(source: Dict, spec, excludes: List[str] = ()) -> Optional[Dict]:
+    """Apply a request's _source filtering (true/false, include list, or {includes, excludes})."""
+    if spec is False:
+        return None
+    includes: List[str] = []
+    if isinstance(spec, str):
+        includes = [spec]
+    elif isinstance(spec, list):
+        includes = spec
+    elif isinstance(spec, dict):
+        includes = spec.get("includes", [])
+        excludes = list(excludes) + spec.get("excludes", [])
+    return {k: v for k, v in source.items() if (not includes or k in includes) and k not in excludes}
+
+
+class _ESHandler(_JSONHandler):
+    extra_headers = {"X-Elastic-Product": "Elasticsearch"}
+
+    def _route(self) -> None:
+        stub: ESStub = self.server.stub
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = self._body()
+        with stub.lock:
+            try:
+                status, obj = stub.handle(self.command, parts, body, params)
+            except KeyError as e:
+                status, obj = 404, {"error": {"type": "index_not_found_exception", "reason": f"no such index [{e.args[0]}]"},
+                                    "status": 404}
+            except ValueError as e:
+                status, obj = 400, {"error": {"type": "parsing_exception", "reason": str(e)}, "status": 400}
+        stub.requests += 1
+        self._json(status, obj)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _route
+
+
+class ESStub(_Stub):
+    """In-memory, single-node stand-in for the Elasticsearch REST API (see module docstring)."""
+
+    def __init__(self, port: int = 0):
+        super().__init__(_ESHandler, port)
+        self.indices: Dict[str, _Index] = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def _index(self, name: str) -> _Index:
+        return self.indices[name]
+
+    def handle(self, method: str, parts: List[str], raw: bytes,
+               params: Optional[Dict[str, str]] = None) -> Tuple[int, Optional[Dict]]:
+        params = params or {}
+        body = json.loads(raw) if raw and parts[-1:] != ["_bulk"] else {}
+        if not parts:
+            return 200, {"name": "stub", "cluster_name": "rag-bench", "tagline": "You Know, for Search",
+                         "version": {"number": "8.12.0", "build_flavor": "default",
+                                     "minimum_wire_compatibility_version": "7.17.0",
+                                     "minimum_index_compatibility_version": "7.0.0"}}
+        if parts[-1] == "_bulk":
+            return 200, self._bulk(parts[0] if len(parts) == 2 else None, raw)
+        name = parts[0]
+        if len(parts) == 1:
+            if method == "HEAD":
+                return (200 if name in self.indices else 404), None
+            if method == "PUT":
+                if name in self.indices:
+                    return 400, {"error": {"type": "resource_already_exists_exception", "reason": name}, "status": 400}
+                self.indices[name] = _Index(body.get("mappings", {}))
+                return 200, {"acknowledged": True, "shards_acknowledged": True, "index": name}
+            if method == "DELETE":
+                del self.indices[name]
+                return 200, {"acknowledged": True}
+            return 200, {name: {"mappings": self._index(name).mappings}}
+
+        index = self._index(name)
+        op = parts[1]
+        if op == "_mapping":
+            return 200, {name: {"mappings": index.mappings}}
+        if op == "_refresh":
+            return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+        if op == "_count":
+            return 200, {"count": len(index.query(body.get("query")))}
+        if op == "_search":
+            hits = index.search(body)
+            source = body.get("_source", True)
+            return 200, {
+                "took": 1, "timed_out": False, "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+                "hits": {
+                    "total": {"value": len(hits), "relation": "eq"},
+                    "max_score": hits[0][1] if hits else None,
+                    "hits": [{"_index": name, "_id": index.ids[slot], "_score": score}
+                             | ({"_source": _filter_source(index.sources[slot], source)} if source is not False else {})
+                             for slot, score in hits],
+                },
+            }
+        if op == "_mget":
+            docs = []
+            excludes = [f for f in params.get("_source_excludes", "").split(",") if f]
+            for doc_id in body.get("ids", []):
+                slot = index.slots.get(doc_id)
+                found = {"_source": _filter_source(index.sources[slot], True, excludes), "_version": 1} \
+                    if slot is not None else {}
+                docs.append({"_index": name, "_id": doc_id, "found": slot is not None} | found)
+            return 200, {"docs": docs}
+        if op == "_delete_by_query":
+            slots = list(index.query(body.get("query")))
+            for slot in slots:
+                index.delete(index.ids[slot])
+            return 200, {"took": 1, "deleted": len(slots), "total": len(slots), "failures": []}
+        if op in ("_doc", "_create") and len(parts) == 3:
+            if method == "DELETE":
+                found = index.delete(parts[2])
+                return (200 if found else 404), {"_index": name, "_id": parts[2],
+                                                 "result": "deleted" if found else "not_found"}
+            result = index.put(parts[2], body)
+            return (201 if result == "created" else 200), {"_index": name, "_id": parts[2], "result": result}
+        raise ValueError(f"{method} /{'/'.join(parts)} is not supported by the stub")
+
+    def _bulk(self, default_index: Optional[str], raw: bytes) -> Dict:
+        items = []
+        lines = _ndjson(raw)
+        for action in lines:
+            op, meta = next(iter(action.items()))
+            name = meta.get("_index", default_index)
+            index = self.indices.get(name)
+            if index is None:
+                index = self.indices[name] = _Index({})
+            if op == "delete":
+                found = index.delete(meta["_id"])
+                items.append({op: {"_index": name, "_id": meta["_id"], "status": 200 if found else 404,
+                                   "result": "deleted" if found else "not_found"}})
+                continue
+            source = next(lines)
+            if op == "update":
+                source = source.get("doc", source)
+            result = index.put(meta["_id"], source)
+            items.append({op: {"_index": name, "_id": meta["_id"], "_version": 1, "result": result,
+                               "status": 201 if result == "created" else 200}})
+        return {"took": 1, "errors": False, "items": items}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("service", choices=["ollama", "es"])
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--tokens-per-s", type=float, default=50.0, help="ollama: generation rate")
+    parser.add_argument("--prefill-ms", type=float, default=20.0, help="ollama: fixed delay before the first token")
+    parser.add_argument("--answer-tokens", type=int, default=48, help="ollama: tokens per answer")
+    args = parser.parse_args()
+
+    if args.service == "ollama":
+        stub = FakeOllama(args.port, args.tokens_per_s, args.prefill_ms, answer_tokens=args.answer_tokens)
+    else:
+        stub = ESStub(args.port)
+    print(f"{args.service} stub listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,81 @@
 import sys
+from itertools import chain
 sys.path.append('app')
-from app.ingestion.drive_ingestor import process_drive_pdfs
-from app.indexing.elasticsearch_indexer import index_documents
+from app.ingestion.drive_ingestor import iter_drive_documents, sync_drive_pdfs, save_manifest, requeue_files
+from app.ingestion.pipeline import CountingIterator, prefetch
+from app.ingestion.dedup import open_dedup
+from app.indexing.elasticsearch_indexer import index_documents, embedding_cache_stats, reset_embedding_cache_stats, delete_chunks, delete_file_chunks, delete_stale_chunks, doc_id, rebuild_vector_index, migrate_index, VECTOR_QUANTIZATION
 
 # Your Google Drive folder ID
 FOLDER_ID = "1h6GptTW3DPCdhu7q5tY-83CXrpV8TmY_"
 
 if __name__ == "__main__":
+    incremental = "--incremental" in sys.argv
+
+    if "--migrate-index" in sys.argv:
+        # One-off: reindex into a mapping that uses RAG_VECTOR_QUANTIZATION
+        print(f"✅ Migrated to {migrate_index()} ({VECTOR_QUANTIZATION} vectors)")
+        sys.exit(0)
+
+    if "--rebuild-vectors" in sys.argv:
+        # One-off: fill the local vector index (RAG_VECTOR_INDEX) from an existing ES index
+        print(f"✅ Rebuilt local vector index with {rebuild_vector_index()} vectors")
+        sys.exit(0)
+
     print(f"🔄 Processing PDFs from Google Drive folder: {FOLDER_ID}")
-    docs = process_drive_pdfs(FOLDER_ID)
-    print(f"✅ Extracted {len(docs)} chunks from Google Drive")
-    
+    dedup = open_dedup()
+    restored = []
+    if incremental:
+        sync = sync_drive_pdfs(FOLDER_ID)
+        docs = CountingIterator(sync["documents"])
+        deleted = delete_file_chunks(sync["stale_file_paths"])
+        print(f"🧹 Removed {deleted} stale chunks from {len(sync['stale_file_paths'])} changed files")
+        if dedup is not None:
+            # Duplicates whose kept copy was just deleted need indexing themselves
+            restored = dedup.forget_files(sync["stale_file_paths"])
+    else:
+        docs = CountingIterator(iter_drive_documents(FOLDER_ID))
+
+    # Near-duplicate chunks are dropped before they cost an embedding
+    stream = chain(restored, docs)
+    if dedup is not None:
+        stream = dedup.filter(stream)
+
+    # Chunks are indexed while later files are still downloading
     print("🔄 Indexing documents...")
-    n = index_documents(docs)
+    reset_embedding_cache_stats()
+    failed_files = []
+    n = index_documents(prefetch(stream), on_progress=lambda done: print(f"   ...indexed {done} chunks"),
+                        failed_files=failed_files)
+    print(f"✅ Extracted {docs.count} chunks from Google Drive")
     print(f"✅ Indexing complete! Indexed {n} documents.")
+    if failed_files:
+        print(f"⚠️ {len(failed_files)} files had chunks that failed to index: {', '.join(failed_files)}")
+    # Re-ingested files that now have fewer chunks leave their old last chunks behind
+    stale = delete_stale_chunks(docs.chunks_per_file)
+    if stale:
+        print(f"🧹 Removed {stale} chunks left over from longer versions of re-ingested files")
+    if dedup is not None:
+        # Chunks kept on an earlier run that are duplicates now
+        superseded = delete_chunks([doc_id(d) for d in dedup.superseded])
+        dedup.commit()
+        # Duplicates of the stale chunks deleted above need indexing themselves
+        tail_restored = dedup.forget_stale(docs.chunks_per_file)
+        if tail_restored:
+            n += index_documents(dedup.filter(tail_restored), failed_files=failed_files)
+            dedup.commit()
+            restored += tail_restored
+        print(f"🪞 Near-duplicates suppressed: {dedup.suppressed} (restored {len(restored)}, "
+              f"removed {superseded} indexed earlier)")
+    cache = embedding_cache_stats()
+    print(f"🧠 Embedding cache: {cache['hits']} hits, {cache['misses']} misses")
+    if incremental:
+        # Files with failed chunks stay pending, so the next --incremental run retries them
+        requeue_files(sync, failed_files)
+        save_manifest(sync["manifest_path"], sync["manifest"])
     
     # Show sample with Drive URL
-    if docs:
-        sample = docs[0]
+    if docs.first:
+        sample = docs.first
         print(f"\n📄 Sample: {sample['source_file']}")
         print(f"🔗 Drive URL: {sample['drive_url']}")
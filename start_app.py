@@ -20,6 +20,12 @@ def start_app():
     if is_port_in_use(8501):
         print("⚠️  Port 8501 already in use - UI may already be running")
     
+    # Shared embedding service, when configured, so API workers don't each load the model
+    embed_process = None
+    if os.getenv("RAG_EMBED_SERVICE"):
+        print(f"🧮 Starting embedding service on {os.getenv('RAG_EMBED_SERVICE')}")
+        embed_process = subprocess.Popen([sys.executable, "-m", "app.core.embed_service"])
+
     # Start API server in background
     print("📡 Starting API server on http://localhost:8000")
     api_process = subprocess.Popen([
@@ -29,19 +35,19 @@ def start_app():
         "--port", "8000"
     ])
     
-    # Wait for API to be ready
+    # Wait for API to be ready (model loaded, Elasticsearch and Ollama warmed up)
     print("⏳ Waiting for API server to start...")
-    for i in range(30):  # Try for 30 seconds
+    for i in range(120):  # Try for 120 seconds
         try:
             import requests
-            response = requests.get("http://127.0.0.1:8000/healthz", timeout=1)
+            response = requests.get("http://127.0.0.1:8000/readyz", timeout=1)
             if response.status_code == 200:
                 print("✅ API server is ready!")
                 break
         except:
             pass
         time.sleep(1)
-        if i % 5 == 0:
+        if i % 10 == 0:
             print(f"   Still waiting... ({i+1}s)")
     else:
         print("⚠️  API server may not be ready, but starting UI anyway...")
@@ -67,6 +73,8 @@ def start_app():
         print("\n🛑 Stopping services...")
         api_process.terminate()
         ui_process.terminate()
+        if embed_process is not None:
+            embed_process.terminate()
         print("✅ Services stopped")
 
 if __name__ == "__main__":
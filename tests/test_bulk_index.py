@@ -0,0 +1,77 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root to sys.path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.indexing import elasticsearch_indexer as ei
+
+
+@pytest.fixture
+def bulk(monkeypatch):
+    """Fake streaming_bulk: items of files named "bad" fail; returns the requests seen."""
+    requests = []
+
+    def streaming_bulk(es, actions, **kwargs):
+        actions = list(actions)
+        requests.append(actions)
+        for a in actions:
+            ok = a["_source"]["file_path"] != "bad"
+            yield ok, {"index": {"_id": a["_id"], "error": None if ok else "mapper_parsing_exception"}}
+
+    monkeypatch.setattr(ei.helpers, "streaming_bulk", streaming_bulk)
+    monkeypatch.setattr(ei, "get_es", lambda: None)
+    monkeypatch.setattr(ei, "get_vector_index", lambda: None)
+    monkeypatch.setattr(ei, "get_embeddings", lambda texts: [[0.0] for _ in texts])
+    monkeypatch.setattr(ei.time, "sleep", lambda s: None)
+    return requests
+
+
+def docs(*file_paths):
+    return [{"text": f"chunk {i}", "chunk_id": i, "source_file": Path(fp).name, "file_path": fp}
+            for i, fp in enumerate(file_paths)]
+
+
+def test_failed_items_are_retried_reported_and_collected(bulk, capsys):
+    failed_files = []
+    n = ei._bulk_index(iter(docs("a", "bad", "b", "bad")), 500, 10 ** 8, 1, 2, None, failed_files)
+    assert n == 2
+    assert failed_files == ["bad"]
+    # First pass plus two retry rounds of the two failing items
+    assert [len(r) for r in bulk] == [4, 2, 2]
+    assert all("_error" not in a for r in bulk for a in r)
+    out = capsys.readouterr().out
+    assert "[Index error] bad chunk 1: mapper_parsing_exception" in out
+    assert "[Index error] bad chunk 3: mapper_parsing_exception" in out
+
+
+def test_failed_files_list_is_extended_without_duplicates(bulk):
+    failed_files = ["bad"]
+    ei._bulk_index(iter(docs("bad", "c")), 500, 10 ** 8, 1, 0, None, failed_files)
+    assert failed_files == ["bad"]
+    assert ei._bulk_index(iter(docs("c")), 500, 10 ** 8, 1, 0) == 1
+
+
+def test_connection_error_fails_only_the_inflight_chunk(monkeypatch, bulk):
+    requests = []
+
+    def streaming_bulk(es, actions, chunk_size, **kwargs):
+        # Send chunk_size actions per request; the second request ever sent times out
+        while True:
+            chunk = [a for _, a in zip(range(chunk_size), actions)]
+            if not chunk:
+                return
+            requests.append([a["_source"]["chunk_id"] for a in chunk])
+            if len(requests) == 2:
+                raise ei.TransportError("Connection timed out")
+            for a in chunk:
+                yield True, {"index": {"_id": a["_id"]}}
+
+    monkeypatch.setattr(ei.helpers, "streaming_bulk", streaming_bulk)
+    failed_files = []
+    n = ei._bulk_index(iter(docs("a", "a", "b", "b", "c", "c")), 2, 10 ** 8, 1, 1, None, failed_files)
+    assert n == 6 and failed_files == []
+    # The rest of the stream went on after the timeout; the lost chunk was retried
+    assert requests == [[0, 1], [2, 3], [4, 5], [2, 3]]
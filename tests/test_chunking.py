@@ -0,0 +1,96 @@
+import random
+import sys
+from pathlib import Path
+
+# Add the project root to sys.path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.ingestion.pdf_ingestor import chunk_spans, chunk_text
+from app.ingestion.pipeline import CountingIterator, prefetch
+
+
+def legacy_chunk_text(text, chunk_size, overlap):
+    """The word-list chunker chunk_spans replaced."""
+    words = text.split()
+    chunks, i = [], 0
+    while i < len(words):
+        chunks.append(" ".join(words[i:i + chunk_size]))
+        i += max(1, chunk_size - overlap)
+    return chunks
+
+
+def _words(n, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice(["alpha", "beta", "gamma", "delta", "3.14", "x"]) for _ in range(n)]
+
+
+def test_offsets_slice_the_text():
+    text = "  one two\tthree\n four five six seven  "
+    spans = list(chunk_spans(text, chunk_size=3, overlap=1))
+    assert [text[s:e] for s, e in spans] == ["one two\tthree", "three\n four five", "five six seven"]
+    assert all(not text[s].isspace() and not text[e - 1].isspace() for s, e in spans)
+
+
+def test_matches_word_chunker_without_redundant_tail():
+    for n in (1, 9, 10, 11, 17, 40):
+        text = " ".join(_words(n, seed=n))
+        old = legacy_chunk_text(text, 10, 3)
+        new = chunk_text(text, 10, 3)
+        # The old loop also emitted a last chunk entirely inside the previous one
+        if len(old) > 1 and len(old[-1].split()) <= 3:
+            old = old[:-1]
+        assert new == old, n
+
+
+def test_no_chunk_is_contained_in_the_previous_one():
+    text = " ".join(_words(21))
+    spans = list(chunk_spans(text, chunk_size=10, overlap=3))
+    assert len(spans) == 3
+    assert spans[-1][1] == len(text)
+    for (_, prev_end), (_, end) in zip(spans, spans[1:]):
+        assert end > prev_end
+
+
+def test_cut_at_sentence_end_in_second_half():
+    text = "a b c d e f. g h i j k l m n o p"
+    spans = list(chunk_spans(text, chunk_size=10, overlap=2))
+    chunks = [text[s:e] for s, e in spans]
+    assert chunks[0] == "a b c d e f."
+    # Overlap is counted from the cut: the next chunk starts 2 words before it
+    assert chunks[1].startswith("e f. g")
+
+
+def test_sentence_end_too_early_or_inside_a_number_is_ignored():
+    assert chunk_text("a. b c d e f g h i j k l", 10, 2)[0] == "a. b c d e f g h i j"
+    assert chunk_text("a b c d e f 3.14 g h i j k l", 10, 2)[0] == "a b c d e f 3.14 g h i"
+
+
+def test_empty_text():
+    assert list(chunk_spans("")) == []
+    assert list(chunk_spans(" \n\t ")) == []
+
+
+def test_counting_iterator_tracks_chunks_per_file():
+    docs = [{"file_path": "a", "chunk_id": i} for i in range(3)] + [{"file_path": "b", "chunk_id": 0}]
+    it = CountingIterator(docs)
+    assert list(it) == docs
+    assert it.count == 4 and it.first == docs[0]
+    assert it.chunks_per_file == {"a": 3, "b": 1}
+
+
+def test_prefetch_keeps_order_and_reraises():
+    assert list(prefetch(range(100), maxsize=4)) == list(range(100))
+
+    def failing():
+        yield 1
+        raise ValueError("boom")
+
+    out = []
+    try:
+        for item in prefetch(failing()):
+            out.append(item)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("producer error was swallowed")
+    assert out == [1]
@@ -0,0 +1,58 @@
+import sys
+from pathlib import Path
+
+# Add the project root to sys.path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.llm.context import estimate_tokens, pack_contexts
+
+DOC = ("Binary search halves the range. It needs sorted input. The middle element is compared first. "
+       "Each step discards half. The search stops when the range is empty.")
+
+
+def hit(source, chunk_id, start=None, end=None, text=None):
+    h = {"source_file": source, "chunk_id": chunk_id, "text": text if text is not None else DOC[start:end]}
+    if start is not None:
+        h.update(start_offset=start, end_offset=end)
+    return h
+
+
+def test_overlapping_offsets_merge_into_one_passage():
+    first, second = hit("a.pdf", 0, 0, 60), hit("a.pdf", 1, 40, len(DOC))
+    # Ranked out of order: the passage cites both, in citation order
+    assert pack_contexts([second, first]) == ["[1][2] a.pdf\n" + DOC]
+
+
+def test_word_overlap_without_offsets():
+    first = hit("a.pdf", 0, text="one two three four")
+    second = hit("a.pdf", 1, text="three four five six")
+    assert pack_contexts([first, second]) == ["[1][2] a.pdf\none two three four five six"]
+
+
+def test_non_adjacent_chunks_and_files_stay_apart():
+    hits = [hit("a.pdf", 0, text="Alpha one."), hit("b.pdf", 1, text="Beta one."), hit("a.pdf", 5, text="Alpha five.")]
+    assert pack_contexts(hits) == ["[1] a.pdf\nAlpha one.", "[2] b.pdf\nBeta one.", "[3] a.pdf\nAlpha five."]
+
+
+def test_sentences_of_better_ranked_passages_are_dropped():
+    hits = [hit("a.pdf", 0, text="It needs sorted input. Binary search halves the range."),
+            hit("b.pdf", 3, text="binary  search halves the range. Hash tables do not."),
+            hit("c.pdf", 0, text="It needs sorted input.")]
+    assert pack_contexts(hits) == ["[1] a.pdf\nIt needs sorted input. Binary search halves the range.",
+                                   "[2] b.pdf\nHash tables do not."]
+
+
+def test_budget_truncates_at_a_sentence_and_stops():
+    long_text = " ".join(f"Sentence number {i} is here." for i in range(200))
+    hits = [hit("a.pdf", 0, text="Short first passage."), hit("b.pdf", 0, text=long_text),
+            hit("c.pdf", 0, text="Never reached.")]
+    passages = pack_contexts(hits, token_budget=200)
+    assert len(passages) == 2
+    assert passages[1].startswith("[2] b.pdf\nSentence number 0 is here.")
+    assert passages[1].endswith("is here.")
+    assert sum(estimate_tokens(p) for p in passages) <= 200
+
+
+def test_tiny_remainder_is_not_added():
+    assert pack_contexts([hit("a.pdf", 0, text="x " * 400)], token_budget=40) == []
+    assert pack_contexts([]) == []
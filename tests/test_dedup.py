@@ -0,0 +1,94 @@
+import random
+import sys
+from pathlib import Path
+
+# Add the project root to sys.path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.ingestion.dedup import NearDuplicateFilter, simhash
+
+TEXT = ("binary search compares the target value to the middle element of a sorted array "
+        "and discards the half in which the target cannot lie")
+OTHER = "a hash table maps keys to buckets through a hash function and resolves collisions by chaining"
+
+
+def doc(file_path, chunk_id, text):
+    return {"file_path": file_path, "source_file": Path(file_path).name, "chunk_id": chunk_id, "text": text}
+
+
+def test_simhash():
+    assert simhash("") == 0
+    assert simhash(TEXT) == simhash("  " + TEXT.upper() + "\n")
+    assert 0 <= simhash(TEXT) < 1 << 64
+    assert bin(simhash(TEXT) ^ simhash(OTHER)).count("1") > 10
+
+
+def test_band_lookup_finds_every_fingerprint_within_max_distance(tmp_path):
+    dedup = NearDuplicateFilter(str(tmp_path / "s.sqlite3"), max_distance=3)
+    rng = random.Random(0)
+    fp = rng.getrandbits(64)
+    dedup._add("kept", fp)
+    for _ in range(200):
+        near = fp
+        for bit in rng.sample(range(64), rng.randint(0, 3)):
+            near ^= 1 << bit
+        assert dedup.find(near, "new") == "kept"
+    far = fp ^ 0b1111  # 4 bits away
+    assert dedup.find(far, "new") is None
+    # A chunk never matches itself
+    assert dedup.find(fp, "kept") is None
+
+
+def test_filter_suppresses_duplicates_of_kept_chunks(tmp_path):
+    dedup = NearDuplicateFilter(str(tmp_path / "s.sqlite3"))
+    docs = [doc("/a.pdf", 0, TEXT), doc("/a.pdf", 1, OTHER), doc("/b.pdf", 0, TEXT)]
+    assert list(dedup.filter(docs)) == docs[:2]
+    assert dedup.suppressed == 1
+    assert dedup.superseded == []
+    dedup.commit()
+    assert dedup.stats() == {"suppressed": 1, "kept_signatures": 2}
+
+
+def test_forget_files_restores_linked_duplicates(tmp_path):
+    path = str(tmp_path / "s.sqlite3")
+    dedup = NearDuplicateFilter(path)
+    list(dedup.filter([doc("/a.pdf", 0, TEXT), doc("/b.pdf", 0, TEXT)]))
+    dedup.commit()
+
+    # Signatures survive a reopen
+    dedup = NearDuplicateFilter(path)
+    assert dedup.forget_files(["/a.pdf"]) == [doc("/b.pdf", 0, TEXT)]
+    assert dedup.stats()["kept_signatures"] == 0
+    # The restored chunk is kept now that its canonical is gone
+    assert list(dedup.filter([doc("/b.pdf", 0, TEXT)])) == [doc("/b.pdf", 0, TEXT)]
+    assert dedup.forget_files(["/a.pdf"]) == []
+
+
+def test_chunk_kept_earlier_and_suppressed_now_is_superseded(tmp_path):
+    path = str(tmp_path / "s.sqlite3")
+    dedup = NearDuplicateFilter(path)
+    list(dedup.filter([doc("/a.pdf", 0, OTHER), doc("/b.pdf", 0, TEXT)]))
+    dedup.commit()
+
+    # Full re-ingest: a.pdf now starts with b.pdf's text, and is seen first
+    dedup = NearDuplicateFilter(path)
+    second = [doc("/a.pdf", 0, TEXT), doc("/b.pdf", 0, TEXT)]
+    assert list(dedup.filter(second)) == [second[1]]
+    assert dedup.superseded == [second[0]]
+    dedup.commit()
+
+    # Only b.pdf is canonical; a.pdf is stored as its duplicate
+    dedup = NearDuplicateFilter(path)
+    assert dedup.stats()["kept_signatures"] == 1
+    assert dedup.forget_files(["/b.pdf"]) == [second[0]]
+
+
+def test_forget_stale_drops_tail_chunks(tmp_path):
+    dedup = NearDuplicateFilter(str(tmp_path / "s.sqlite3"))
+    list(dedup.filter([doc("/a.pdf", 0, OTHER), doc("/a.pdf", 1, TEXT), doc("/b.pdf", 0, TEXT)]))
+    dedup.commit()
+
+    # a.pdf shrank to one chunk: its old chunk 1 is gone, so b.pdf's copy must be indexed
+    assert dedup.forget_stale({"/a.pdf": 1}) == [doc("/b.pdf", 0, TEXT)]
+    assert dedup.stats()["kept_signatures"] == 1
+    assert dedup.forget_stale({"/a.pdf": 1}) == []
@@ -0,0 +1,150 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root to sys.path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.ingestion import drive_ingestor
+from app.ingestion.drive_ingestor import requeue_files, save_manifest, sync_drive_pdfs
+
+FOLDER = "folder"
+
+
+class _Execute:
+    def __init__(self, value):
+        self.value = value
+
+    def execute(self):
+        return self.value
+
+
+class FakeDrive:
+    """In-memory folder plus changes feed, shaped like the googleapiclient service."""
+
+    def __init__(self):
+        self.state = {}
+        self.log = []
+
+    def put(self, fid, md5, parents=(FOLDER,), trashed=False):
+        f = {"id": fid, "name": f"{fid}.pdf", "mimeType": "application/pdf", "parents": list(parents),
+             "md5Checksum": md5, "modifiedTime": md5, "trashed": trashed}
+        self.state[fid] = f
+        self.log.append({"fileId": fid, "removed": False, "file": f})
+
+    def remove(self, fid):
+        del self.state[fid]
+        self.log.append({"fileId": fid, "removed": True})
+
+    # googleapiclient surface used by drive_ingestor
+    def files(self):
+        return self
+
+    def changes(self):
+        return _Changes(self)
+
+    def list(self, q, **params):
+        return _Execute({"files": [f for f in self.state.values()
+                                   if FOLDER in f["parents"] and not f["trashed"]]})
+
+
+class _Changes:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def getStartPageToken(self, **params):
+        return _Execute({"startPageToken": str(len(self.drive.log))})
+
+    def list(self, pageToken, **params):
+        return _Execute({"changes": self.drive.log[int(pageToken):], "newStartPageToken": str(len(self.drive.log))})
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    fake = FakeDrive()
+    broken = set()
+
+    def file_documents(service, f):
+        if f["id"] in broken:
+            raise ValueError("unreadable PDF")
+        return [{"text": f"{f['id']} v{f['md5Checksum']}", "chunk_id": 0, "source_file": f["name"],
+                 "file_path": f"drive://{f['id']}"}]
+
+    monkeypatch.setattr(drive_ingestor, "drive_service", lambda sa_json=None: fake)
+    monkeypatch.setattr(drive_ingestor, "_file_documents", file_documents)
+    fake.broken = broken
+    return fake
+
+
+def _sync(path):
+    sync = sync_drive_pdfs(FOLDER, manifest_file=str(path))
+    docs = [d["text"] for d in sync["documents"]]
+    return sync, sorted(docs)
+
+
+def test_first_sync_lists_folder(drive, tmp_path):
+    drive.put("a", "1")
+    drive.put("b", "1")
+    sync, docs = _sync(tmp_path / "m.json")
+    assert docs == ["a v1", "b v1"]
+    assert sync["stale_file_paths"] == []
+    assert set(sync["manifest"]["files"]) == {"a", "b"}
+
+
+def test_changes_feed_diff(drive, tmp_path):
+    path = tmp_path / "m.json"
+    drive.put("a", "1")
+    drive.put("b", "1")
+    drive.put("c", "1")
+    sync, _ = _sync(path)
+    save_manifest(sync["manifest_path"], sync["manifest"])
+
+    drive.put("a", "2")                      # modified
+    drive.remove("b")                        # deleted
+    drive.put("c", "1")                      # touched, same content
+    drive.put("d", "1")                      # added
+    drive.put("e", "1", parents=("other",))  # outside the folder
+    sync, docs = _sync(path)
+    assert docs == ["a v2", "d v1"]
+    assert sync["stale_file_paths"] == ["drive://a", "drive://b"]
+    assert set(sync["manifest"]["files"]) == {"a", "c", "d"}
+    save_manifest(sync["manifest_path"], sync["manifest"])
+
+    drive.put("d", "1", trashed=True)
+    sync, docs = _sync(path)
+    assert docs == []
+    assert sync["stale_file_paths"] == ["drive://d"]
+    assert set(sync["manifest"]["files"]) == {"a", "c"}
+
+
+def test_failed_download_stays_pending(drive, tmp_path):
+    path = tmp_path / "m.json"
+    drive.put("a", "1")
+    drive.broken.add("a")
+    sync, docs = _sync(path)
+    assert docs == []
+    assert list(sync["manifest"]["pending"]) == ["a"]
+    save_manifest(sync["manifest_path"], sync["manifest"])
+
+    # Not in the changes feed again, but retried from pending
+    drive.broken.clear()
+    sync, docs = _sync(path)
+    assert docs == ["a v1"]
+    assert sync["manifest"]["pending"] == {}
+
+
+def test_requeue_index_failures(drive, tmp_path):
+    path = tmp_path / "m.json"
+    drive.put("a", "1")
+    drive.put("b", "1")
+    sync, _ = _sync(path)
+    assert requeue_files(sync, ["drive://b", "/local/unknown.pdf"]) == 1
+    assert set(sync["manifest"]["files"]) == {"a"}
+    assert list(sync["manifest"]["pending"]) == ["b"]
+    save_manifest(sync["manifest_path"], sync["manifest"])
+
+    sync, docs = _sync(path)
+    assert docs == ["b v1"]
+    assert sync["stale_file_paths"] == []
+    assert set(sync["manifest"]["files"]) == {"a", "b"}
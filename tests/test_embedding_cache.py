@@ -0,0 +1,72 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root to sys.path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.indexing.embedding_cache import EmbeddingCache, open_cache
+
+
+def vec(i):
+    return [float(i), 0.5, -1.0]
+
+
+def test_round_trip_and_stats(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "e.sqlite3"), "m")
+    cache.put_many(["a", "b"], [vec(1), vec(2)])
+    assert cache.get_many(["b", "x", "a"]) == [vec(2), None, vec(1)]
+    assert cache.stats() == {"hits": 2, "misses": 1, "entries": 2}
+    # Existing entries are not overwritten or counted twice
+    cache.put_many(["a"], [vec(9)])
+    assert cache.get_many(["a"]) == [vec(1)]
+    assert cache.stats()["entries"] == 2
+    cache.reset_stats()
+    assert cache.stats() == {"hits": 0, "misses": 0, "entries": 2}
+
+
+def test_keys_depend_on_model(tmp_path):
+    path = str(tmp_path / "e.sqlite3")
+    EmbeddingCache(path, "m").put_many(["a"], [vec(1)])
+    assert EmbeddingCache(path, "other").get_many(["a"]) == [None]
+    assert EmbeddingCache(path, "m").get_many(["a"]) == [vec(1)]
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "e.sqlite3"), "m", max_entries=10)
+    texts = [f"t{i}" for i in range(10)]
+    for i, t in enumerate(texts):
+        cache.put_many([t], [vec(i)])
+    cache.get_many(texts[:3])  # t0..t2 are now the most recent
+    cache.put_many(["new"], [vec(10)])
+
+    # 11 > 10: evicted down to 90%, oldest first
+    assert cache.stats()["entries"] == 9
+    kept = [t for t, v in zip(texts + ["new"], cache.get_many(texts + ["new"])) if v is not None]
+    assert kept == texts[:3] + texts[5:] + ["new"]
+
+
+def test_count_and_clock_survive_reopen(tmp_path):
+    path = str(tmp_path / "e.sqlite3")
+    cache = EmbeddingCache(path, "m", max_entries=3)
+    cache.put_many(["a", "b", "c"], [vec(1), vec(2), vec(3)])
+    cache.get_many(["a"])
+
+    reopened = EmbeddingCache(path, "m", max_entries=3)
+    assert reopened.stats()["entries"] == 3
+    reopened.put_many(["d"], [vec(4)])
+    # b and c are older than the a hit from before the reopen
+    assert reopened.get_many(["a", "b", "c", "d"]) == [vec(1), None, None, vec(4)]
+
+
+def test_open_cache_disabled():
+    assert open_cache("m", path="") is None
+
+
+@pytest.mark.parametrize("n", [0, 1200])
+def test_batches_past_sql_variable_limit(tmp_path, n):
+    cache = EmbeddingCache(str(tmp_path / "e.sqlite3"), "m")
+    texts = [f"t{i}" for i in range(n)]
+    cache.put_many(texts, [vec(i) for i in range(n)])
+    assert cache.get_many(texts) == [vec(i) for i in range(n)]
@@ -0,0 +1,33 @@
+import multiprocessing
+import sys
+import threading
+from pathlib import Path
+
+# Add the project root to sys.path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.indexing.generation import bump_generation, current_generation
+
+
+def _bump(path, n):
+    for _ in range(n):
+        bump_generation(path)
+
+
+def test_bump_and_read(tmp_path):
+    path = str(tmp_path / "sub" / "generation")
+    assert current_generation(path) == 0
+    assert bump_generation(path) == 1
+    assert bump_generation(path) == 2
+    assert current_generation(path) == 2
+
+
+def test_concurrent_bumps_are_never_lost(tmp_path):
+    path = str(tmp_path / "generation")
+    procs = [multiprocessing.Process(target=_bump, args=(path, 10)) for _ in range(4)]
+    threads = [threading.Thread(target=_bump, args=(path, 10)) for _ in range(4)]
+    for worker in procs + threads:
+        worker.start()
+    for worker in procs + threads:
+        worker.join()
+    assert current_generation(path) == 80
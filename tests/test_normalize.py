@@ -0,0 +1,66 @@
+import random
+import re
+import sys
+from pathlib import Path
+
+# Add the project root to sys.path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.ingestion.normalize import DEFAULT_OCR_FIXES, TextNormalizer, _trie_pattern
+
+
+def legacy_clean_text(t: str) -> str:
+    """clean_text before TextNormalizer: one re.sub per fix, then whitespace passes."""
+    for pattern, replacement in list(DEFAULT_OCR_FIXES.items()) + [(r'\s+', ' ')]:
+        t = re.sub(pattern, replacement, t, flags=re.IGNORECASE)
+    t = t.replace("\x00", " ")
+    t = re.sub(r"[ \t]+", " ", t)
+    t = re.sub(r"\n{2,}", "\n", t)
+    return t.strip()
+
+
+WORDS = ("the algorithm compares each element with the target value turn clear modern include learn "
+         "Binar y Se ar c h Algor ithms C omple xit y element s arra y v al u e adjac ent "
+         "uns or t ed s or t ed ELEMENT S Arra Y BINAR Y SE AR C H").split()
+SEPARATORS = [" "] * 10 + ["  ", "\n", "\n\n", "\t", " \x00 ", "\r\n"]
+
+
+def test_matches_legacy_clean_text():
+    rng = random.Random(0)
+    normalize = TextNormalizer()
+    for _ in range(300):
+        text = "".join(rng.choice(WORDS) + rng.choice(SEPARATORS) for _ in range(rng.randint(0, 60)))
+        text = rng.choice(["", "  ", "\n"]) + text
+        assert normalize(text) == legacy_clean_text(text), text
+
+
+def test_fixes_and_whitespace():
+    normalize = TextNormalizer()
+    assert normalize("  BINAR Y SE AR C H\n\nover an\tarra y\x00of v al u es ") == \
+        "Binary Search over an array of values"
+    assert normalize("modern turn") == "modem tum"
+    assert normalize("") == ""
+
+
+def test_longest_literal_wins():
+    # "uns or t ed" and "s or t ed" overlap; the longer fix applies
+    assert TextNormalizer()("uns or t ed list") == "unsorted list"
+    assert TextNormalizer({"ab": "1", "abc": "2", "b": "3"})("abc ab b") == "2 1 3"
+
+
+def test_regex_table_and_empty_table():
+    normalize = TextNormalizer({r"colou?r": "color", r"\bteh\b": "the"})
+    assert normalize("Colour of teh  sky") == "color of the sky"
+    assert TextNormalizer({})("a \x00  b\n") == "a b"
+
+
+def test_trie_pattern():
+    pattern = _trie_pattern(["ab", "ac", "b"])
+    assert pattern == "(?:a(?:b|c)|b)"
+    assert re.fullmatch(_trie_pattern(["a", "ab"]), "ab")
+
+
+def test_from_file(tmp_path):
+    path = tmp_path / "fixes.json"
+    path.write_text('{"teh": "the"}')
+    assert TextNormalizer.from_file(str(path))("teh end") == "the end"
@@ -0,0 +1,82 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add the project root to sys.path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.retrieval import rerank, search
+from app.retrieval.cache import LRUCache
+from app.retrieval.search import normalize_query
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.retrieval.cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(maxsize=4, ttl=10)
+    cache.put("a", 1)
+    now[0] += 9
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_lru_disabled():
+    cache = LRUCache(maxsize=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_normalize_query_case_only_for_uncased_models():
+    assert normalize_query("  Binary\tSEARCH \n", "sentence-transformers/all-MiniLM-L6-v2") == "binary search"
+    assert normalize_query("Binary  SEARCH", "all-MiniLM-L6-v2") == "binary search"
+    assert normalize_query("  Binary\tSEARCH \n", "intfloat/e5-base-v2") == "Binary SEARCH"
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, text, normalize_embeddings=True):
+        self.calls.append(text)
+        return np.full(4, float(len(self.calls)), dtype=np.float32)
+
+
+def test_embed_query_cache(monkeypatch):
+    embedder = CountingEmbedder()
+    monkeypatch.setattr(search, "get_embedder", lambda: embedder)
+    monkeypatch.setattr(search, "query_embeddings", LRUCache(maxsize=8))
+
+    monkeypatch.setattr(search, "MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+    first = search.embed_query("Binary search")
+    assert search.embed_query("binary   SEARCH") == first
+    assert len(embedder.calls) == 1
+
+    # A cased model gets its own entries, one per casing
+    monkeypatch.setattr(search, "MODEL_NAME", "intfloat/e5-base-v2")
+    search.embed_query("Binary search")
+    search.embed_query("binary search")
+    search.embed_query("binary  search")
+    assert len(embedder.calls) == 3
+
+
+def test_rerank_pair_key_case_only_for_uncased_models(monkeypatch):
+    monkeypatch.setattr(rerank, "RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    assert rerank._pair_key("What is  BST?", "t") == rerank._pair_key("what is bst?", "t")
+    monkeypatch.setattr(rerank, "RERANK_MODEL", "BAAI/bge-reranker-base")
+    assert rerank._pair_key("What is  BST?", "t") == rerank._pair_key("What is BST?", "t")
+    assert rerank._pair_key("What is BST?", "t") != rerank._pair_key("what is bst?", "t")
@@ -0,0 +1,91 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root to sys.path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.retrieval import result_cache, search
+from app.retrieval.result_cache import ResultCache
+
+HITS = [{"text": "binary search", "chunk_id": 0, "score": 1.0}]
+
+
+@pytest.fixture
+def generation(monkeypatch):
+    current = [1]
+    monkeypatch.setattr(result_cache, "current_generation", lambda: current[0])
+    return current
+
+
+def _compute(calls, hits=HITS):
+    def compute():
+        calls.append(1)
+        return [dict(h) for h in hits]
+    return compute
+
+
+def test_hit_until_generation_changes(generation):
+    cache = ResultCache(maxsize=8, shared_path="")
+    calls = []
+    assert cache.get_or_compute("hybrid", "binary search", 5, _compute(calls)) == HITS
+    assert cache.get_or_compute("hybrid", "binary  search ", 5, _compute(calls)) == HITS
+    assert len(calls) == 1
+
+    # Different k or kind is a different entry
+    cache.get_or_compute("hybrid", "binary search", 3, _compute(calls))
+    cache.get_or_compute("elser", "binary search", 5, _compute(calls))
+    assert len(calls) == 3
+
+    generation[0] += 1  # an ingest happened
+    cache.get_or_compute("hybrid", "binary search", 5, _compute(calls))
+    assert len(calls) == 4
+
+
+def test_returned_hits_are_copies(generation):
+    cache = ResultCache(maxsize=8, shared_path="")
+    hits = cache.get_or_compute("hybrid", "q", 5, _compute([]))
+    hits[0]["score"] = 0.0
+    assert cache.get_or_compute("hybrid", "q", 5, _compute([]))[0]["score"] == 1.0
+
+
+def test_empty_results_not_cached(generation):
+    cache = ResultCache(maxsize=8, shared_path="")
+    calls = []
+    cache.get_or_compute("hybrid", "q", 5, _compute(calls, hits=[]))
+    cache.get_or_compute("hybrid", "q", 5, _compute(calls, hits=[]))
+    assert len(calls) == 2
+
+
+def test_shared_store_between_workers(generation, tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    worker_a = ResultCache(maxsize=8, shared_path=path)
+    worker_b = ResultCache(maxsize=8, shared_path=path)
+    calls = []
+    worker_a.get_or_compute("hybrid", "q", 5, _compute(calls))
+    assert worker_b.get_or_compute("hybrid", "q", 5, _compute(calls)) == HITS
+    assert len(calls) == 1
+
+    generation[0] += 1
+    worker_b.get_or_compute("hybrid", "q", 5, _compute(calls))
+    assert len(calls) == 2
+    # Writing the new generation dropped the old rows
+    assert worker_a.shared._db.execute("SELECT COUNT(*) FROM results").fetchone()[0] == 1
+
+
+def test_search_bodies_leave_vectors_out(monkeypatch):
+    monkeypatch.setattr(search, "sparse_query", lambda q: [{"rank_feature": {"field": "sparse_embedding.q"}}])
+    bodies = [search._bm25_body("q", 5), search._knn_body([0.0], 5), search._script_score_body([0.0], 5),
+              search._sparse_body("q", 5), search._mlt_body("q", 5)]
+    for body in bodies:
+        assert set(body["_source"]["excludes"]) == {"embedding", "sparse_embedding"}
+
+    # Quantized kNN fetches the float vectors for _rescore, which drops them again
+    monkeypatch.setattr(search, "VECTOR_QUANTIZATION", "int8")
+    assert search._knn_body([0.0], 5)["_source"] == {"excludes": ["sparse_embedding"]}
+    hits = [{"text": "a", "embedding": [1.0, 0.0], "score": 0.5},
+            {"text": "b", "embedding": [0.0, 1.0], "score": 0.9}]
+    rescored = search._rescore(hits, [1.0, 0.0], 2)
+    assert [h["text"] for h in rescored] == ["a", "b"]
+    assert all("embedding" not in h for h in rescored)
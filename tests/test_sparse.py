@@ -0,0 +1,89 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root to sys.path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.indexing.sparse import get_sparse_embedding, sparse_query
+from app.retrieval import search
+
+
+def test_sparse_embedding_weights():
+    weights = get_sparse_embedding("Binary search: search a sorted array. An array!")
+    assert weights == {"binary": 0.5, "search": 1.0, "sorted": 0.5, "array": 1.0}
+    assert get_sparse_embedding("a an of") == {}
+
+
+def test_sparse_query_clauses():
+    clauses = sparse_query("search the sorted search array", max_terms=2)
+    assert clauses[0] == {"rank_feature": {"field": "sparse_embedding.search", "linear": {}, "boost": 1.0}}
+    assert len(clauses) == 2
+    assert clauses[1]["rank_feature"]["boost"] == 0.5
+    assert sparse_query("a b") == []
+
+
+def test_dot_product_of_term_weights():
+    # Linear rank_feature clauses boosted by query weight score sum(q[t] * d[t])
+    doc = get_sparse_embedding("sorted array binary search binary search")
+    score = sum(c["rank_feature"]["boost"] * doc.get(c["rank_feature"]["field"].split(".", 1)[1], 0.0)
+                for c in sparse_query("binary search in a sorted list"))
+    # binary, search, sorted (list is not in the doc)
+    assert score == pytest.approx(1.0 * 1.0 + 1.0 * 1.0 + 1.0 * 0.5)
+
+
+def test_elser_body_falls_back_without_rank_features():
+    assert search._elser_body("binary search", 5, True)["query"]["bool"]["should"] == sparse_query("binary search")
+    assert "more_like_this" in str(search._elser_body("binary search", 5, False))
+    # No sparse terms: more_like_this even on a migrated index
+    assert "more_like_this" in str(search._elser_body("a b", 5, True))
+
+
+class FakeIndices:
+    def __init__(self, kind):
+        self.kind = kind
+        self.calls = 0
+
+    def get_mapping(self, index):
+        self.calls += 1
+        return {index: {"mappings": {"properties": {"sparse_embedding": {"type": self.kind}}}}}
+
+
+class FakeAsyncIndices(FakeIndices):
+    async def get_mapping(self, index):
+        return FakeIndices.get_mapping(self, index)
+
+
+class FakeES:
+    def __init__(self, indices):
+        self.indices = indices
+
+
+def test_rank_features_mapping_cached_per_generation(monkeypatch):
+    generation = [1]
+    indices = FakeIndices("rank_features")
+    monkeypatch.setattr(search, "current_generation", lambda: generation[0])
+    monkeypatch.setattr(search, "get_es", lambda: FakeES(indices))
+    monkeypatch.setattr(search, "_rank_features", (-1, False))
+
+    assert search._sparse_mapped() and search._sparse_mapped()
+    assert indices.calls == 1
+
+    indices.kind = "object"
+    generation[0] = 2
+    assert not search._sparse_mapped()
+    assert indices.calls == 2
+    assert search._rank_features == (2, False)
+
+
+def test_async_rank_features_mapping(monkeypatch):
+    indices = FakeAsyncIndices("rank_features")
+    monkeypatch.setattr(search, "current_generation", lambda: 7)
+    monkeypatch.setattr(search, "get_async_es", lambda: FakeES(indices))
+    monkeypatch.setattr(search, "_rank_features", (-1, False))
+
+    assert asyncio.run(search._asparse_mapped())
+    assert asyncio.run(search._asparse_mapped())
+    assert indices.calls == 1
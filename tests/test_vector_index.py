@@ -0,0 +1,114 @@
+import itertools
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add the project root to sys.path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.indexing import vector_index
+from app.indexing.vector_index import VectorIndex
+
+
+@pytest.fixture(autouse=True)
+def fresh_snapshots(monkeypatch):
+    # A new generation on every read, so searches see the latest writes
+    counter = itertools.count(1)
+    monkeypatch.setattr(vector_index, "current_generation", lambda: next(counter))
+
+
+def unit(*xs):
+    v = np.asarray(xs, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def rows(index):
+    return dict(index._db.execute("SELECT doc_id, row FROM rows"))
+
+
+def free_rows(index):
+    return [r for (r,) in index._db.execute("SELECT row FROM free_rows ORDER BY row")]
+
+
+def test_add_and_search(tmp_path):
+    index = VectorIndex(str(tmp_path), "m")
+    index.add(["a", "b", "c"], ["f1", "f1", "f2"], [unit(1, 0), unit(0, 1), unit(1, 1)])
+    assert len(index) == 3
+    hits = index.search(unit(1, 0.1), k=2)
+    assert [d for d, _ in hits] == ["a", "c"]
+    assert hits[0][1] == pytest.approx((1 + unit(1, 0.1) @ unit(1, 0)) / 2)
+    assert index.search(unit(1, 0), k=0) == []
+
+
+def test_overwrite_keeps_the_row(tmp_path):
+    index = VectorIndex(str(tmp_path), "m")
+    index.add(["a", "b"], ["f", "f"], [unit(1, 0), unit(0, 1)])
+    before = rows(index)
+    index.add(["a"], ["f"], [unit(0, 1)])
+    assert rows(index) == before
+    assert index.search(unit(0, 1), k=2)[0][1] == pytest.approx(1.0)
+    assert index.search(unit(1, 0), k=1)[0][1] == pytest.approx(0.5)
+
+
+def test_delete_and_delete_files(tmp_path):
+    index = VectorIndex(str(tmp_path), "m")
+    index.add(["a", "b", "c"], ["f1", "f1", "f2"], [unit(1, 0), unit(0, 1), unit(1, 1)])
+    assigned = rows(index)
+    assert index.delete(["b", "missing"]) == 1
+    assert index.delete_files(["f2"]) == 1
+    assert [d for d, _ in index.search(unit(0, 1), k=5)] == ["a"]
+    assert free_rows(index) == sorted([assigned["b"], assigned["c"]])
+
+
+def test_freed_rows_are_reused(tmp_path):
+    index = VectorIndex(str(tmp_path), "m")
+    index.add(["a", "b", "c"], ["f", "f", "f"], [unit(1, 0)] * 3)
+    index.delete(["a", "c"])
+    index.add(["d", "e", "f"], ["g", "g", "g"], [unit(0, 1)] * 3)
+    assert sorted(rows(index).values()) == [0, 1, 2, 3]
+    assert free_rows(index) == []
+    assert index._n_rows() == 4
+
+
+def test_instances_on_one_directory_never_share_a_row(tmp_path):
+    first = VectorIndex(str(tmp_path), "m")
+    first.add(["a", "b"], ["f", "f"], [unit(1, 0), unit(0, 1)])
+    second = VectorIndex(str(tmp_path), "m")
+    first.delete(["a"])
+    # Both writers allocate after the delete; only one may get the freed row
+    first.add(["x"], ["f"], [unit(1, 1)])
+    second.add(["y"], ["f"], [unit(1, -1)])
+    assigned = rows(first)
+    assert len(set(assigned.values())) == len(assigned) == 3
+    assert [d for d, _ in second.search(unit(1, 1), k=1)] == ["x"]
+    assert [d for d, _ in first.search(unit(1, -1), k=1)] == ["y"]
+
+
+def test_existing_index_is_seeded_with_its_free_rows(tmp_path):
+    index = VectorIndex(str(tmp_path), "m")
+    index.add(["a", "b", "c"], ["f", "f", "f"], [unit(1, 0)] * 3)
+    # An index written before free_rows existed: row 1 is unused
+    index._db.execute("DELETE FROM rows WHERE doc_id = 'b'")
+    index._db.execute("DROP TABLE free_rows")
+    index._db.close()
+    assert free_rows(VectorIndex(str(tmp_path), "m")) == [1]
+
+
+def test_other_model_or_dim_starts_over(tmp_path):
+    VectorIndex(str(tmp_path), "m").add(["a"], ["f"], [unit(1, 0)])
+    other = VectorIndex(str(tmp_path), "other")
+    assert len(other) == 0 and other.dim is None
+    other.add(["b"], ["f"], [unit(1, 0, 0)])
+    assert other.dim == 3 and len(other) == 1
+
+
+def test_instance_opened_before_the_first_write_keeps_other_writers_rows(tmp_path):
+    # e.g. an API worker started before the first main.py ingest
+    api = VectorIndex(str(tmp_path), "m")
+    VectorIndex(str(tmp_path), "m").add(["a", "b", "c"], ["f", "f", "f"], [unit(1, 0), unit(0, 1), unit(1, 1)])
+    api.add(["d"], ["g"], [unit(1, -1)])
+    assert sorted(rows(api)) == ["a", "b", "c", "d"]
+    assert len(set(rows(api).values())) == 4
+    assert [d for d, _ in api.search(unit(0, 1), k=1)] == ["b"]
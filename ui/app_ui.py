@@ -1,8 +1,23 @@
+import json
 import streamlit as st
 import requests
 
 st.set_page_config(page_title="RAG Assistant", page_icon="🤖", layout="wide")
 
+def sse_events(resp):
+    """Parse a text/event-stream response into (event, data) pairs."""
+    resp.encoding = resp.encoding or "utf-8"
+    event, data = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
 # Header
 col1, col2 = st.columns([3, 1])
 with col1:
@@ -22,14 +37,19 @@ if "messages" not in st.session_state:
 with st.sidebar:
     st.header("⚙️ Settings")
     top_k = st.slider("Number of results", 1, 5, 3)
-    mode = st.radio("Search mode", ["hybrid", "elser"], index=0)
+    mode = st.radio("Search mode", ["hybrid", "elser", "rerank"], index=0)
     if st.button("🗑️ Clear Chat"):
         st.session_state.messages = []
         st.rerun()
 
+# An answer is pending while the last message is the "Thinking..." placeholder
+pending = (st.session_state.messages and
+           st.session_state.messages[-1]["role"] == "assistant" and
+           st.session_state.messages[-1]["content"] == "Thinking...")
+
 # Chat display
 if st.session_state.messages:
-    for message in st.session_state.messages:
+    for message in st.session_state.messages[:-1] if pending else st.session_state.messages:
         with st.chat_message(message["role"]):
             st.write(message['content'])
             if message["role"] == "assistant" and message.get("citations"):
@@ -57,10 +77,7 @@ if question := st.chat_input("Ask a question..."):
     st.rerun()
 
 # Process API call if last message is "Thinking..."
-if (st.session_state.messages and 
-    st.session_state.messages[-1]["role"] == "assistant" and 
-    st.session_state.messages[-1]["content"] == "Thinking..."):
-    
+if pending:
     # Get the last user question
     user_question = None
     for msg in reversed(st.session_state.messages):
@@ -69,23 +86,35 @@ if (st.session_state.messages and
             break
     
     if user_question:
-        try:
-            resp = requests.post(
-                "http://127.0.0.1:8000/query",
-                json={"question": user_question, "top_k": top_k, "mode": mode},
-                timeout=60,
-            )
-            data = resp.json()
-            answer = data.get("answer", "No answer.")
-            citations = data.get("citations", [])
-        except Exception as e:
-            answer = f"Error: {e}"
-            citations = []
+        answer, citations = "", []
+        with st.chat_message("assistant"):
+            placeholder = st.empty()
+            placeholder.write("Thinking...")
+            try:
+                # Tokens are rendered as the API streams them
+                with requests.post(
+                    "http://127.0.0.1:8000/query/stream",
+                    json={"question": user_question, "top_k": top_k, "mode": mode},
+                    stream=True,
+                    timeout=(5, 300),
+                ) as resp:
+                    resp.raise_for_status()
+                    for event, data in sse_events(resp):
+                        if event == "citations":
+                            citations = data.get("citations", [])
+                        elif event == "token":
+                            answer += data.get("text", "")
+                            placeholder.write(answer + "▌")
+                        elif event == "error":
+                            answer += data.get("message", "")
+            except Exception as e:
+                answer = f"Error: {e}"
+            placeholder.write(answer or "No answer.")
         
         # Replace thinking message with answer
         st.session_state.messages[-1] = {
             "role": "assistant", 
-            "content": answer,
+            "content": answer or "No answer.",
             "citations": citations
         }
         